@@ -0,0 +1,81 @@
+"""
+Response cache for idempotent RPC methods.
+
+Methods opt in with the cache_policy decorator, which lists the models their result is built from. Results are cached
+per method, parameters, organization and role of the user, under the versions of those models. Saving or deleting an
+instance of one of the models bumps its version (see alexia.core.cache.watch_model), which invalidates all cached
+results that depend on it. The timeout bounds the staleness of changes that bypass the model signals, like
+QuerySet.update().
+"""
+import hashlib
+import json
+from functools import wraps
+
+from django.conf import settings
+from modernrpc.core import (
+    ENTRY_POINT_KEY, HANDLER_KEY, PROTOCOL_KEY, REQUEST_KEY,
+)
+
+from alexia.api import metrics
+from alexia.api.decorators import is_manager
+from alexia.core import cache
+from alexia.core.cache import model_namespace, versioned_key, watch_model
+
+_MISSING = object()
+
+_CONTEXT_KEYS = (REQUEST_KEY, ENTRY_POINT_KEY, PROTOCOL_KEY, HANDLER_KEY)
+
+
+def get_role(request):
+    """
+    Return the role of the user of the request, as part of the cache key.
+    """
+    if request is None or not request.user.is_authenticated:
+        return 'anonymous'
+    if request.user.is_superuser:
+        return 'superuser'
+    if is_manager(request):
+        return 'manager'
+    return 'user'
+
+
+def cache_policy(models, timeout=300):
+    """
+    Cache the results of an idempotent RPC method.
+
+    Apply below the access check decorators, so access is checked before a cached result is returned.
+
+    :param models: Models the result of the method is built from.
+    :param timeout: Number of seconds a result is cached.
+    """
+    for model in models:
+        watch_model(model)
+    namespaces = [model_namespace(model) for model in models]
+
+    def decorator(f):
+        @wraps(f)
+        def wrap(*args, **kwargs):
+            if not getattr(settings, 'API_CACHE_ENABLED', True):
+                return f(*args, **kwargs)
+
+            request = kwargs.get(REQUEST_KEY)
+            organization = getattr(request, 'organization', None)
+            params = {k: v for k, v in kwargs.items() if k not in _CONTEXT_KEYS}
+            digest = hashlib.sha1(
+                json.dumps([args, params], sort_keys=True, default=str).encode('utf-8')
+            ).hexdigest()
+            prefix = 'api:rpc:%s.%s:%s:%s:%s' % (f.__module__, f.__name__, organization.pk if organization else '-',
+                                                 get_role(request), digest)
+            key = versioned_key(prefix, *namespaces)
+
+            result = cache.get(key, _MISSING)
+            hit = result is not _MISSING
+            if not hit:
+                result = f(*args, **kwargs)
+                cache.set(key, result, timeout)
+
+            metrics.mark_cache(hit)
+            return result
+        wrap.cache_namespaces = namespaces
+        return wrap
+    return decorator
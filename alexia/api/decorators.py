@@ -4,13 +4,22 @@ from django.core.exceptions import PermissionDenied
 from modernrpc.core import REQUEST_KEY
 
 
+def is_manager(request):
+    """
+    Returns if the user of the request is a manager of the current organization.
+
+    The roles of the user are memoized on the user object, so the calls in a batch request share one query.
+    """
+    return request.user.is_superuser or (
+        request.organization is not None and request.user.profile.is_manager(request.organization)
+    )
+
+
 def manager_required(f):
     @wraps(f)
     def wrap(*args, **kwargs):
         request = kwargs.get(REQUEST_KEY)
-        if not request.user.is_authenticated or not request.user.is_superuser and (
-                not request.organization or not request.user.profile.is_manager(request.organization)
-        ):
+        if not request.user.is_authenticated or not is_manager(request):
             raise PermissionDenied
         return f(*args, **kwargs)
     return wrap
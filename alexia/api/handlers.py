@@ -1,13 +1,29 @@
-import json
+import logging
 
+from django.db import transaction
+from modernrpc.conf import settings
+from modernrpc.exceptions import (
+    RPC_INTERNAL_ERROR, RPC_METHOD_NOT_FOUND, RPCException,
+)
 from modernrpc.handlers import JSONRPCHandler
-from modernrpc.handlers.jsonhandler import JsonResult, JsonSuccessResult, JsonErrorResult
+from modernrpc.handlers.jsonhandler import JsonResult, JsonErrorResult
 
+from alexia.api import metrics
+from alexia.api.serializers import get_json_backend
 from alexia.api.v1 import version
 
+logger = logging.getLogger(__name__)
+
+RPC_BATCH_ROLLED_BACK = -32001
+RPC_BATCH_ABORTED = -32002
+
 
 class AlexiaJSONRPCHandler(JSONRPCHandler):
 
+    def __init__(self, entry_point: str):
+        super().__init__(entry_point)
+        self.json_backend = get_json_backend(self.encoder)
+
     # Override content types because older apps send an initialization request with the content type
     # text/plain or even application/x-www-form-urlencoded, so we need to add that to the
     # allowed content types for JSON-RPC. -- albertskja 2025-05-12
@@ -35,7 +51,19 @@ class AlexiaJSONRPCHandler(JSONRPCHandler):
             request_data['jsonrpc'] = "2.0"
             version_overridden = True
 
-        result_data = super().process_single_request(request_data=request_data, context=context)
+        if metrics.enabled():
+            method = request_data.get('method') if isinstance(request_data, dict) else None
+            if not isinstance(method, str):
+                method = metrics.UNKNOWN_METHOD
+            with metrics.registry.measure(method) as measurement:
+                result_data = super().process_single_request(request_data=request_data, context=context)
+                if isinstance(result_data, JsonErrorResult):
+                    measurement.error = True
+                    # Do not create a metric for every name that clients make up
+                    if result_data.code == RPC_METHOD_NOT_FOUND:
+                        measurement.method = metrics.UNKNOWN_METHOD
+        else:
+            result_data = super().process_single_request(request_data=request_data, context=context)
 
         # Put back the version "1.0" if it was previously overridden -- albertskja 2025-05-12
         if version_overridden:
@@ -43,13 +71,90 @@ class AlexiaJSONRPCHandler(JSONRPCHandler):
 
         return result_data
 
+    @staticmethod
+    def is_atomic_batch(request):
+        """
+        Clients opt in to atomic batches with the X-Atomic-Batch header.
+        """
+        return request.headers.get('X-Atomic-Batch', '').lower() in ('1', 'true')
+
+    def process_request(self, request_body, context):
+        if not self.is_atomic_batch(context.request):
+            return super().process_request(request_body, context)
+
+        try:
+            parsed_request = self.parse_request(request_body)
+        except RPCException:
+            # Let the library report the parse error
+            return super().process_request(request_body, context)
+        if not isinstance(parsed_request, list):
+            return super().process_request(request_body, context)
+
+        # Run all calls in one transaction. Processing stops at the first failing call and the changes of all
+        # calls are rolled back; every other call then gets an error that refers to the failing call.
+        results = []
+        failed = False
+        # Notifications have no id, so a failing notification is described instead
+        failed_call = None
+        with transaction.atomic():
+            for request_data in parsed_request:
+                if not failed:
+                    result = self.process_single_request(request_data, context)
+                    if isinstance(result, JsonErrorResult):
+                        failed = True
+                        failed_call = 'a notification' if result.is_notification else 'call %s' % result.request_id
+                        transaction.set_rollback(True)
+                else:
+                    result = JsonErrorResult(RPC_BATCH_ABORTED, 'Not executed, because %s failed' % failed_call)
+                    self._set_jsonrpc_data(result, request_data)
+                results.append(result)
+
+        if failed:
+            for i, result in enumerate(results):
+                if not isinstance(result, JsonErrorResult):
+                    rolled_back = JsonErrorResult(RPC_BATCH_ROLLED_BACK,
+                                                  'Rolled back, because %s failed' % failed_call)
+                    rolled_back.set_jsonrpc_data(result.request_id, result.version, result.is_notification)
+                    results[i] = rolled_back
+
+        dumped_results = [self.dumps_result(result) for result in results if not result.is_notification]
+        return '[%s]' % ', '.join(dumped_results) if dumped_results else ''
+
+    @staticmethod
+    def _set_jsonrpc_data(result, request_data):
+        if isinstance(request_data, dict):
+            jsonrpc_version = request_data.get('jsonrpc')
+            result.set_jsonrpc_data(
+                request_id=request_data.get('id'),
+                version=str(jsonrpc_version) if isinstance(jsonrpc_version, float) else jsonrpc_version,
+                is_notification='id' not in request_data,
+            )
+
     def dumps_result(self, result: JsonResult) -> str:
+        if result.is_notification:
+            return ""
+
         # The old API backend included the "error" attribute set to None, even if the request was successful.
         # Also, it included the "result" attribute set to None, even if the request failed.
         # ModernRPC does not, so we need to add those back to maintain backwards compatibility -- albertskja 2025-05-12
-        result_json = json.loads(super().dumps_result(result))
-        if isinstance(result, JsonSuccessResult) and "error" not in result_json.keys():
-            result_json["error"] = None
-        if isinstance(result, JsonErrorResult) and "result" not in result_json.keys():
-            result_json["result"] = None
-        return json.dumps(result_json)
+        data = {
+            "id": result.request_id,
+            "jsonrpc": result.version,
+            **result.serializable_data(),
+        }
+        data.setdefault("error", None)
+        data.setdefault("result", None)
+
+        try:
+            return self.json_backend.dumps(data)
+        except Exception as exc:
+            # Error on result serialization: serialize an error instead
+            error_msg = f"Unable to serialize result: {exc}"
+            logger.error(error_msg, exc_info=settings.MODERNRPC_LOG_EXCEPTIONS)
+            error_result = JsonErrorResult(RPC_INTERNAL_ERROR, error_msg)
+            return self.json_backend.dumps({
+                "id": result.request_id,
+                "jsonrpc": result.version,
+                **error_result.serializable_data(),
+                "result": None,
+            })
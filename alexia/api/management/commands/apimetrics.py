@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from alexia.api import metrics
+from alexia.core.cache import stats as cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Print the collected API metrics in the Prometheus text format'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the metrics after printing them.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(metrics.registry.render(), ending='')
+        if options['reset']:
+            metrics.registry.reset()
+            cache_stats.reset()
@@ -0,0 +1,65 @@
+import json
+import timeit
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from modernrpc.conf import settings
+from modernrpc.handlers.jsonhandler import JsonSuccessResult
+
+from alexia.api.serializers import BACKENDS, get_json_backend
+
+
+class Command(BaseCommand):
+    help = 'Compare the speed of serializing a large JSON-RPC response with the available JSON backends'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1000, help='Number of orders in the response.')
+        parser.add_argument('--repeat', type=int, default=20, help='Number of times to serialize the response.')
+
+    def handle(self, *args, **options):
+        encoder = import_string(settings.MODERNRPC_JSON_ENCODER)
+        result = JsonSuccessResult(self.get_orders(options['orders']))
+        result.set_jsonrpc_data(request_id='jsonrpc', version='2.0')
+
+        def legacy():
+            # Serialize, parse and serialize again, as the response serialization did before
+            data = json.loads(json.dumps({'id': result.request_id, 'jsonrpc': result.version,
+                                          **result.serializable_data()}, cls=encoder))
+            data['error'] = None
+            return json.dumps(data)
+
+        timings = [('legacy', legacy)]
+        for name in BACKENDS:
+            try:
+                backend = get_json_backend(encoder, name)
+            except ImproperlyConfigured as e:
+                self.stdout.write('Skipping %s: %s' % (name, e))
+                continue
+            timings.append((name, lambda backend=backend: backend.dumps({
+                'id': result.request_id, 'jsonrpc': result.version, **result.serializable_data(), 'error': None,
+            })))
+
+        for name, func in timings:
+            seconds = min(timeit.repeat(func, number=1, repeat=options['repeat']))
+            self.stdout.write('%-8s %8.2f ms' % (name, seconds * 1000))
+
+    @staticmethod
+    def get_orders(count):
+        now = timezone.now()
+        return [{
+            'id': i,
+            'event': {'id': 1, 'name': 'Borrel'},
+            'authorization': {'id': i % 50, 'user': 'user%d' % (i % 50), 'start_date': now, 'end_date': None},
+            'synchronized': False,
+            'placed_at': now - timedelta(minutes=i),
+            'rfid': '02,98:ab:54:%02x' % (i % 256),
+            'amount': Decimal('4.50'),
+            'purchases': [
+                {'product': {'id': 1, 'name': 'Beer'}, 'amount': 3, 'price': Decimal('1.50')},
+                {'product': {'id': 2, 'name': 'Soda'}, 'amount': 2, 'price': Decimal('3.00')},
+            ],
+        } for i in range(count)]
@@ -0,0 +1,177 @@
+"""
+Per-method metrics of the JSON-RPC API.
+
+When API_METRICS_ENABLED is set, every RPC call records its latency, the number and duration of its SQL queries and
+whether it failed. Calls are aggregated in memory and added to the shared counters of alexia.core.counters in the
+background, so the workers of a deployment report combined totals. The totals are exported in the Prometheus text
+format, together with the statistics of alexia.core.cache.
+"""
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+from alexia.core.cache import stats as cache_stats
+from alexia.core.counters import CounterGroup
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+""" Upper bounds of the latency histogram buckets, in seconds. """
+
+FIELDS = ('requests', 'errors', 'latency_us', 'queries', 'query_us', 'cache_hits', 'cache_misses') + \
+    tuple('bucket_%s' % b for b in LATENCY_BUCKETS)
+
+UNKNOWN_METHOD = '<unknown>'
+
+_local = threading.local()
+
+
+def enabled():
+    return getattr(settings, 'API_METRICS_ENABLED', False)
+
+
+def mark_cache(hit):
+    """
+    Record whether the RPC call that is measured in this thread was answered from the response cache.
+    """
+    measurement = getattr(_local, 'measurement', None)
+    if measurement is not None:
+        measurement.cache_hit = hit
+
+
+class Measurement(object):
+    """
+    Metrics of a single RPC call.
+
+    Also acts as database execute wrapper to count the queries of the call and their duration.
+    """
+
+    def __init__(self, method):
+        self.method = method
+        self.error = False
+        self.cache_hit = None
+        self.queries = 0
+        self.query_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.query_time += time.perf_counter() - start
+
+
+class MetricsRegistry(object):
+    def __init__(self, prefix='rpc:'):
+        self.counters = CounterGroup(prefix)
+
+    @contextmanager
+    def measure(self, method):
+        """
+        Measure the RPC call run in the with block and record its metrics.
+        :param method: RPC method name, may be changed on the yielded measurement.
+        :return: Measurement, on which the caller sets whether the call failed.
+        """
+        measurement = Measurement(method)
+        start = time.perf_counter()
+        _local.measurement = measurement
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(measurement))
+                yield measurement
+        finally:
+            _local.measurement = None
+        self.record(measurement.method, time.perf_counter() - start, measurement.queries, measurement.query_time,
+                    measurement.error, measurement.cache_hit)
+
+    def record(self, method, latency, queries, query_time, error=False, cache_hit=None):
+        values = {
+            'requests': 1,
+            'errors': int(error),
+            'latency_us': int(latency * 1000000),
+            'queries': queries,
+            'query_us': int(query_time * 1000000),
+        }
+        if cache_hit is not None:
+            values['cache_hits' if cache_hit else 'cache_misses'] = 1
+        for bucket in LATENCY_BUCKETS:
+            if latency <= bucket:
+                values['bucket_%s' % bucket] = 1
+        # Only buffered in memory, the counters are written in the background
+        self.counters.add({'%s:%s' % (method, field): value for field, value in values.items()})
+
+    def totals(self):
+        """
+        Return the totals of all processes, as dict method -> dict field -> value.
+        """
+        totals = {}
+        for name, value in self.counters.totals().items():
+            method, field = name.rsplit(':', 1)
+            if field in FIELDS:
+                totals.setdefault(method, dict.fromkeys(FIELDS, 0))[field] = value
+        return dict(sorted(totals.items()))
+
+    def reset(self):
+        self.counters.reset()
+
+    def render(self):
+        """
+        Return the totals in the Prometheus text exposition format.
+        """
+        totals = self.totals()
+        lines = []
+
+        def metric(name, metric_type, help_text, rows):
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s %s' % (name, metric_type))
+            lines.extend(rows)
+
+        def label(method, **extra):
+            labels = [('method', method)] + sorted(extra.items())
+            return '{%s}' % ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                                     for k, v in labels)
+
+        metric('alexia_rpc_requests_total', 'counter', 'Number of RPC calls.',
+               ['alexia_rpc_requests_total%s %d' % (label(m), v['requests']) for m, v in totals.items()])
+        metric('alexia_rpc_errors_total', 'counter', 'Number of RPC calls that returned an error.',
+               ['alexia_rpc_errors_total%s %d' % (label(m), v['errors']) for m, v in totals.items()])
+
+        rows = []
+        for method, values in totals.items():
+            for bucket in LATENCY_BUCKETS:
+                rows.append('alexia_rpc_latency_seconds_bucket%s %d'
+                            % (label(method, le=bucket), values['bucket_%s' % bucket]))
+            rows.append('alexia_rpc_latency_seconds_bucket%s %d' % (label(method, le='+Inf'), values['requests']))
+            rows.append('alexia_rpc_latency_seconds_sum%s %.6f' % (label(method), values['latency_us'] / 1000000))
+            rows.append('alexia_rpc_latency_seconds_count%s %d' % (label(method), values['requests']))
+        metric('alexia_rpc_latency_seconds', 'histogram', 'Latency of RPC calls.', rows)
+
+        metric('alexia_rpc_queries_total', 'counter', 'Number of SQL queries run by RPC calls.',
+               ['alexia_rpc_queries_total%s %d' % (label(m), v['queries']) for m, v in totals.items()])
+        metric('alexia_rpc_query_seconds_total', 'counter', 'Time spent in SQL queries by RPC calls.',
+               ['alexia_rpc_query_seconds_total%s %.6f' % (label(m), v['query_us'] / 1000000)
+                for m, v in totals.items()])
+
+        metric('alexia_rpc_cache_hits_total', 'counter', 'Number of RPC calls answered from the response cache.',
+               ['alexia_rpc_cache_hits_total%s %d' % (label(m), v['cache_hits']) for m, v in totals.items()])
+        metric('alexia_rpc_cache_misses_total', 'counter', 'Number of cacheable RPC calls not found in the cache.',
+               ['alexia_rpc_cache_misses_total%s %d' % (label(m), v['cache_misses']) for m, v in totals.items()])
+
+        cache_totals = cache_stats.totals()
+        rows = []
+        for prefix, values in cache_totals.items():
+            for result, field in (('local_hit', 'local_hits'), ('shared_hit', 'shared_hits'), ('miss', 'misses')):
+                rows.append('alexia_cache_requests_total{prefix="%s",result="%s"} %d'
+                            % (prefix, result, values[field]))
+        metric('alexia_cache_requests_total', 'counter', 'Number of cache lookups, by key prefix and result.', rows)
+        metric('alexia_cache_bumps_total', 'counter', 'Number of cache namespace version bumps, by prefix.',
+               ['alexia_cache_bumps_total{prefix="%s"} %d' % (prefix, values['bumps'])
+                for prefix, values in cache_totals.items()])
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
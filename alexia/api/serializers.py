@@ -0,0 +1,53 @@
+"""
+JSON backends used to serialize API responses.
+
+The backend is selected with the API_JSON_BACKEND setting. The default 'json' backend uses the standard library,
+the 'orjson' backend requires the optional orjson package. Both delegate values they cannot serialize the same way
+(Decimal, datetime, lazy strings, ...) to the configured JSON encoder, so their output is equivalent.
+"""
+import json
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+
+class StdlibJSONBackend(object):
+    def __init__(self, encoder):
+        self.encoder = encoder
+
+    def dumps(self, data) -> str:
+        return json.dumps(data, cls=self.encoder)
+
+
+class OrjsonBackend(object):
+    def __init__(self, encoder):
+        try:
+            import orjson
+        except ImportError:
+            raise ImproperlyConfigured('The orjson API JSON backend requires the orjson package.')
+        self._orjson = orjson
+        self._default = encoder().default
+        # Dates and times are formatted by the encoder, which differs from the orjson format.
+        self._option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps(self, data) -> str:
+        return self._orjson.dumps(data, default=self._default, option=self._option).decode('utf-8')
+
+
+BACKENDS = {
+    'json': StdlibJSONBackend,
+    'orjson': OrjsonBackend,
+}
+
+
+def get_json_backend(encoder, name=None):
+    """
+    Return an instance of the configured JSON backend.
+    :param encoder: JSON encoder class for values the backend does not handle itself.
+    :param name: Name of the backend, defaults to the API_JSON_BACKEND setting.
+    """
+    name = name or getattr(settings, 'API_JSON_BACKEND', 'json')
+    try:
+        return BACKENDS[name](encoder)
+    except KeyError:
+        raise ImproperlyConfigured('Unknown API JSON backend %r.' % name)
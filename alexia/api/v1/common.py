@@ -59,11 +59,6 @@ def format_user(user):
 
     :type user: django.contrib.auth.models.User
     """
-    try:
-        user_name = user.authenticationdata_set.get(backend=OIDC_BACKEND_NAME).username
-    except AuthenticationData.DoesNotExist:
-        user_name = None
-
     auth_data = [{
         'backend': u.backend,
         'username': u.username,
@@ -71,7 +66,7 @@ def format_user(user):
 
     return {
         'id': user.id,
-        'radius_username': user_name,
+        'radius_username': next((a['username'] for a in auth_data if a['backend'] == OIDC_BACKEND_NAME), None),
         'first_name': user.first_name,
         'last_name': user.last_name,
         'authentication_data': auth_data,
@@ -79,6 +74,36 @@ def format_user(user):
     }
 
 
+def format_user_values(users):
+    """
+    Format users like format_user, with one query for the authentication data of all users.
+
+    :param users: List of dicts with the id, first_name, last_name and email of users.
+    :return: List of formatted users, in the order of the given list.
+    """
+    auth_data = {}
+    for a in AuthenticationData.objects.filter(user_id__in=[u['id'] for u in users]).order_by('pk') \
+            .values('user_id', 'backend', 'username'):
+        auth_data.setdefault(a['user_id'], []).append({
+            'backend': a['backend'],
+            'username': a['username'],
+        })
+
+    result = []
+    for u in users:
+        user_auth_data = auth_data.get(u['id'], [])
+        result.append({
+            'id': u['id'],
+            'radius_username': next((a['username'] for a in user_auth_data if a['backend'] == OIDC_BACKEND_NAME),
+                                    None),
+            'first_name': u['first_name'],
+            'last_name': u['last_name'],
+            'authentication_data': user_auth_data,
+            'email_address': u['email'],
+        })
+    return result
+
+
 def format_certificate(certificate):
     """
 
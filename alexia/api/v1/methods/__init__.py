@@ -1,5 +1,6 @@
 from .authorization import *  # NOQA
 from .billing import *  # NOQA
+from .changes import *  # NOQA
 from .event import *  # NOQA
 from .generic import *  # NOQA
 from .juliana import *  # NOQA
@@ -5,9 +5,11 @@ from django.db import transaction
 from django.utils import timezone
 from modernrpc.core import rpc_method, REQUEST_KEY
 
+from alexia.api.cache import cache_policy
 from alexia.api.decorators import manager_required
 from alexia.api.exceptions import InvalidParamsError
 from alexia.apps.billing.models import Authorization
+from alexia.apps.organization.models import AuthenticationData
 from alexia.auth.backends import OIDC_BACKEND_NAME
 
 from ..common import format_authorization
@@ -15,6 +17,7 @@ from ..common import format_authorization
 
 @rpc_method(name='authorization.list', entry_point='v1')
 @manager_required
+@cache_policy([Authorization, User, AuthenticationData])
 def authorization_list(radius_username: Optional[str] = None, **kwargs) -> List[Dict]:
     """
     **Signature**: `authorization.list(radius_username)`
@@ -75,6 +78,7 @@ def authorization_list(radius_username: Optional[str] = None, **kwargs) -> List[
 
 @rpc_method(name='authorization.get', entry_point='v1')
 @manager_required
+@cache_policy([Authorization, User, AuthenticationData])
 def authorization_get(radius_username: str, **kwargs) -> List[Dict]:
     """
     **Signature**: `authorization.get(radius_username)`
@@ -2,25 +2,135 @@ from typing import List, Dict, Optional
 
 from django.contrib.auth.models import User
 from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from modernrpc.core import rpc_method, REQUEST_KEY
 
 from alexia.api.decorators import manager_required
 from alexia.api.exceptions import InvalidParamsError, ObjectNotFoundError
-from alexia.apps.billing.models import Order
+from alexia.apps.billing.formats import format_order_values
+from alexia.apps.billing.models import ChangeLogEntry, Order
 from alexia.auth.backends import OIDC_BACKEND_NAME
+from alexia.core.routers import use_replica
 
 from ..common import format_order
 
+ORDER_PAGE_SIZE = 500
+""" Number of orders fetched per query when listing orders. """
+MAX_ORDERS = 1000
+""" Maximum number of orders returned by one call. """
+
+
+def _parse_datetime(value, name):
+    """
+    Parse an optional date/time filter parameter.
+    :param value: ISO 8601 formatted date/time or None.
+    :param name: Name of the parameter, used in the error message.
+    :return: Aware datetime or None.
+    :raises InvalidParamsError: If the value is not a valid date/time.
+    """
+    if value is None:
+        return None
+
+    try:
+        result = parse_datetime(value)
+    except (TypeError, ValueError):
+        result = None
+    if result is None:
+        raise InvalidParamsError('Invalid %s value' % name)
+
+    if timezone.is_naive(result):
+        result = timezone.make_aware(result)
+    return result
+
+
+def _list_orders(orders, after_id, limit, placed_after, placed_before):
+    """
+    Format the orders of a queryset, using keyset pagination.
+
+    The orders are fetched and formatted in pages of ORDER_PAGE_SIZE orders, each page with one query for the
+    orders and one for their purchases. Orders are returned in order of id when a cursor or limit is given, and
+    otherwise newest first like before the lists were paginated. At most MAX_ORDERS orders are returned.
+
+    :param orders: Order queryset.
+    :param after_id: Only return orders with an id greater than this id, or None.
+    :param limit: Maximum number of orders to return, or None for MAX_ORDERS orders.
+    :param placed_after: Only return orders placed at or after this ISO 8601 date/time, or None.
+    :param placed_before: Only return orders placed before this ISO 8601 date/time, or None.
+    :return: List of formatted orders.
+    :raises InvalidParamsError: If a parameter is invalid.
+    """
+    if limit is not None and (not isinstance(limit, int) or isinstance(limit, bool) or limit < 1):
+        raise InvalidParamsError('limit must be a positive number')
+    if limit is not None and limit > MAX_ORDERS:
+        raise InvalidParamsError('limit must be at most %d' % MAX_ORDERS)
+    if after_id is not None and (not isinstance(after_id, int) or isinstance(after_id, bool)):
+        raise InvalidParamsError('after_id must be a number')
+
+    placed_after = _parse_datetime(placed_after, 'placed_after')
+    if placed_after is not None:
+        orders = orders.filter(placed_at__gte=placed_after)
+    placed_before = _parse_datetime(placed_before, 'placed_before')
+    if placed_before is not None:
+        orders = orders.filter(placed_at__lt=placed_before)
+
+    if after_id is None and limit is None:
+        return _list_newest_orders(orders)
+
+    if limit is None:
+        limit = MAX_ORDERS
+    orders = orders.order_by('pk')
+    result = []
+    while len(result) < limit:
+        page_size = min(ORDER_PAGE_SIZE, limit - len(result))
+        page = orders if after_id is None else orders.filter(pk__gt=after_id)
+        page = format_order_values(page[:page_size])
+        result.extend(page)
+        if len(page) < page_size:
+            break
+        after_id = page[-1]['id']
+
+    return result
+
+
+def _list_newest_orders(orders):
+    """
+    Format the newest MAX_ORDERS orders of a queryset, newest first, in pages of ORDER_PAGE_SIZE orders.
+    """
+    orders = orders.order_by('-placed_at', 'pk')
+    result = []
+    after = None
+    while len(result) < MAX_ORDERS:
+        page = orders
+        if after is not None:
+            placed_at, pk = after
+            page = orders.filter(Q(placed_at__lt=placed_at) | Q(placed_at=placed_at, pk__gt=pk))
+        page_size = min(ORDER_PAGE_SIZE, MAX_ORDERS - len(result))
+        page = format_order_values(page[:page_size])
+        result.extend(page)
+        if len(page) < page_size:
+            break
+        after = parse_datetime(page[-1]['placed_at']), page[-1]['id']
+
+    return result
+
 
 @rpc_method(name='order.unsynchronized', entry_point='v1')
 @manager_required
-def order_unsynchronized(unused: int = 0, **kwargs) -> List[Dict]:
+def order_unsynchronized(unused: int = 0, after_id: Optional[int] = None, limit: Optional[int] = None,
+                         placed_after: Optional[str] = None, placed_before: Optional[str] = None,
+                         **kwargs) -> List[Dict]:
     """
-    **Signature**: `order.unsynchronized(unused)`
+    **Signature**: `order.unsynchronized(unused, after_id, limit, placed_after, placed_before)`
 
     **Arguments**:
 
     - `unused` : `int` -- Unused parameter
+    - `after_id` : `int` -- *(optional)* Only return orders with an id greater than this id.
+    - `limit` : `int` -- *(optional)* Maximum number of orders to return, at most 1000. Defaults to 1000.
+    - `placed_after` : `str` -- *(optional)* Only return orders placed at or after this ISO 8601 date/time.
+    - `placed_before` : `str` -- *(optional)* Only return orders placed before this ISO 8601 date/time.
 
     **Return type**: List of `dict`
 
@@ -35,7 +145,9 @@ def order_unsynchronized(unused: int = 0, **kwargs) -> List[Dict]:
     Optionally gets an unused parameter because of a former compatibility issue
     between the jsonrpc server en jsonrpclib client.
 
-    Returns a list of Order objects.
+    Returns a list of Order objects, newest first. When `after_id` or `limit` is given, the orders are ordered by
+    id instead. At most 1000 orders are returned per call. To page through all orders, pass the id of the last
+    returned order as `after_id` of the next call.
 
     **Example return value**:
 
@@ -98,15 +210,8 @@ def order_unsynchronized(unused: int = 0, **kwargs) -> List[Dict]:
         ]
     """
     request = kwargs.get(REQUEST_KEY)
-    result = []
     orders = Order.objects.filter(authorization__organization=request.organization, synchronized=False)
-
-    orders = orders.select_related('authorization__user', 'event')
-
-    for order in orders:
-        result.append(format_order(order))
-
-    return result
+    return _list_orders(orders, after_id, limit, placed_after, placed_before)
 
 
 @rpc_method(name='order.get', entry_point='v1')
@@ -167,7 +272,8 @@ def order_get(order_id: int, **kwargs) -> Dict:
     """
     request = kwargs.get(REQUEST_KEY)
     try:
-        order = Order.objects.get(authorization__organization=request.organization, pk=order_id)
+        order = Order.objects.select_related('event', 'authorization__user', 'rfidcard') \
+            .get(authorization__organization=request.organization, pk=order_id)
     except Order.DoesNotExist:
         raise ObjectNotFoundError
 
@@ -176,13 +282,19 @@ def order_get(order_id: int, **kwargs) -> Dict:
 
 @rpc_method(name='order.list', entry_point='v1')
 @manager_required
-def order_list(radius_username: Optional[str] = None, **kwargs) -> List[Dict]:
+@use_replica()
+def order_list(radius_username: Optional[str] = None, after_id: Optional[int] = None, limit: Optional[int] = None,
+               placed_after: Optional[str] = None, placed_before: Optional[str] = None, **kwargs) -> List[Dict]:
     """
-    **Signature**: `order.list(radius_username)`
+    **Signature**: `order.list(radius_username, after_id, limit, placed_after, placed_before)`
 
     **Arguments**:
 
     - `radius_username` : `str` -- *(optional)* Username to search for.
+    - `after_id` : `int` -- *(optional)* Only return orders with an id greater than this id.
+    - `limit` : `int` -- *(optional)* Maximum number of orders to return, at most 1000. Defaults to 1000.
+    - `placed_after` : `str` -- *(optional)* Only return orders placed at or after this ISO 8601 date/time.
+    - `placed_before` : `str` -- *(optional)* Only return orders placed before this ISO 8601 date/time.
 
     **Return type**: List of `dict`
 
@@ -196,7 +308,9 @@ def order_list(radius_username: Optional[str] = None, **kwargs) -> List[Dict]:
 
     Provide a username to select only orders made by the provided user.
 
-    Returns an array of orders.
+    Returns an array of orders, newest first. When `after_id` or `limit` is given, the orders are ordered by id
+    instead. At most 1000 orders are returned per call. To page through all orders, pass the id of the last
+    returned order as `after_id` of the next call.
 
     **Example return value**:
 
@@ -254,7 +368,6 @@ def order_list(radius_username: Optional[str] = None, **kwargs) -> List[Dict]:
         ]
     """
     request = kwargs.get(REQUEST_KEY)
-    result = []
     orders = Order.objects.filter(event__organizer=request.organization)
 
     if radius_username is not None:
@@ -265,12 +378,7 @@ def order_list(radius_username: Optional[str] = None, **kwargs) -> List[Dict]:
             return []
         orders = orders.filter(authorization__user=user)
 
-    orders = orders.select_related('event', 'authorization')
-
-    for order in orders:
-        result.append(format_order(order))
-
-    return result
+    return _list_orders(orders, after_id, limit, placed_after, placed_before)
 
 
 @rpc_method(name='order.marksynchronized', entry_point='v1')
@@ -301,14 +409,61 @@ def order_marksynchronized(order_id: int, **kwargs) -> bool:
     - `-32602` (Invalid params) if provided order id cannot be found.
     """
     request = kwargs.get(REQUEST_KEY)
-    try:
-        order = Order.objects.select_for_update().get(authorization__organization=request.organization, pk=order_id)
-    except Order.DoesNotExist:
-        raise InvalidParamsError('Order with id not found')
+    orders = Order.objects.filter(authorization__organization=request.organization, pk=order_id)
 
-    if not order.synchronized:
-        order.synchronized = True
-        order.save()
+    if orders.filter(synchronized=False).update(synchronized=True, updated_at=timezone.now()):
+        ChangeLogEntry.log(ChangeLogEntry.ORDER, ChangeLogEntry.SAVED, [order_id], [request.organization.pk])
         return True
-    else:
+    if orders.exists():
         return False
+    raise InvalidParamsError('Order with id not found')
+
+
+@rpc_method(name='order.marksynchronized_many', entry_point='v1')
+@manager_required
+@transaction.atomic
+def order_marksynchronized_many(order_ids: List[int], **kwargs) -> List[int]:
+    """
+    **Signature**: `order.marksynchronized_many(order_ids)`
+
+    **Arguments**:
+
+    - `order_ids` : `list` -- IDs of the Order objects.
+
+    **Return type**: List of `int`
+
+    **Idempotent**: no
+
+    **Required user level**: Manager
+
+    **Documentation**:
+
+    Mark multiple orders as synchronized.
+
+    Returns the ids of the orders that were marked as synchronized. Ids of orders that were already marked as
+    synchronized or that do not belong to the current organization are left out.
+
+    **Example return value**:
+
+        [1254, 1255]
+
+    **Raises errors**:
+
+    - `-32602` (Invalid params) if order_ids is not a list of ids.
+    """
+    request = kwargs.get(REQUEST_KEY)
+    if not isinstance(order_ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in order_ids):
+        raise InvalidParamsError('order_ids must be a list of ids')
+
+    result = []
+    for start in range(0, len(order_ids), ORDER_PAGE_SIZE):
+        # Lock the orders that will change, so the returned ids are exact under concurrent calls
+        ids = list(Order.objects.select_for_update()
+                   .filter(authorization__organization=request.organization, synchronized=False,
+                           pk__in=order_ids[start:start + ORDER_PAGE_SIZE])
+                   .values_list('pk', flat=True))
+        Order.objects.filter(pk__in=ids).update(synchronized=True, updated_at=timezone.now())
+        ChangeLogEntry.log(ChangeLogEntry.ORDER, ChangeLogEntry.SAVED, ids, [request.organization.pk])
+        result.extend(ids)
+
+    return sorted(result)
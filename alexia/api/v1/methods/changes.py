@@ -0,0 +1,97 @@
+from typing import Dict
+
+from django.db.models import Min
+from modernrpc.core import rpc_method, REQUEST_KEY
+
+from alexia.api.decorators import manager_required
+from alexia.api.exceptions import InvalidParamsError
+from alexia.apps.billing.models import ChangeLogEntry
+
+MAX_CHANGES = 1000
+
+
+@rpc_method(name='changes.since', entry_point='v1')
+@manager_required
+def changes_since(cursor: int = 0, limit: int = 100, **kwargs) -> Dict:
+    """
+    **Signature**: `changes.since(cursor, limit)`
+
+    **Arguments**:
+
+    - `cursor` : `int` -- *(optional)* Cursor returned by the previous call, or 0 to start at the oldest change.
+    - `limit` : `int` -- *(optional)* Maximum number of changes to return, at most 1000. Defaults to 100.
+
+    **Return type**: `dict`
+
+    **Idempotent**: yes
+
+    **Required user level**: Manager
+
+    **Documentation**:
+
+    Return the changes to orders, authorizations and RFID cards of the current organization after the given cursor.
+
+    Every change has the type (`order`, `authorization` or `rfidcard`) and id of the changed object, and whether
+    it was saved or deleted. Fetch saved objects with `order.get`, `authorization.list` or `rfid.list`. Pass the
+    returned cursor to the next call; `more` is true if more changes are available right away.
+
+    Changes are kept for a limited time. If the given cursor is older than the oldest kept change, the consumer must
+    do a full synchronization and start again at cursor 0.
+
+    **Example return value**:
+
+        {
+          "cursor": 1044,
+          "more": false,
+          "changes": [
+            {
+              "cursor": 1043,
+              "type": "order",
+              "id": 1255,
+              "action": "saved",
+              "changed_at": "2015-03-11T15:24:06+00:00"
+            },
+            {
+              "cursor": 1044,
+              "type": "rfidcard",
+              "id": 17,
+              "action": "deleted",
+              "changed_at": "2015-03-11T15:25:12+00:00"
+            }
+          ]
+        }
+
+    **Raises errors**:
+
+    - `-32602` (Invalid params) if the limit or cursor is invalid or the cursor has expired.
+    """
+    request = kwargs.get(REQUEST_KEY)
+    if not isinstance(limit, int) or isinstance(limit, bool) or not 1 <= limit <= MAX_CHANGES:
+        raise InvalidParamsError('limit must be between 1 and %d' % MAX_CHANGES)
+    if not isinstance(cursor, int) or isinstance(cursor, bool) or cursor < 0:
+        raise InvalidParamsError('cursor must be a non-negative number')
+
+    if cursor > 0:
+        oldest = ChangeLogEntry.objects.aggregate(oldest=Min('sequence'))['oldest']
+        if oldest is not None and cursor < oldest - 1:
+            raise InvalidParamsError('Cursor has expired')
+
+    entries = list(ChangeLogEntry.objects.filter(
+        organization=request.organization,
+        sequence__gt=cursor,
+    ).order_by('sequence')[:limit + 1])
+
+    more = len(entries) > limit
+    entries = entries[:limit]
+
+    return {
+        'cursor': entries[-1].sequence if entries else cursor,
+        'more': more,
+        'changes': [{
+            'cursor': entry.sequence,
+            'type': entry.model,
+            'id': entry.object_id,
+            'action': entry.action,
+            'changed_at': entry.created_at.isoformat(),
+        } for entry in entries],
+    }
@@ -1,19 +1,26 @@
-from decimal import Decimal
-from typing import Dict, List
+from typing import Dict, List, Optional
 
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import transaction
-from django.db.models import Sum
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from modernrpc.core import rpc_method, REQUEST_KEY
-from modernrpc.exceptions import RPCInternalError
+from modernrpc.exceptions import RPCException
 
 from alexia.api.exceptions import (
     ForbiddenError, InvalidParamsError, ObjectNotFoundError, UnregisteredCardError,
 )
+from alexia.apps.billing.catalog import get_event_bootstrap, get_event_catalog
 from alexia.apps.billing.models import (
-    Authorization, Order, Product, Purchase, RfidCard, WriteoffCategory, WriteOffOrder, WriteOffPurchase
+    Authorization, EventUserSpend, IdempotencyKey, Order, Product,
+    WriteoffCategory, WriteOffOrder,
 )
+from alexia.apps.billing.resolver import card_resolver
+from alexia.apps.organization.agecheck import age_check_client
 from alexia.apps.scheduling.models import Event
+from alexia.auth.grants import is_tender_for_request
 
 from ..common import format_authorization
 from ...decorators import login_required
@@ -65,15 +72,14 @@ def _get_validate_event(request, event_id, safe=False):
     :raises ForbiddenError: If the current user may not access the event.
     """
     try:
-        event = Event.objects.get(pk=event_id)
+        event = Event.objects.select_related('organizer').get(pk=event_id)
     except Event.DoesNotExist:
         if safe:
             raise ObjectNotFoundError('Event does not exist')
         else:
             raise InvalidParamsError('Event does not exist')
 
-    cur_user = request.user
-    if not request.user.is_superuser and not event.is_tender(cur_user):
+    if not request.user.is_superuser and not is_tender_for_request(request, event):
         raise ForbiddenError('Forbidden - You are not a tender for this event')
     if not request.user.is_superuser and not event.can_be_opened():
         raise ForbiddenError('Forbidden - This event is not open')
@@ -81,6 +87,41 @@ def _get_validate_event(request, event_id, safe=False):
     return event
 
 
+def _get_validate_purchases(event, purchases):
+    """
+    Validate the given purchases against the product catalog of the given event.
+    :param event: Event.
+    :param purchases: List of purchases as sent by Juliana.
+    :return: List of (product name, amount, price in cents) tuples.
+    :raises InvalidParamsError: If a product is not available, or an amount or price is invalid.
+    """
+    catalog = get_event_catalog(event)
+    lines = []
+
+    for p in purchases:
+        product = catalog.get(p['product'])
+        if product is None:
+            if not Product.objects.filter(pk=p['product']).exists():
+                raise InvalidParamsError('Product %s not found' % p['product'])
+            raise InvalidParamsError('Product %s is not available for this event' % p['product'])
+        if not product['allowed']:
+            raise InvalidParamsError('Product %s is not available for this event' % p['product'])
+
+        amount = p['amount']
+
+        if amount <= 0:
+            raise InvalidParamsError('Zero or negative amount not allowed')
+
+        price = amount * product['price']
+
+        if price != p['price']:
+            raise InvalidParamsError('Price for product %s is incorrect' % p['product'])
+
+        lines.append((product['name'], amount, price))
+
+    return lines
+
+
 @rpc_method(name='juliana.rfid.get', entry_point='v1')
 @login_required
 def juliana_rfid_get(event_id: int, rfid: Dict, **kwargs) -> Dict:
@@ -94,9 +135,13 @@ def juliana_rfid_get(event_id: int, rfid: Dict, **kwargs) -> Dict:
 
     identifier = rfid_to_identifier(rfid=rfid)
 
-    try:
-        card = RfidCard.objects.get(identifier=identifier, is_active=True)
-    except RfidCard.DoesNotExist:
+    # Start the age check right away, so it overlaps with resolving the card
+    age_check = None
+    if event.organizer.age_check_enabled and getattr(settings, 'AGE_CHECK_PREFETCH', True):
+        age_check = age_check_client.prefetch(event.organizer, identifier)
+
+    card, authorization = card_resolver.resolve(event, identifier)
+    if card is None:
         card_registration_url = None
         if event.organizer.card_registration_url:
             url_parts = list(urlparse.urlparse(event.organizer.card_registration_url))
@@ -108,7 +153,6 @@ def juliana_rfid_get(event_id: int, rfid: Dict, **kwargs) -> Dict:
         raise UnregisteredCardError(message='RFID card not found', card_register_url=card_registration_url)
 
     user = card.user
-    authorization = Authorization.get_for_user_event(user, event)
 
     if not authorization:
         raise ObjectNotFoundError('No authorization found for user')
@@ -123,79 +167,249 @@ def juliana_rfid_get(event_id: int, rfid: Dict, **kwargs) -> Dict:
         'authorization': format_authorization(authorization),
     }
     # If age checking is enabled for this organization, get the check result and add it to the result.
-    if event.organizer.age_check_enabled:
+    if age_check is not None:
+        res['age_check'] = age_check_client.wait(age_check)
+    elif event.organizer.age_check_enabled:
         res['age_check'] = event.organizer.age_check_rfid(identifier)
 
     return res
 
 
+@rpc_method(name='juliana.bootstrap', entry_point='v1')
+@login_required
+def juliana_bootstrap(event_id: int, known_version: Optional[str] = None, **kwargs) -> Dict:
+    """
+    Internal API method for the Point of Sale module.
+
+    Returns the products that may be sold (prices in cents), the write-off categories and the countdown of the
+    event, together with a `version` that changes whenever any of them changes. If `known_version` equals the
+    current version, only the version and `"unchanged": true` are returned, so a kiosk can poll this method cheaply.
+
+        {
+          "version": "5d41402abc4b2a76b9719d911017c592cd2bd4f1",
+          "unchanged": false,
+          "products": [
+            {"id": 1, "name": "Beer", "price": 50, "shortcut": "B", "text_color": "", "background_color": ""}
+          ],
+          "writeoff": true,
+          "writeoff_categories": [{"id": 1, "name": "Spilled", "description": "Spilled drinks", "color": ""}],
+          "countdown": 5
+        }
+    """
+    request = kwargs.get(REQUEST_KEY)
+    event = _get_validate_event(request, event_id, True)
+
+    bootstrap = get_event_bootstrap(event)
+    if known_version == bootstrap['version']:
+        return {'version': bootstrap['version'], 'unchanged': True}
+    return dict(bootstrap, unchanged=False)
+
+
+def _parse_placed_at(event, value):
+    """
+    Parse the time an order was placed at, as sent by Juliana.
+    :param event: Validated event.
+    :param value: ISO 8601 formatted date/time or None for the current time.
+    :return: Aware datetime, never in the future.
+    :raises InvalidParamsError: If the value is not a valid date/time or before the event could be opened.
+    """
+    now = timezone.now()
+    if value is None:
+        return now
+
+    try:
+        placed_at = parse_datetime(value)
+    except (TypeError, ValueError):
+        placed_at = None
+    if placed_at is None:
+        raise InvalidParamsError('Invalid placed_at value')
+
+    if timezone.is_naive(placed_at):
+        placed_at = timezone.make_aware(placed_at)
+    if placed_at < event.opens_at:
+        raise InvalidParamsError('Order placed before the event opened')
+    return min(placed_at, now)
+
+
+def _create_order(request, event, user_id, rfid_data, purchases, **kwargs):
+    """
+    Validate and save a new order for the given event.
+    :param request: Request object.
+    :param event: Validated event.
+    :param user_id: Id of the paying user, or None to use the owner of the RFID card.
+    :param rfid_data: RFID data of the card used to pay.
+    :param purchases: List of purchases as sent by Juliana.
+    :param kwargs: Additional field values for the order.
+    :return: Order
+    :raises InvalidParamsError: If the user, card, authorization or one of the purchases is invalid.
+    """
+    rfid_identifier = rfid_to_identifier(rfid=rfid_data)
+
+    rfidcard, authorization = card_resolver.resolve(event, rfid_identifier)
+
+    if user_id is not None and (rfidcard is None or rfidcard.user_id != user_id):
+        # Paying with the card of someone else, resolve the user separately
+        try:
+            user = User.objects.get(pk=user_id)
+        except User.DoesNotExist:
+            raise InvalidParamsError('User does not exist')
+        authorization = Authorization.get_for_user_event(user, event)
+
+    if rfidcard is None:
+        raise InvalidParamsError('RFID card not found')
+
+    if not authorization:
+        raise InvalidParamsError('No authorization available')
+
+    lines = _get_validate_purchases(event, purchases)
+
+    return Order.create_with_purchases(lines, event=event, authorization=authorization, added_by=request.user,
+                                       rfidcard=rfidcard, **kwargs)
+
+
+def _is_saved(key, event, writeoff=False):
+    """
+    Check if an order with the given idempotency key has already been saved.
+    :param key: Client generated key or None.
+    :param event: Validated event.
+    :param writeoff: True to check for a writeoff order instead of an order.
+    :return: True if an order of this type with this key has been saved for the event.
+    :raises InvalidParamsError: If the key is invalid or has been used for another event or type of order.
+    """
+    if key is None:
+        return False
+    if not isinstance(key, str) or not 0 < len(key) <= 64:
+        raise InvalidParamsError('Invalid key, a key is a string of at most 64 characters')
+
+    saved = IdempotencyKey.objects.filter(key=key).values_list('event_id', 'order_id', 'writeoff_order_id').first()
+    if saved is None:
+        return False
+    saved_event_id, order_id, writeoff_order_id = saved
+    if saved_event_id != event.pk:
+        raise InvalidParamsError('Key has already been used for another event')
+    if (writeoff_order_id if writeoff else order_id) is None:
+        raise InvalidParamsError('Key has already been used for another type of order')
+    return True
+
+
 @rpc_method(name='juliana.order.save', entry_point='v1')
 @login_required
 @transaction.atomic
-def juliana_order_save(event_id: int, user_id: int, purchases: List[Dict], rfid_data: Dict, **kwargs) -> None:
+def juliana_order_save(event_id: int, user_id: int, purchases: List[Dict], rfid_data: Dict, key: Optional[str] = None,
+                       **kwargs) -> None:
     """
     Internal API method for the Point of Sale module.
 
     Saves a new order in the database
 
+    Juliana may send a client generated `key` of at most 64 characters with the order. If an order with the same key
+    has already been saved, the order is not saved again and the original result is returned.
+
     *No documentation available yet.*
     """
     request = kwargs.get(REQUEST_KEY)
     event = _get_validate_event(request, event_id)
 
-    rfid_identifier = rfid_to_identifier(rfid=rfid_data)
+    if _is_saved(key, event):
+        return True
+
+    if key is None:
+        _create_order(request, event, user_id, rfid_data, purchases)
+        return True
 
     try:
-        user = User.objects.get(pk=user_id)
-        rfidcard = RfidCard.objects.get(identifier=rfid_identifier, is_active=True)
-    except User.DoesNotExist:
-        raise InvalidParamsError('User does not exist')
-    except RfidCard.DoesNotExist:
-        raise InvalidParamsError('RFID card not found')
+        with transaction.atomic():
+            order = _create_order(request, event, user_id, rfid_data, purchases)
+            IdempotencyKey.objects.create(key=key, event=event, order=order)
+    except IntegrityError:
+        # A retry of this request may have been saved concurrently, any other error is not a duplicate
+        if not _is_saved(key, event):
+            raise
+    return True
 
-    cur_user = request.user
 
-    authorization = Authorization.get_for_user_event(user, event)
+def _get_saved_order_id(event, saved_event_id, order_id):
+    """
+    Get the id of the order that has been saved with an idempotency key before.
+    :param event: Validated event.
+    :param saved_event_id: Event id saved with the key.
+    :param order_id: Order id saved with the key, None if the key belongs to a writeoff order.
+    :return: Order id.
+    :raises InvalidParamsError: If the key has been used for another event or for a writeoff order.
+    """
+    if saved_event_id != event.pk or order_id is None:
+        raise InvalidParamsError('Key has already been used for another event or for a writeoff order')
+    return order_id
 
-    if not authorization:
-        raise InvalidParamsError('No authorization available')
 
-    order = Order(event=event, authorization=authorization, added_by=cur_user, rfidcard=rfidcard)
-    order.save()
+@rpc_method(name='juliana.order.save_batch', entry_point='v1')
+@login_required
+def juliana_order_save_batch(event_id: int, orders: List[Dict], **kwargs) -> List[Dict]:
+    """
+    Internal API method for the Point of Sale module.
 
-    for p in purchases:
-        try:
-            product = Product.objects.get(pk=p['product'])
-        except Product.DoesNotExist:
-            raise InvalidParamsError('Product %s not found' % p['product'])
-
-        if product.is_permanent:
-            product = product.permanentproduct
-            if product.organization != event.organizer \
-                    or product.productgroup not in event.pricegroup.productgroups.all():
-                raise InvalidParamsError('Product %s is not available for this event' % p['product'])
-        elif product.is_temporary:
-            product = product.temporaryproduct
-            if event != product.event:
-                raise InvalidParamsError('Product %s is not available for this event' % p['product'])
-        else:
-            raise RPCInternalError('Product %s is broken' % p['product'])
+    Saves orders that Juliana queued while it could not reach the server.
 
-        amount = p['amount']
+    Every order is a `dict` with a client generated `key` (at most 64 characters), the `rfid` data of the card, a list
+    of `purchases` and optionally the `user_id` of the paying user (defaults to the owner of the card) and the
+    `placed_at` time in ISO 8601 format, which may not be before the event could be opened. Every order is saved in
+    its own transaction. An order with a key that has been saved before is not saved again, so a queue can safely be
+    sent more than once. A key that has been used for another event or for a writeoff order, or an order that is
+    malformed, results in an error for that order.
 
-        if p['amount'] <= 0:
-            raise InvalidParamsError('Zero or negative amount not allowed')
+    Returns a result for every order, in the same order as the request:
 
-        price = amount * product.get_price(event)
+        [
+          {"key": "3f1c...", "order_id": 1254, "duplicate": false, "error": null},
+          {"key": "9a0b...", "order_id": 1250, "duplicate": true, "error": null},
+          {"key": "c77d...", "order_id": null, "duplicate": false,
+           "error": {"code": -32602, "message": "No authorization available"}}
+        ]
+    """
+    request = kwargs.get(REQUEST_KEY)
+    event = _get_validate_event(request, event_id)
 
-        if price != p['price'] / Decimal(100):
-            raise InvalidParamsError('Price for product %s is incorrect' % p['product'])
+    keys = [data.get('key') if isinstance(data, dict) else None for data in orders]
+    if not all(isinstance(key, str) and 0 < len(key) <= 64 for key in keys):
+        raise InvalidParamsError('Every order requires a key of at most 64 characters')
 
-        purchase = Purchase(order=order, product=product.name, amount=amount, price=price)
-        purchase.save()
+    # Dict key -> (event id, order id) of the keys that have been saved before
+    saved = {key: (saved_event_id, order_id) for key, saved_event_id, order_id in
+             IdempotencyKey.objects.filter(key__in=keys).values_list('key', 'event_id', 'order_id')}
 
-    order.save(force_update=True)  # ensure order.amount is correct
-    return True
+    results = []
+    for key, data in zip(keys, orders):
+        duplicate = key in saved
+        try:
+            if not duplicate:
+                try:
+                    with transaction.atomic():
+                        order = _create_order(request, event, data.get('user_id'), data.get('rfid') or {},
+                                              data.get('purchases') or [],
+                                              placed_at=_parse_placed_at(event, data.get('placed_at')))
+                        IdempotencyKey.objects.create(key=key, event=event, order=order)
+                except IntegrityError:
+                    # The same key may have been saved by a concurrent request, any other error is not a duplicate
+                    saved_key = IdempotencyKey.objects.filter(key=key).values_list('event_id', 'order_id').first()
+                    if saved_key is None:
+                        raise
+                    saved[key] = saved_key
+                    duplicate = True
+                else:
+                    saved[key] = (event.pk, order.pk)
+            order_id = _get_saved_order_id(event, *saved[key])
+        except (ValidationError, ValueError, TypeError, KeyError):
+            # A malformed order must not block the orders queued after it
+            e = InvalidParamsError('Invalid order')
+            results.append({'key': key, 'order_id': None, 'duplicate': False,
+                            'error': {'code': e.code, 'message': e.message}})
+        except RPCException as e:
+            results.append({'key': key, 'order_id': None, 'duplicate': False,
+                            'error': {'code': e.code, 'message': e.message}})
+        else:
+            results.append({'key': key, 'order_id': order_id, 'duplicate': duplicate, 'error': None})
+
+    return results
 
 
 @rpc_method(name='juliana.user.check', entry_point='v1')
@@ -209,72 +423,54 @@ def juliana_user_check(event_id: int, user_id: int, **kwargs) -> int:
     request = kwargs.get(REQUEST_KEY)
     event = _get_validate_event(request, event_id, True)
 
-    try:
-        user = User.objects.get(pk=user_id)
-    except User.DoesNotExist:
-        raise ObjectNotFoundError('User does not exist')
-
-    order_sum = Order.objects \
-        .filter(authorization__in=user.authorizations.all(), event=event) \
-        .aggregate(Sum('amount'))['amount__sum']
+    order_sum = EventUserSpend.objects.filter(event=event, user_id=user_id).values_list('amount', flat=True).first()
 
     if order_sum:
         return int(order_sum * 100)
+    elif not User.objects.filter(pk=user_id).exists():
+        raise ObjectNotFoundError('User does not exist')
     else:
         return 0
 
 @rpc_method(name='juliana.writeoff.save', entry_point='v1')
 @login_required
 @transaction.atomic
-def juliana_writeoff_save(event_id: int, writeoff_id: int, purchases: List[Dict], **kwargs) -> bool:
+def juliana_writeoff_save(event_id: int, writeoff_id: int, purchases: List[Dict], key: Optional[str] = None,
+                          **kwargs) -> bool:
     """
     Internal API method for the Point of Sale module.
 
     Saves a writeoff order in the Database
 
+    Juliana may send a client generated `key` of at most 64 characters with the writeoff order. If a writeoff order
+    with the same key has already been saved, it is not saved again and the original result is returned.
+
     *No documentation available yet.*
     """
     request = kwargs.get(REQUEST_KEY)
     event = _get_validate_event(request, event_id)
 
+    if _is_saved(key, event, writeoff=True):
+        return True
+
     try:
         writeoff_cat = WriteoffCategory.objects.get(id=writeoff_id)
     except WriteoffCategory.DoesNotExist:
         raise InvalidParamsError('Writeoff Category %s not found' % writeoff_id)
 
-    order = WriteOffOrder(event=event, added_by=request.user, writeoff_category=writeoff_cat)
-    order.save()
+    lines = _get_validate_purchases(event, purchases)
 
-    for p in purchases:
-        try:
-            product = Product.objects.get(pk=p['product'])
-        except Product.DoesNotExist:
-            raise InvalidParamsError('Product %s not found' % p['product'])
-
-        if product.is_permanent:
-            product = product.permanentproduct
-            if product.organization != event.organizer \
-                    or product.productgroup not in event.pricegroup.productgroups.all():
-                raise InvalidParamsError('Product %s is not available for this event' % p['product'])
-        elif product.is_temporary:
-            product = product.temporaryproduct
-            if event != product.event:
-                raise InvalidParamsError('Product %s is not available for this event' % p['product'])
-        else:
-            raise RPCInternalError('Product %s is broken' % p['product'])
-
-        amount = p['amount']
-
-        if p['amount'] <= 0:
-            raise InvalidParamsError('Zero or negative amount not allowed')
-
-        price = amount * product.get_price(event)
-
-        if price != p['price'] / Decimal(100):
-            raise InvalidParamsError('Price for product %s is incorrect' % p['product'])
-
-        purchase = WriteOffPurchase(order=order, product=product.name, amount=amount, price=price)
-        purchase.save()
+    if key is None:
+        WriteOffOrder.create_with_purchases(lines, event=event, added_by=request.user, writeoff_category=writeoff_cat)
+        return True
 
-    order.save(force_update=True)  # ensure order.amount is correct
+    try:
+        with transaction.atomic():
+            order = WriteOffOrder.create_with_purchases(lines, event=event, added_by=request.user,
+                                                        writeoff_category=writeoff_cat)
+            IdempotencyKey.objects.create(key=key, event=event, writeoff_order=order)
+    except IntegrityError:
+        # A retry of this request may have been saved concurrently, any other error is not a duplicate
+        if not _is_saved(key, event, writeoff=True):
+            raise
     return True
@@ -2,6 +2,7 @@ from typing import Optional, List
 
 from modernrpc.core import rpc_method, REQUEST_KEY
 
+from alexia.api.cache import cache_policy
 from alexia.api.decorators import login_required
 from alexia.api.exceptions import ObjectNotFoundError
 from alexia.apps.organization.models import Organization
@@ -93,6 +94,7 @@ def organization_current_set(organization: str, **kwargs) -> bool:
 
 @rpc_method(name='organization.list', entry_point='v1')
 @login_required
+@cache_policy([Organization])
 def organization_list(**kwargs) -> List[str]:
     """
     **Signature**: `organization.list()`
@@ -4,9 +4,11 @@ from django.contrib.auth.models import User
 from django.db import transaction
 from modernrpc.core import rpc_method, REQUEST_KEY
 
+from alexia.api.cache import cache_policy
 from alexia.api.decorators import manager_required
 from alexia.api.exceptions import InvalidParamsError
 from alexia.apps.billing.models import RfidCard
+from alexia.apps.organization.models import AuthenticationData
 from alexia.auth.backends import OIDC_BACKEND_NAME
 
 from ..common import format_rfidcard
@@ -14,6 +16,7 @@ from ..common import format_rfidcard
 
 @rpc_method(name='rfid.list', entry_point='v1')
 @manager_required
+@cache_policy([RfidCard, User, AuthenticationData])
 def rfid_list(radius_username: str = None, **kwargs) -> List[Dict]:
     """
     **Signature**: `rfid.list(radius_username)`
@@ -83,6 +86,7 @@ def rfid_list(radius_username: str = None, **kwargs) -> List[Dict]:
 
 @rpc_method(name='rfid.get', entry_point='v1')
 @manager_required
+@cache_policy([RfidCard, User, AuthenticationData])
 def rfid_get(radius_username: str, **kwargs) -> List[str]:
     """
     **Signature**: `rfid.get(radius_username)`
@@ -1,17 +1,21 @@
-from typing import Dict
+from typing import Dict, List, Optional
 
 from django.contrib.auth.models import User
 from django.db import transaction
 from modernrpc.core import rpc_method, REQUEST_KEY
 
+from alexia.api.cache import cache_policy
 from alexia.api.decorators import manager_required, login_required
 from alexia.api.exceptions import InvalidParamsError, ObjectNotFoundError
 from alexia.apps.organization.models import (
     AuthenticationData, Certificate, Membership, Profile,
 )
 from alexia.auth.backends import OIDC_BACKEND_NAME
+from alexia.core.routers import use_replica
 
-from ..common import format_certificate, format_user
+from ..common import format_certificate, format_user, format_user_values
+
+MAX_USERS = 1000
 
 
 @rpc_method(name='user.add', entry_point='v1')
@@ -98,6 +102,7 @@ def user_exists(radius_username: str, **kwargs) -> bool:
 
 @rpc_method(name='user.get', entry_point='v1')
 @login_required
+@cache_policy([User, AuthenticationData])
 def user_get(radius_username: str, **kwargs) -> Dict:
     """
     **Signature**: `user.get(radius_username)`
@@ -141,6 +146,7 @@ def user_get(radius_username: str, **kwargs) -> Dict:
 
 @rpc_method(name='user.get_by_id', entry_point='v1')
 @login_required
+@cache_policy([User, AuthenticationData])
 def user_get_by_id(user_id: int, **kwargs) -> Dict:
     """
     **Signature**: `user.get_by_id(radius_username)`
@@ -179,6 +185,86 @@ def user_get_by_id(user_id: int, **kwargs) -> Dict:
     return format_user(user)
 
 
+@rpc_method(name='user.list', entry_point='v1')
+@manager_required
+@use_replica()
+def user_list(after_id: Optional[int] = None, limit: int = 100, **kwargs) -> List[Dict]:
+    """
+    **Signature**: `user.list(after_id, limit)`
+
+    **Arguments**:
+
+    - `after_id` : `int` -- *(optional)* Only return users with an id greater than this id.
+    - `limit` : `int` -- *(optional)* Maximum number of users to return, at most 1000. Defaults to 100.
+
+    **Return type**: List of `dict`
+
+    **Idempotent**: yes
+
+    **Required user level**: Manager
+
+    **Documentation**:
+
+    Retrieve the members of the current organization, with their membership details.
+
+    Returns an array of users, ordered by id. To page through all members, pass the id of the last
+    returned user as `after_id` of the next call.
+
+    **Example return value**:
+
+        [
+          {
+            "id": 1,
+            "radius_username": "s0000000",
+            "first_name": "John",
+            "last_name": "Doe",
+            "email_address": "j.doe@example.com",
+            "authentication_data": [
+              {"backend": "oidc", "username": "s0000000"}
+            ],
+            "membership": {
+              "comments": "",
+              "is_tender": true,
+              "is_planner": false,
+              "is_manager": false,
+              "is_active": true
+            }
+          }
+        ]
+
+    **Raises errors**:
+
+    - `-32602` (Invalid params) if the limit is invalid.
+    """
+    request = kwargs.get(REQUEST_KEY)
+    if not 1 <= limit <= MAX_USERS:
+        raise InvalidParamsError('limit must be between 1 and %d' % MAX_USERS)
+
+    memberships = Membership.objects.filter(organization=request.organization)
+    if after_id is not None:
+        memberships = memberships.filter(user_id__gt=after_id)
+    memberships = list(memberships.order_by('user_id').values(
+        'user_id', 'user__first_name', 'user__last_name', 'user__email',
+        'comments', 'is_tender', 'is_planner', 'is_manager', 'is_active',
+    )[:limit])
+
+    users = format_user_values([{
+        'id': m['user_id'],
+        'first_name': m['user__first_name'],
+        'last_name': m['user__last_name'],
+        'email': m['user__email'],
+    } for m in memberships])
+    for user, m in zip(users, memberships):
+        user['membership'] = {
+            'comments': m['comments'],
+            'is_tender': m['is_tender'],
+            'is_planner': m['is_planner'],
+            'is_manager': m['is_manager'],
+            'is_active': m['is_active'],
+        }
+    return users
+
+
 @rpc_method(name='user.get_membership', entry_point='v1')
 @manager_required
 def user_get_membership(radius_username: str, **kwargs) -> Dict:
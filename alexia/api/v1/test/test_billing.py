@@ -1,4 +1,16 @@
+import json
+import time
+
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
 from alexia.apps.billing.models import Order
+from alexia.core.routers import (
+    ReplicaRouter, pin_to_primary, use_primary, use_replica,
+)
+from alexia.middleware.replica import SESSION_KEY
 from alexia.test import APITestCase
 
 from ..common import format_order
@@ -50,6 +62,92 @@ class BillingTest(APITestCase):
 
         self.send_and_compare_request('order.unsynchronized', [0], expected_result)
 
+    def test_order_unsynchronized_paginated(self):
+        # Load data
+        self.load_billing_data()
+        self.load_scheduling_data()
+        self.load_billing_order_data()
+
+        order1, order2 = self.data['order1'], self.data['order2']
+
+        self.send_and_compare_request('order.unsynchronized', [0, None, 1], [format_order(order1)])
+        self.send_and_compare_request('order.unsynchronized', [0, order1.id, 1], [format_order(order2)])
+        self.send_and_compare_request('order.unsynchronized', [0, order2.id, 1], [])
+
+        self.send_and_compare_request_error('order.unsynchronized', [0, None, 0], error_code=-32602,
+                                            error_message='limit must be a positive number')
+        self.send_and_compare_request_error('order.unsynchronized', [0, None, '1'], error_code=-32602,
+                                            error_message='limit must be a positive number')
+        self.send_and_compare_request_error('order.unsynchronized', [0, None, 1001], error_code=-32602,
+                                            error_message='limit must be at most 1000')
+
+    def test_order_unsynchronized_newest_first(self):
+        # Load data
+        self.load_billing_data()
+        self.load_scheduling_data()
+        self.load_billing_order_data()
+
+        self.data['order2'].placed_at = self.data['datetime3']
+        self.data['order2'].save()
+
+        # Calls without a cursor or limit return the newest orders first
+        self.send_and_compare_request('order.unsynchronized', [0],
+                                      [format_order(self.data['order2']), format_order(self.data['order1'])])
+        self.send_and_compare_request('order.unsynchronized', [0, None, 10],
+                                      [format_order(self.data['order1']), format_order(self.data['order2'])])
+
+    def test_order_unsynchronized_placed_at(self):
+        # Load data
+        self.load_billing_data()
+        self.load_scheduling_data()
+        self.load_billing_order_data()
+
+        self.data['order2'].placed_at = self.data['datetime3']
+        self.data['order2'].save()
+
+        self.send_and_compare_request('order.unsynchronized', [0, None, None, self.data['datetime3_string']],
+                                      [format_order(self.data['order2'])])
+        self.send_and_compare_request('order.unsynchronized', [0, None, None, None, self.data['datetime3_string']],
+                                      [format_order(self.data['order1'])])
+        self.send_and_compare_request_error('order.unsynchronized', [0, None, None, 'yesterday'], error_code=-32602,
+                                            error_message='Invalid placed_after value')
+
+    def test_order_list(self):
+        # Load data
+        self.load_billing_data()
+        self.load_scheduling_data()
+        self.load_billing_order_data()
+
+        self.data['order1'].synchronized = True
+        self.data['order1'].save()
+
+        expected_result = [
+            format_order(self.data['order1']),
+            format_order(self.data['order2']),
+        ]
+        self.send_and_compare_request('order.list', [], expected_result)
+        self.send_and_compare_request('order.list', [None, self.data['order1'].id], expected_result[1:])
+        self.send_and_compare_request('order.list', [self.data['user1'].username], expected_result)
+        self.send_and_compare_request('order.list', ['unknown'], [])
+
+    def test_order_list_queries(self):
+        # Load data
+        self.load_billing_data()
+        self.load_scheduling_data()
+        self.load_billing_order_data()
+
+        # Load the current organization into its cache
+        self.send_request('organization.current.get', [])
+        with CaptureQueriesContext(connection) as queries:
+            self.send_request('order.list', [])
+        count = len(queries)
+
+        for _ in range(5):
+            self.load_billing_order_data()
+        with CaptureQueriesContext(connection) as queries:
+            self.send_request('order.list', [])
+        self.assertEqual(len(queries), count)
+
     def test_order_marksynchronized(self):
         # Load data
         self.load_billing_data()
@@ -84,3 +182,133 @@ class BillingTest(APITestCase):
                                             error_code=-32602,
                                             error_message='Order with id not found',
                                             )
+
+    def test_order_marksynchronized_many(self):
+        # Load data
+        self.load_billing_data()
+        self.load_scheduling_data()
+        self.load_billing_order_data()
+
+        order1, order2 = self.data['order1'], self.data['order2']
+        order1.synchronized = True
+        order1.save()
+        amount = Order.objects.get(pk=order2.pk).amount
+
+        self.send_and_compare_request('order.marksynchronized_many', [[order1.id, order2.id, order2.id * 10]],
+                                      [order2.id])
+        self.assertTrue(Order.objects.get(pk=order2.pk).synchronized)
+        self.assertEqual(Order.objects.get(pk=order2.pk).amount, amount)
+
+        self.send_and_compare_request('order.marksynchronized_many', [[order1.id, order2.id]], [])
+        self.send_and_compare_request_error('order.marksynchronized_many', [['a']], error_code=-32602,
+                                            error_message='order_ids must be a list of ids')
+
+    def test_order_marksynchronized_other_organization(self):
+        # Load data
+        self.load_billing_data()
+        self.load_scheduling_data()
+        self.load_billing_order_data()
+
+        self.login(username=self.data['user1'].username, password=self.data['password1'],
+                   organization_slug=self.data['organization2'].slug)
+
+        self.send_and_compare_request('order.marksynchronized_many', [[self.data['order1'].id]], [])
+        self.send_and_compare_request_error('order.marksynchronized', [self.data['order1'].id], error_code=-32602,
+                                            error_message='Order with id not found')
+        self.assertFalse(Order.objects.filter(synchronized=True).exists())
+
+    def test_order_marksynchronized_batch(self):
+        # Load data
+        self.load_billing_data()
+        self.load_scheduling_data()
+        self.load_billing_order_data()
+
+        # Login a manager that is not a superuser
+        self.data['user1'].is_superuser = False
+        self.data['user1'].save()
+        self.data['organization1'].membership_set.create(user=self.data['user1'], is_manager=True)
+
+        calls = [('order.marksynchronized', [self.data['order1'].id]),
+                 ('order.marksynchronized', [self.data['order2'].id])]
+        with CaptureQueriesContext(connection) as queries:
+            result = self.send_batch_request(calls)
+
+        self.assertEqual([r['result'] for r in result], [True, True])
+        self.assertEqual(Order.objects.filter(synchronized=True).count(), 2)
+        # The manager check is done once for the whole batch
+        self.assertEqual(len([q for q in queries if 'organization_membership' in q['sql']]), 1)
+
+    def test_order_marksynchronized_batch_atomic(self):
+        # Load data
+        self.load_billing_data()
+        self.load_scheduling_data()
+        self.load_billing_order_data()
+
+        calls = [('order.marksynchronized', [self.data['order1'].id]),
+                 ('order.marksynchronized', [self.data['order1'].id * 10]),
+                 ('order.marksynchronized', [self.data['order2'].id])]
+        result = self.send_batch_request(calls, atomic=True)
+
+        self.assertEqual([r['error']['code'] for r in result], [-32001, -32602, -32002])
+        self.assertEqual([r['id'] for r in result], [0, 1, 2])
+        self.assertFalse(Order.objects.filter(synchronized=True).exists())
+
+        calls.pop(1)
+        result = self.send_batch_request(calls, atomic=True)
+        self.assertEqual([r['result'] for r in result], [True, True])
+        self.assertEqual(Order.objects.filter(synchronized=True).count(), 2)
+
+    def test_order_marksynchronized_batch_atomic_notification(self):
+        # Load data
+        self.load_billing_data()
+        self.load_scheduling_data()
+        self.load_billing_order_data()
+
+        # The failing call is a notification, which has no id
+        req = [
+            {'jsonrpc': '2.0', 'id': 0, 'method': 'order.marksynchronized', 'params': [self.data['order1'].id]},
+            {'jsonrpc': '2.0', 'method': 'order.marksynchronized', 'params': [self.data['order1'].id * 10]},
+            {'jsonrpc': '2.0', 'id': 2, 'method': 'order.marksynchronized', 'params': [self.data['order2'].id]},
+        ]
+        response = self.client.post(reverse('jsonrpc_mountpoint'), json.dumps(req), content_type='application/json',
+                                    HTTP_X_ATOMIC_BATCH='1')
+        result = json.loads(response.content.decode())
+
+        self.assertEqual([(r['id'], r['error']['code']) for r in result], [(0, -32001), (2, -32002)])
+        self.assertEqual(result[0]['error']['message'], 'Rolled back, because a notification failed')
+        self.assertFalse(Order.objects.filter(synchronized=True).exists())
+
+
+class ReplicaTest(APITestCase):
+    def test_router(self):
+        router = ReplicaRouter()
+        with use_replica():
+            self.assertIsNone(router.db_for_read(Order))
+
+        # The default alias stands in for a replica, so all queries keep working
+        with override_settings(DATABASE_REPLICA_ALIAS='default'):
+            self.assertIsNone(router.db_for_read(Order))
+            with use_replica():
+                self.assertEqual(router.db_for_read(Order), 'default')
+                self.assertIsNone(router.db_for_write(Order))
+                with use_primary():
+                    self.assertIsNone(router.db_for_read(Order))
+                self.assertEqual(router.db_for_read(Order), 'default')
+
+                pin_to_primary()
+                try:
+                    self.assertIsNone(router.db_for_read(Order))
+                finally:
+                    pin_to_primary(False)
+
+    @override_settings(DATABASE_REPLICA_ALIAS='default')
+    def test_pin_after_write(self):
+        self.load_billing_data()
+        self.load_scheduling_data()
+        self.load_billing_order_data()
+
+        self.send_request('order.list', [])
+        self.assertNotIn(SESSION_KEY, self.client.session)
+
+        self.send_request('order.marksynchronized', [self.data['order1'].id])
+        self.assertGreater(self.client.session[SESSION_KEY], time.time())
@@ -0,0 +1,116 @@
+import threading
+
+from django.core.cache import caches
+from django.db import IntegrityError, connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from alexia.api import metrics
+from alexia.apps.general.models import CacheVersion
+from alexia.core import cache
+from alexia.core.cache import LocalCache
+from alexia.test import TestCase
+
+
+class CacheTest(TestCase):
+    def test_local_tier(self):
+        cache.set('test:key', {'value': 1})
+        caches['default'].delete('test:key')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(cache.get('test:key'), {'value': 1})
+        self.assertEqual(len(queries), 0)
+
+    def test_shared_tier(self):
+        cache.set('test:key', {'value': 1})
+        # Another worker does not have the value in its local tier
+        cache._values.clear()
+        self.assertEqual(cache.get('test:key'), {'value': 1})
+        self.assertIsNone(cache.get('test:unknown'))
+
+    def test_get_or_set(self):
+        calls = []
+
+        def load():
+            calls.append(1)
+            return None
+
+        self.assertIsNone(cache.get_or_set('test:key', load))
+        self.assertIsNone(cache.get_or_set('test:key', load))
+        self.assertEqual(len(calls), 1)
+
+    def test_lru(self):
+        local = LocalCache(max_size=2)
+        local.set('a', 1, 60)
+        local.set('b', 2, 60)
+        local.get('a')
+        local.set('c', 3, 60)
+        self.assertEqual((local.get('a'), local.get('b'), local.get('c')), (1, None, 3))
+
+    def test_versions(self):
+        key = cache.versioned_key('test:key', 'test:a', 'test:b')
+        self.assertEqual(key, 'test:key:0:0')
+
+        cache.bump_version('test:a')
+        self.assertNotEqual(cache.versioned_key('test:key', 'test:a', 'test:b'), key)
+        self.assertEqual(CacheVersion.objects.get(namespace='test:a').version, cache.get_versions('test:a')[0])
+
+        # Versions known in this process do not cost queries
+        with CaptureQueriesContext(connection) as queries:
+            cache.get_versions('test:a', 'test:b')
+        self.assertEqual(len(queries), 0)
+
+    @override_settings(CACHE_VERSION_TTL=60)
+    def test_bump_in_transaction(self):
+        old = cache.get_versions('test:a')[0]
+
+        def get_version_in_thread():
+            versions = []
+            thread = threading.Thread(target=lambda: versions.extend(cache.get_versions('test:a')))
+            thread.start()
+            thread.join()
+            return versions[0]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cache.bump_version('test:a')
+            new = cache.get_versions('test:a')[0]
+            self.assertNotEqual(new, old)
+            # Other threads keep using the old version until the transaction commits
+            self.assertEqual(get_version_in_thread(), old)
+        self.assertEqual(get_version_in_thread(), new)
+
+    def test_bump_rolled_back(self):
+        old = cache.get_versions('test:a')[0]
+        try:
+            with transaction.atomic():
+                cache.bump_version('test:a')
+                raise IntegrityError
+        except IntegrityError:
+            pass
+        self.assertEqual(cache.get_versions('test:a')[0], old)
+
+    def test_other_worker_bump(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            cache.bump_version('test:a')
+        key = cache.versioned_key('test:key', 'test:a')
+        cache.set(key, 'old')
+
+        # Another worker bumps the version, this worker reads it once its known versions expire
+        CacheVersion.objects.filter(namespace='test:a').update(version=12345)
+        cache._versions.clear()
+        with CaptureQueriesContext(connection) as queries:
+            key = cache.versioned_key('test:key', 'test:a')
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(key, 'test:key:12345')
+        self.assertIsNone(cache.get(key))
+
+    @override_settings(CACHE_STATS_ENABLED=True)
+    def test_stats(self):
+        cache.stats.reset()
+        cache.set('test:key', 1)
+        cache.get('test:key')
+        cache.get('test:unknown')
+        cache.bump_version('test:a')
+
+        totals = cache.stats.totals()['test']
+        self.assertEqual(totals, {'local_hits': 1, 'shared_hits': 0, 'misses': 1, 'bumps': 1})
+        self.assertIn('alexia_cache_requests_total{prefix="test",result="local_hit"} 1', metrics.registry.render())
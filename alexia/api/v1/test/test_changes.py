@@ -0,0 +1,122 @@
+import datetime
+import io
+import json
+
+from django.core.management import call_command
+from django.utils import timezone
+
+from alexia.apps.billing.models import ChangeLogEntry, RfidCard
+from alexia.test import APITestCase
+
+
+class ChangesTest(APITestCase):
+    def setUp(self):
+        super(ChangesTest, self).setUp()
+        with self.commit():
+            self.load_billing_data()
+            self.load_scheduling_data()
+            self.load_billing_order_data()
+
+    def commit(self):
+        # Sequences are assigned when the writing transaction commits
+        return self.captureOnCommitCallbacks(execute=True)
+
+    def get_changes(self, cursor=0, limit=100):
+        response = self.send_request('changes.since', [cursor, limit])
+        return json.loads(response.content.decode())['result']
+
+    def summarize(self, changes):
+        return [(c['type'], c['id'], c['action']) for c in changes['changes']]
+
+    def test_since(self):
+        order1, order2 = self.data['order1'], self.data['order2']
+        order1_pk = order1.pk
+
+        changes = self.get_changes()
+        self.assertEqual(self.summarize(changes)[0],
+                         ('authorization', self.data['authorization1'].pk, 'saved'))
+        self.assertIn(('order', order2.pk, 'saved'), self.summarize(changes))
+        self.assertFalse(changes['more'])
+
+        cursor = changes['cursor']
+        self.assertEqual(self.get_changes(cursor), {'cursor': cursor, 'more': False, 'changes': []})
+
+        with self.commit():
+            self.send_request('order.marksynchronized_many', [[order1.pk, order2.pk]])
+        with self.commit():
+            order1.delete()
+
+        changes = self.get_changes(cursor, 2)
+        self.assertEqual(self.summarize(changes), [('order', order1_pk, 'saved'), ('order', order2.pk, 'saved')])
+        self.assertTrue(changes['more'])
+
+        changes = self.get_changes(changes['cursor'], 2)
+        self.assertEqual(self.summarize(changes), [('order', order1_pk, 'deleted')])
+        self.assertFalse(changes['more'])
+
+    def test_late_commit(self):
+        last = ChangeLogEntry.objects.order_by('pk').last()
+        ChangeLogEntry.objects.create(pk=last.pk + 10, organization=self.data['organization1'],
+                                      model=ChangeLogEntry.ORDER, object_id=1, action=ChangeLogEntry.SAVED)
+        ChangeLogEntry.assign_sequences()
+        cursor = self.get_changes()['cursor']
+
+        # A transaction that got a lower id commits after the changes were read
+        ChangeLogEntry.objects.create(pk=last.pk + 5, organization=self.data['organization1'],
+                                      model=ChangeLogEntry.ORDER, object_id=2, action=ChangeLogEntry.SAVED)
+        # Changes are not visible before they have a sequence
+        self.assertEqual(self.get_changes(cursor)['changes'], [])
+        ChangeLogEntry.assign_sequences()
+        self.assertEqual(self.summarize(self.get_changes(cursor)), [('order', 2, 'saved')])
+
+    def test_poll_does_not_lock(self):
+        self.data['order1'].save()
+        # Polling only reads, the sequences are assigned by the writer or the prunechanges command
+        with self.assertNumQueries(4):
+            self.get_changes()
+        self.assertTrue(ChangeLogEntry.objects.filter(sequence__isnull=True).exists())
+
+        call_command('prunechanges', stdout=io.StringIO())
+        self.assertFalse(ChangeLogEntry.objects.filter(sequence__isnull=True).exists())
+
+    def test_rfidcard(self):
+        card = RfidCard(identifier='02,98:ab:54:ef', user=self.data['user1'])
+        with self.commit():
+            card.save()
+        cursor = self.get_changes()['cursor']
+
+        with self.commit():
+            card.managed_by.add(self.data['organization1'], self.data['organization2'])
+            card.is_active = True
+            card.save()
+            card.managed_by.remove(self.data['organization1'])
+        changes = self.get_changes(cursor)
+        self.assertEqual(self.summarize(changes), [
+            ('rfidcard', card.pk, 'saved'), ('rfidcard', card.pk, 'saved'), ('rfidcard', card.pk, 'deleted'),
+        ])
+
+        # Changes of organization 2 are not visible to organization 1
+        cursor = changes['cursor']
+        with self.commit():
+            card.delete()
+        self.assertEqual(self.get_changes(cursor)['changes'], [])
+        self.assertEqual(ChangeLogEntry.objects.filter(organization=self.data['organization2']).last().action,
+                         ChangeLogEntry.DELETED)
+
+    def test_invalid(self):
+        self.send_and_compare_request_error('changes.since', [0, 0], error_code=-32602,
+                                            error_message='limit must be between 1 and 1000')
+        self.send_and_compare_request_error('changes.since', [0, '10'], error_code=-32602,
+                                            error_message='limit must be between 1 and 1000')
+        self.send_and_compare_request_error('changes.since', ['0', 10], error_code=-32602,
+                                            error_message='cursor must be a non-negative number')
+
+        cursor = self.get_changes()['cursor']
+        ChangeLogEntry.objects.update(created_at=timezone.now() - datetime.timedelta(days=31))
+        self.data['order1'].save()
+        call_command('prunechanges', stdout=io.StringIO())
+
+        self.assertEqual(ChangeLogEntry.objects.count(), 1)
+        self.send_and_compare_request_error('changes.since', [1, 100], error_code=-32602,
+                                            error_message='Cursor has expired')
+        self.assertEqual(len(self.get_changes(cursor)['changes']), 1)
@@ -2,6 +2,7 @@ import datetime
 
 from django.utils import timezone
 
+from alexia.apps.billing.formats import format_order_values
 from alexia.apps.billing.models import (
     Authorization, Order, PermanentProduct, PriceGroup, ProductGroup, Purchase,
     TemporaryProduct,
@@ -127,3 +128,4 @@ class CommonTest(TestCase):
         }
 
         self.convertAndAssertJSONEqual(format_order(order), order_json)
+        self.convertAndAssertJSONEqual(format_order_values(Order.objects.filter(pk=order.pk)), [order_json])
@@ -0,0 +1,128 @@
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from alexia.apps.billing.models import EventBillingSummary
+from alexia.apps.scheduling.models import BartenderAvailability, Event
+from alexia.test import APITestCase
+
+
+class ConditionalGetTest(APITestCase):
+    def setUp(self):
+        super(ConditionalGetTest, self).setUp()
+        self.load_billing_data()
+        self.load_scheduling_data()
+        self.load_billing_order_data()
+        self.data['event1'].location.add(self.data['location1'])
+
+    def get_conditional(self, url, **extra):
+        # The first page sets the CSRF cookie, which is part of the ETag
+        self.client.get(url, **extra)
+        response = self.client.get(url, **extra)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        return response, self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'], **extra)
+
+    @override_settings(CACHE_VERSION_TTL=60)
+    def test_not_modified(self):
+        url = reverse('month-orders', args=[2014, 9])
+        response, response_again = self.get_conditional(url)
+        self.assertEqual(response_again.status_code, 304)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        # Only the session, the user and the stamps are loaded, the page is not rendered
+        self.assertEqual(len(queries), 3, [q['sql'] for q in queries])
+
+    def test_modified(self):
+        url = reverse('month-orders', args=[2014, 9])
+        response = self.get_conditional(url)[0]
+
+        self.data['event1'].name = 'Test event 1 renamed'
+        self.data['event1'].save()
+        response_changed = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertContains(response_changed, 'Test event 1 renamed')
+        self.assertNotEqual(response_changed['ETag'], response['ETag'])
+
+        # Write-off orders change the billing summary of the event with QuerySet.update()
+        with self.captureOnCommitCallbacks(execute=True):
+            EventBillingSummary.add_writeoff_order(self.data['order1'])
+        response_order = self.client.get(url, HTTP_IF_NONE_MATCH=response_changed['ETag'])
+        self.assertEqual(response_order.status_code, 200)
+
+    def test_deleted(self):
+        event = Event.objects.create(organizer=self.data['organization1'], name='Test event 2',
+                                     starts_at=self.data['datetime3'], ends_at=self.data['datetime3'], kegs=0)
+        url = reverse('year-orders', args=[2014])
+        response, response_again = self.get_conditional(url)
+        self.assertEqual(response_again.status_code, 304)
+
+        event.delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_related(self):
+        url = reverse('fetch-calendar-schedule')
+        extra = {'data': {'start': 1411300000, 'end': 1411400000}, 'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+        response, response_again = self.get_conditional(url, **extra)
+        self.assertEqual(response_again.status_code, 304)
+
+        BartenderAvailability.objects.create(user=self.data['user1'], event=self.data['event1'],
+                                             availability=self.data['availability1'])
+        response_changed = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'], **extra)
+        self.assertContains(response_changed, self.data['user1'].first_name)
+
+    def test_shown_models(self):
+        url = reverse('event-list')
+        response = self.get_conditional(url)[0]
+
+        # Locations and the IVA status of bartenders are shown with the events
+        self.data['location1'].name = 'Location 1 renamed'
+        self.data['location1'].save()
+        response_location = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response_location.status_code, 200)
+
+        profile = self.data['user1'].profile
+        profile.is_iva = True
+        profile.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response_location['ETag']).status_code, 200)
+
+    def test_order_list_visitors(self):
+        # Visitors are counted from the orders until the summary is frozen
+        response = self.client.get(reverse('orders'))
+        self.assertEqual([e.visitors for e in response.context['object_list']], [1])
+
+        EventBillingSummary.objects.filter(event=self.data['event1']).update(is_frozen=True, visitors=5)
+        response = self.client.get(reverse('orders'))
+        self.assertEqual([e.visitors for e in response.context['object_list']], [5])
+
+    def test_calendars(self):
+        profile = self.data['user1'].profile
+        profile.ical_id = 'calendar-1'
+        profile.save()
+        fetch_extra = {'data': {'start': 1411300000, 'end': 1411400000}, 'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+        pages = [
+            (reverse('fetch-calendar-schedule'), fetch_extra),
+            ('/ical', {}),
+            (reverse('ical', args=['calendar-1']), {}),
+        ]
+        etags = [self.get_conditional(url, **extra)[0]['ETag'] for url, extra in pages]
+
+        # Locations are shown with the events
+        self.data['location1'].name = 'Location 1 renamed'
+        self.data['location1'].save()
+        for (url, extra), etag in zip(pages, etags):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag, **extra).status_code, 200)
+
+        # Unknown calendars are not found, whatever ETag the client has
+        response = self.client.get(reverse('ical', args=['unknown']), HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 404)
+
+    def test_request(self):
+        url = reverse('month-orders', args=[2014, 9])
+        response = self.get_conditional(url)[0]
+
+        # Pages differ per user
+        self.client.logout()
+        self.login(self.data['user2'].username, self.data['password2'], self.data['organization1'].slug)
+        self.assertNotEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
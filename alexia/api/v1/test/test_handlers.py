@@ -0,0 +1,223 @@
+import datetime
+import io
+import json
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.testcases import SimpleTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from modernrpc.handlers.jsonhandler import JsonErrorResult, JsonSuccessResult
+
+from alexia.api import metrics
+from alexia.api.handlers import AlexiaJSONRPCHandler
+from alexia.apps.billing.models import RfidCard
+from alexia.apps.general.models import CacheVersion
+from alexia.core.cache import model_namespace
+from alexia.apps.organization.models import Organization
+from alexia.test import APITestCase
+
+
+class AlexiaJSONRPCHandlerTest(SimpleTestCase):
+    """
+    Tests for the response serialization of the JSON-RPC handler.
+    """
+
+    def setUp(self):
+        self.handler = AlexiaJSONRPCHandler('v1')
+
+    def test_success(self):
+        data = {
+            'amount': Decimal('4.50'),
+            'placed_at': datetime.datetime(2014, 9, 21, 14, 16, 6, 123456, tzinfo=datetime.timezone.utc),
+        }
+        result = JsonSuccessResult(data)
+        result.set_jsonrpc_data(request_id='jsonrpc', version='1.0')
+
+        dumped = self.handler.dumps_result(result)
+        self.assertEqual(list(json.loads(dumped).keys()), ['id', 'jsonrpc', 'result', 'error'])
+        self.assertEqual(json.loads(dumped), {
+            'id': 'jsonrpc',
+            'jsonrpc': '1.0',
+            'result': json.loads(json.dumps(data, cls=DjangoJSONEncoder)),
+            'error': None,
+        })
+
+    def test_error(self):
+        result = JsonErrorResult(404, 'Event does not exist')
+        result.set_jsonrpc_data(request_id=1, version='2.0')
+
+        self.assertEqual(json.loads(self.handler.dumps_result(result)), {
+            'id': 1,
+            'jsonrpc': '2.0',
+            'error': {'code': 404, 'message': 'Event does not exist'},
+            'result': None,
+        })
+
+    def test_notification(self):
+        result = JsonSuccessResult(True)
+        result.set_jsonrpc_data(request_id=None, version='2.0', is_notification=True)
+
+        self.assertEqual(self.handler.dumps_result(result), '')
+
+    def test_unserializable(self):
+        result = JsonSuccessResult(object())
+        result.set_jsonrpc_data(request_id=1, version='2.0')
+
+        with self.assertLogs('alexia.api.handlers', 'ERROR'):
+            response = json.loads(self.handler.dumps_result(result))
+        self.assertIsNone(response['result'])
+        self.assertEqual(response['error']['code'], -32603)
+
+
+@override_settings(API_METRICS_ENABLED=True, API_METRICS_TOKEN='s3cret')
+class MetricsTest(APITestCase):
+    def setUp(self):
+        super(MetricsTest, self).setUp()
+        metrics.registry.reset()
+
+    def test_record(self):
+        self.send_request('organization.current.get', [])
+        self.send_request('organization.current.get', [])
+        self.send_request('organization.current.set', ['does-not-exist'])
+        self.send_request('organization.made.up', [])
+
+        totals = metrics.registry.totals()
+        self.assertEqual(totals['organization.current.get']['requests'], 2)
+        self.assertEqual(totals['organization.current.get']['errors'], 0)
+        self.assertEqual(totals['organization.current.get']['bucket_10.0'], 2)
+        self.assertEqual(totals['organization.current.set']['errors'], 1)
+        self.assertGreater(totals['organization.current.set']['queries'], 0)
+        self.assertEqual(totals[metrics.UNKNOWN_METHOD]['errors'], 1)
+        self.assertNotIn('organization.made.up', totals)
+
+    def test_workers(self):
+        # Another worker process adds its counts to the same counters
+        worker = metrics.MetricsRegistry()
+        with CaptureQueriesContext(connection) as queries:
+            metrics.registry.record('organization.current.get', 0.02, 1, 0.001)
+            worker.record('organization.current.get', 0.2, 2, 0.002, error=True)
+        self.assertEqual(len(queries), 0)
+
+        # Done by the background thread of the other worker
+        worker.counters.flush()
+        totals = metrics.registry.totals()['organization.current.get']
+        self.assertEqual(totals['requests'], 2)
+        self.assertEqual(totals['errors'], 1)
+        self.assertEqual(totals['queries'], 3)
+        self.assertEqual(totals['bucket_0.025'], 1)
+        self.assertEqual(worker.totals()['organization.current.get'], totals)
+
+    def test_view(self):
+        self.send_request('organization.current.get', [])
+
+        response = self.client.get(reverse('api-metrics'))
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        self.assertIn('# TYPE alexia_rpc_latency_seconds histogram', content)
+        self.assertIn('alexia_rpc_requests_total{method="organization.current.get"} 1', content)
+        self.assertIn('alexia_rpc_latency_seconds_bucket{method="organization.current.get",le="+Inf"} 1', content)
+
+    def test_view_token(self):
+        client = Client()
+        self.assertEqual(client.get(reverse('api-metrics')).status_code, 403)
+        self.assertEqual(client.get(reverse('api-metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(client.get(reverse('api-metrics'), HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+
+    @override_settings(API_METRICS_ENABLED=False)
+    def test_disabled(self):
+        self.send_request('organization.current.get', [])
+
+        self.assertEqual(metrics.registry.totals(), {})
+        self.assertEqual(self.client.get(reverse('api-metrics')).status_code, 404)
+
+    def test_command(self):
+        self.send_request('organization.current.get', [])
+
+        out = io.StringIO()
+        call_command('apimetrics', '--reset', stdout=out)
+        self.assertIn('alexia_rpc_requests_total{method="organization.current.get"} 1', out.getvalue())
+        self.assertEqual(metrics.registry.totals(), {})
+
+
+class RequestSetupTest(APITestCase):
+    def test_queries(self):
+        self.send_and_compare_request('organization.current.get', [], self.data['organization1'].slug)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.send_and_compare_request('organization.current.get', [], self.data['organization1'].slug)
+        # Only the session and the user with its profile are loaded
+        self.assertEqual(len(queries), 2, [q['sql'] for q in queries])
+        self.assertIn('"organization_profile"', queries[1]['sql'])
+
+    def test_organization_changed(self):
+        self.send_and_compare_request('organization.current.get', [], self.data['organization1'].slug)
+
+        organization = self.data['organization1']
+        organization.name = 'Organization 1 renamed'
+        organization.save()
+        self.send_and_compare_request('organization.current.get', [], 'organization-1-renamed')
+
+
+class CachePolicyTest(APITestCase):
+    def get_result(self, method, params):
+        return json.loads(self.send_request(method, params).content.decode())['result']
+
+    def test_cache(self):
+        expected = [self.data['organization1'].slug, self.data['organization2'].slug]
+        self.assertCountEqual(self.get_result('organization.list', []), expected)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertCountEqual(self.get_result('organization.list', []), expected)
+        # The organizations are not loaded again
+        self.assertFalse([q for q in queries if q['sql'].endswith('FROM "organization_organization"')])
+
+        # Saving an organization invalidates the result
+        organization = Organization.objects.create(name='Organization 3')
+        self.assertCountEqual(self.get_result('organization.list', []), expected + [organization.slug])
+
+    def test_last_login(self):
+        def get_version():
+            versions = CacheVersion.objects.filter(namespace=model_namespace(User))
+            return versions.values_list('version', flat=True).first()
+
+        version = get_version()
+        self.assertTrue(self.client.login(username=self.data['user2'].username, password=self.data['password2']))
+        # Logging in only saves the login time, which is not part of any result
+        self.assertEqual(get_version(), version)
+
+        self.data['user2'].first_name = 'Renamed'
+        self.data['user2'].save()
+        self.assertNotEqual(get_version(), version)
+
+    def test_many_to_many(self):
+        self.load_billing_data()
+        card = RfidCard.objects.create(identifier='02,98:ab:54:ef', user=self.data['user1'])
+        self.assertEqual(self.get_result('rfid.get', [self.data['user1'].username]), [])
+
+        card.managed_by.add(self.data['organization1'])
+        self.assertEqual(self.get_result('rfid.get', [self.data['user1'].username]), ['02,98:ab:54:ef'])
+
+        # Cached per organization
+        self.send_request('organization.current.set', [self.data['organization2'].slug])
+        self.assertEqual(self.get_result('rfid.get', [self.data['user1'].username]), [])
+
+    @override_settings(API_METRICS_ENABLED=True)
+    def test_metrics(self):
+        metrics.registry.reset()
+        self.send_request('organization.list', [])
+        self.send_request('organization.list', [])
+
+        totals = metrics.registry.totals()['organization.list']
+        self.assertEqual((totals['cache_hits'], totals['cache_misses']), (1, 1))
+
+    @override_settings(API_CACHE_ENABLED=False)
+    def test_disabled(self):
+        self.get_result('organization.list', [])
+        with CaptureQueriesContext(connection) as queries:
+            self.get_result('organization.list', [])
+        self.assertTrue([q for q in queries if q['sql'].endswith('FROM "organization_organization"')])
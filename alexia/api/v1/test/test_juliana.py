@@ -1,10 +1,28 @@
 import datetime
-
+import json
+import threading
+import time
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, override_settings
 from django.test.testcases import SimpleTestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 from alexia.api.exceptions import ForbiddenError, InvalidParamsError
-from alexia.apps.billing.models import RfidCard
+from alexia.apps.billing.models import (
+    Authorization, EventBillingSummary, EventUserSpend, IdempotencyKey, Order,
+    Purchase, RfidCard, SellingPrice, WriteoffCategory, WriteOffOrder,
+)
+from alexia.apps.billing.resolver import card_resolver
+from alexia.apps.general.models import CacheVersion
+from alexia.apps.organization.agecheck import AgeCheckClient
+from alexia.apps.scheduling.models import Event
+from alexia.core import cache
 from alexia.test import APITestCase, TestCase
 
 from ..common import format_authorization
@@ -82,6 +100,110 @@ class JulianaRfidToIdentifierTest(SimpleTestCase):
             rfid_to_identifier(rfid)
 
 
+class AgeCheckStub(object):
+    """
+    Local HTTP server that answers age check requests.
+    """
+
+    def __init__(self, status=200, body=None, delay=0):
+        self.status = status
+        self.body = body if body is not None else {'check_ok': True}
+        self.delay = delay
+        self.requests = []
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                stub.requests.append(json.loads(self.rfile.read(int(self.headers['Content-Length']))))
+                time.sleep(stub.delay)
+                body = json.dumps(stub.body).encode('utf-8')
+                self.send_response(stub.status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%s/check' % self.server.server_port
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class AgeCheckClientTest(TestCase):
+    """
+    Tests for the age check client, against a local stub server.
+    """
+
+    def setUp(self):
+        super(AgeCheckClientTest, self).setUp()
+        self.load_organization_data()
+        self.organization = self.data['organization1']
+        self.organization.age_check_enabled = True
+        self.organization.age_check_api_key = 'secret'
+
+    def _stub(self, **kwargs):
+        stub = AgeCheckStub(**kwargs)
+        self.addCleanup(stub.close)
+        self.organization.age_check_api_endpoint = stub.url
+        return stub
+
+    def test_check_cached(self):
+        stub = self._stub(body={'check_ok': False})
+        client = AgeCheckClient()
+
+        self.assertIs(client.check(self.organization, '02,98:ab:54:ef'), False)
+        self.assertIs(client.check(self.organization, '02,98:ab:54:ef'), False)
+        self.assertEqual(stub.requests, [{'apiKey': 'secret', 'rfid': '02,98:ab:54:ef'}])
+
+    def test_check_timeout(self):
+        self._stub(delay=1)
+        client = AgeCheckClient(read_timeout=0.1)
+
+        start = time.monotonic()
+        self.assertIsNone(client.check(self.organization, '02,98:ab:54:ef'))
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_circuit_breaker(self):
+        stub = self._stub(status=500)
+        client = AgeCheckClient(failure_threshold=2, reset_timeout=60)
+
+        for i in range(4):
+            self.assertIsNone(client.check(self.organization, '02,98:ab:54:%02d' % i))
+        self.assertEqual(len(stub.requests), 2)
+
+        # Another organization is not affected
+        other = self.data['organization2']
+        other.age_check_api_endpoint = stub.url
+        other.age_check_api_key = 'other'
+        self.assertIsNone(client.check(other, '02,98:ab:54:ef'))
+        self.assertEqual(len(stub.requests), 3)
+
+    def test_circuit_breaker_reset(self):
+        stub = self._stub(status=500)
+        client = AgeCheckClient(failure_threshold=1, reset_timeout=0.01)
+
+        self.assertIsNone(client.check(self.organization, '02,98:ab:54:ef'))
+        time.sleep(0.02)
+        stub.status = 200
+        self.assertIs(client.check(self.organization, '02,98:ab:54:ef'), True)
+        self.assertIs(client.check(self.organization, '02,98:ab:54:00'), True)
+        self.assertEqual(len(stub.requests), 3)
+
+    def test_prefetch(self):
+        self._stub()
+        client = AgeCheckClient()
+
+        future = client.prefetch(self.organization, '02,98:ab:54:ef')
+        self.assertIs(client.wait(future), True)
+
+
 class JulianaGetValidateEventTest(TestCase):
     """
     Tests for the api.v1.juliana._get_validate_event method.
@@ -136,6 +258,21 @@ class JulianaGetValidateEventTest(TestCase):
         with self.assertRaises(ForbiddenError):
             _get_validate_event(self.request, event_id)
 
+    def test_tender_memo(self):
+        event_id = self.data['event1'].id
+
+        # Event lookup and assigned bartender check
+        with self.assertNumQueries(2):
+            _get_validate_event(self.request, event_id)
+        # Event lookup only
+        with self.assertNumQueries(1):
+            _get_validate_event(self.request, event_id)
+
+        # The memo belongs to the request, not to the user object that may be reused by a later request
+        self.data['event1'].bartender_availabilities.filter(user=self.data['user2']).delete()
+        with self.assertRaises(ForbiddenError):
+            _get_validate_event(type(self.request)(self.request.user), event_id)
+
     def test_event_past(self):
         event_id = self.data['event1'].id
 
@@ -304,6 +441,130 @@ class JulianaTest(APITestCase):
             error_message='Event does not exist',
         )
 
+    def _unassign_user2(self):
+        bartender_availability = self.data['event1'].bartender_availabilities.get(user=self.data['user2'])
+        bartender_availability.availability = self.data['availability3']
+        bartender_availability.save()
+
+    def test_session_grant_disabled(self):
+        event_id = self.data['event1'].id
+        self.send_and_compare_request('juliana.user.check', [event_id, self.data['user1'].id], 0)
+
+        self._unassign_user2()
+        self.send_and_compare_request_error(
+            'juliana.user.check', [event_id, self.data['user1'].id],
+            status_code=200,
+            error_code=-32096,
+            error_message='Forbidden - You are not a tender for this event',
+        )
+
+    @override_settings(JULIANA_SESSION_GRANTS=True)
+    def test_session_grant(self):
+        event_id = self.data['event1'].id
+        self.send_and_compare_request('juliana.user.check', [event_id, self.data['user1'].id], 0)
+
+        self._unassign_user2()
+        self.send_and_compare_request('juliana.user.check', [event_id, self.data['user1'].id], 0)
+
+        # The grant belongs to the session, a new session has to pass the check again
+        self.client = Client()
+        self.login(username=self.data['user2'].username,
+                   password=self.data['password2'],
+                   organization_slug=self.data['organization1'].slug)
+        self.send_and_compare_request_error(
+            'juliana.user.check', [event_id, self.data['user1'].id],
+            status_code=200,
+            error_code=-32096,
+            error_message='Forbidden - You are not a tender for this event',
+        )
+
+    @override_settings(CACHE_VERSION_TTL=60)
+    def test_rfid_get_resolver_warm(self):
+        event = self.data['event1']
+        event.starts_at = timezone.now()
+        event.ends_at = timezone.now() + datetime.timedelta(hours=4)
+        event.save()
+
+        card = self.data['user2'].rfidcard_set.create(identifier='02,98:ab:54:ef', is_active=True)
+        authorization = self.data['user2'].authorizations.create(organization=self.data['organization1'])
+        Order.objects.create(event=event, authorization=authorization, added_by=self.data['user2'], amount=0)
+        # Users that did not order recently are not loaded
+        self.data['user1'].rfidcard_set.create(identifier='02,11:22:33:44', is_active=True)
+
+        versions = tuple(cache.get_versions('billing:cards', 'billing:authorizations:%s' % event.organizer_id))
+        with self.assertNumQueries(3):
+            card_resolver.warm(event, versions)
+        with self.assertNumQueries(0):
+            self.assertEqual(card_resolver.resolve(event, '02,98:ab:54:ef'), (card, authorization))
+        self.assertEqual(card_resolver.resolve(event, '02,11:22:33:44')[1], self.data['authorization1'])
+
+    def test_rfid_get_resolver_other_worker(self):
+        event = self.data['event1']
+        with self.captureOnCommitCallbacks(execute=True):
+            card = self.data['user2'].rfidcard_set.create(identifier='02,98:ab:54:ef', is_active=True)
+            authorization = self.data['user2'].authorizations.create(organization=self.data['organization1'])
+        self.assertEqual(card_resolver.resolve(event, '02,98:ab:54:ef'), (card, authorization))
+
+        # Another worker revokes the authorization, this worker notices once its known versions expire
+        Authorization.objects.filter(pk=authorization.pk).update(end_date=authorization.start_date)
+        CacheVersion.objects.update_or_create(namespace='billing:authorizations:%s' % event.organizer_id,
+                                              defaults={'version': 12345})
+        cache._versions.clear()
+        self.assertEqual(card_resolver.resolve(event, '02,98:ab:54:ef'), (card, None))
+
+    def test_rfid_get_resolver_invalidation(self):
+        event_id = self.data['event1'].id
+        rfid_data = {
+            'atqa': '00:04',
+            'sak': '08',
+            'uid': '98:ab:54:ef',
+        }
+
+        card = self.data['user2'].rfidcard_set.create(identifier='02,98:ab:54:ef', is_active=True)
+        authorization = self.data['user2'].authorizations.create(organization=self.data['organization1'])
+        self.send_request('juliana.rfid.get', [event_id, rfid_data])
+
+        authorization.end_date = authorization.start_date
+        authorization.save()
+        self.send_and_compare_request_error(
+            'juliana.rfid.get', [event_id, rfid_data],
+            status_code=200,
+            error_code=404,
+            error_message='No authorization found for user',
+        )
+
+        card.is_active = False
+        card.save()
+        self.send_and_compare_request_error(
+            'juliana.rfid.get', [event_id, rfid_data],
+            status_code=200,
+            error_code=404,
+            error_message='RFID card not found',
+            error_data={'card_register_url': None},
+        )
+
+    def test_rfid_get_age_check(self):
+        stub = AgeCheckStub(body={'check_ok': False})
+        self.addCleanup(stub.close)
+        organization = self.data['organization1']
+        organization.age_check_enabled = True
+        organization.age_check_api_endpoint = stub.url
+        organization.age_check_api_key = 'secret'
+        organization.save()
+
+        rfid_data = {
+            'atqa': '00:04',
+            'sak': '08',
+            'uid': '98:ab:54:ef',
+        }
+        self.data['user2'].rfidcard_set.create(identifier='02,98:ab:54:ef', is_active=True)
+        self.data['user2'].authorizations.create(organization=organization)
+
+        for i in range(2):
+            response = self.send_request('juliana.rfid.get', [self.data['event1'].id, rfid_data])
+            self.assertIs(json.loads(response.content.decode())['result']['age_check'], False)
+        self.assertEqual(stub.requests, [{'apiKey': 'secret', 'rfid': '02,98:ab:54:ef'}])
+
     def test_user_check_no_orders(self):
         event_id = self.data['event1'].id
         user_id = self.data['user1'].id
@@ -321,6 +582,153 @@ class JulianaTest(APITestCase):
 
         self.send_and_compare_request('juliana.user.check', [event_id, user_id], expected_result)
 
+    def test_user_check_after_order_save(self):
+        rfid_data = self._prepare_order()
+        event_id = self.data['event1'].id
+        user_id = self.data['user1'].id
+        purchases = [{'product': self.data['permantentproduct1'].id, 'amount': 3, 'price': 150}]
+
+        self.send_and_compare_request('juliana.order.save', [event_id, user_id, purchases, rfid_data], True)
+        self.send_and_compare_request('juliana.order.save', [event_id, user_id, purchases, rfid_data], True)
+        self.assertEqual(EventUserSpend.objects.get(event=event_id, user=user_id).amount, Decimal('3.00'))
+        self.send_and_compare_request('juliana.user.check', [event_id, user_id], 300)
+
+        Order.objects.order_by('pk').first().delete()
+        self.send_and_compare_request('juliana.user.check', [event_id, user_id], 150)
+
+    def test_user_check_rebuild(self):
+        self.load_billing_order_data()
+        EventUserSpend.objects.all().delete()
+
+        call_command('rebuildspend', stdout=StringIO())
+
+        expected_amount = self.data['order1'].amount + self.data['order2'].amount
+        self.send_and_compare_request('juliana.user.check', [self.data['event1'].id, self.data['user1'].id],
+                                      int(expected_amount * 100))
+
+    def test_order_save_billing_summary(self):
+        rfid_data = self._prepare_order()
+        event = self.data['event1']
+        user_id = self.data['user1'].id
+        category = WriteoffCategory.objects.create(name='Spilled', description='Spilled drinks',
+                                                   organization=self.data['organization1'], is_active=True)
+        self.data['permantentproduct1'].name = 'Beer'
+        self.data['permantentproduct1'].save()
+        self.data['temporaryproduct1'].name = 'Wine'
+        self.data['temporaryproduct1'].save()
+        purchases = [
+            {'product': self.data['permantentproduct1'].id, 'amount': 3, 'price': 150},
+            {'product': self.data['temporaryproduct1'].id, 'amount': 1, 'price': 233},
+        ]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.send_and_compare_request('juliana.order.save', [event.id, user_id, purchases, rfid_data], True)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.send_and_compare_request('juliana.order.save', [event.id, user_id, purchases[:1], rfid_data], True)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.send_and_compare_request('juliana.writeoff.save', [event.id, category.id, purchases[:1]], True)
+
+        summary = EventBillingSummary.get_for_event(Event.objects.get(pk=event.pk))
+        self.assertEqual(summary.order_count, 2)
+        self.assertEqual(summary.writeoff_order_count, 1)
+        self.assertEqual(summary.visitors, 1)
+        self.assertEqual(summary.revenue, Decimal('5.33'))
+        self.assertEqual(summary.product_list(), [
+            {'product': 'Beer', 'amount': 6, 'price': Decimal('3.00')},
+            {'product': 'Wine', 'amount': 1, 'price': Decimal('2.33')},
+        ])
+        self.assertFalse(summary.is_frozen)
+
+        # Reading the summary of a closed event does not write to the database
+        Order.objects.order_by('pk').first().delete()
+        event.ends_at = timezone.now() - datetime.timedelta(days=2)
+        event.save()
+        event = Event.objects.get(pk=event.pk)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(event.revenue(), Decimal('1.50'))
+        self.assertFalse([q for q in queries if not q['sql'].startswith('SELECT')])
+
+        # Once the event is closed, the summary is rebuilt and frozen
+        call_command('freezesummaries', stdout=StringIO())
+        summary = EventBillingSummary.objects.get(event=event)
+        self.assertTrue(summary.is_frozen)
+        self.assertEqual((summary.order_count, summary.visitors, summary.revenue), (1, 1, Decimal('1.50')))
+
+        # Later changes to the orders rebuild the frozen summary
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(event=event, authorization=self.data['authorization1'],
+                                         added_by=self.data['user1'])
+        Purchase(order=order, product='Beer', amount=1, price=Decimal('0.50')).save()
+        order.save()
+        summary = EventBillingSummary.objects.get(event=event)
+        self.assertTrue(summary.is_frozen)
+        self.assertEqual((summary.order_count, summary.revenue), (2, Decimal('2.00')))
+        self.assertEqual(summary.product_list(), [{'product': 'Beer', 'amount': 4, 'price': Decimal('2.00')}])
+
+        order.delete()
+        summary = EventBillingSummary.objects.get(event=event)
+        self.assertEqual((summary.order_count, summary.revenue), (1, Decimal('1.50')))
+        self.assertEqual(summary.product_list(), [{'product': 'Beer', 'amount': 3, 'price': Decimal('1.50')}])
+
+    def test_order_legacy_billing_summary(self):
+        event = self.data['event1']
+        order = Order(event=event, authorization=self.data['authorization1'], added_by=self.data['user1'])
+        with self.captureOnCommitCallbacks(execute=True):
+            order.save()
+        summary = EventBillingSummary.get_for_event(Event.objects.get(pk=event.pk))
+        self.assertEqual((summary.order_count, summary.visitors, summary.revenue), (1, 1, Decimal('0.00')))
+
+        # Saving the order after adding its purchases rebuilds the summary
+        Purchase(order=order, product='Beer', amount=2, price=Decimal('1.00')).save()
+        order.save()
+        summary = EventBillingSummary.objects.get(event=event)
+        self.assertEqual((summary.order_count, summary.visitors, summary.revenue), (1, 1, Decimal('1.00')))
+        self.assertEqual(summary.product_list(), [{'product': 'Beer', 'amount': 2, 'price': Decimal('1.00')}])
+
+    def test_bootstrap(self):
+        self._prepare_order()
+        event_id = self.data['event1'].id
+
+        response = self.send_request('juliana.bootstrap', [event_id])
+        result = json.loads(response.content.decode())['result']
+        self.assertFalse(result['unchanged'])
+        self.assertEqual([(p['id'], p['price']) for p in result['products']], [
+            (self.data['permantentproduct1'].id, 50),
+            (self.data['temporaryproduct1'].id, 233),
+        ])
+        self.assertEqual(result['writeoff_categories'], [])
+
+        self.send_and_compare_request('juliana.bootstrap', [event_id, result['version']],
+                                      {'version': result['version'], 'unchanged': True})
+
+        self.data['sellingprice1'].price = Decimal('0.60')
+        self.data['sellingprice1'].save()
+        response = self.send_request('juliana.bootstrap', [event_id, result['version']])
+        changed = json.loads(response.content.decode())['result']
+        self.assertFalse(changed['unchanged'])
+        self.assertNotEqual(changed['version'], result['version'])
+        self.assertEqual(changed['products'][0]['price'], 60)
+
+    def test_bootstrap_writeoff_categories(self):
+        event_id = self.data['event1'].id
+        organization = self.data['organization1']
+        organization.writeoff_enabled = True
+        organization.save()
+        category = WriteoffCategory.objects.create(name='Spilled', description='Spilled drinks',
+                                                   organization=organization, is_active=True)
+
+        response = self.send_request('juliana.bootstrap', [event_id])
+        result = json.loads(response.content.decode())['result']
+        self.assertTrue(result['writeoff'])
+        self.assertEqual(result['writeoff_categories'], [
+            {'id': category.id, 'name': 'Spilled', 'description': 'Spilled drinks', 'color': ''},
+        ])
+
+        category.is_active = False
+        category.save()
+        response = self.send_request('juliana.bootstrap', [event_id, result['version']])
+        self.assertEqual(json.loads(response.content.decode())['result']['writeoff_categories'], [])
+
     def test_user_check_invalid_event(self):
         event_id = self.data['event1'].id * 100
         user_id = self.data['user1'].id
@@ -342,3 +750,288 @@ class JulianaTest(APITestCase):
             error_code=404,
             error_message='User does not exist',
         )
+
+    def _prepare_order(self):
+        self.data['sellingprice1'] = SellingPrice.objects.create(pricegroup=self.data['pricegroup1'],
+                                                                 productgroup=self.data['productgroup1'],
+                                                                 price=Decimal('0.50'))
+        self.data['user1'].rfidcard_set.create(identifier='02,98:ab:54:ef', is_active=True)
+
+        return {
+            'atqa': '00:04',
+            'sak': '08',
+            'uid': '98:ab:54:ef',
+        }
+
+    def test_order_save(self):
+        rfid_data = self._prepare_order()
+        purchases = [
+            {'product': self.data['permantentproduct1'].id, 'amount': 2, 'price': 100},
+            {'product': self.data['temporaryproduct1'].id, 'amount': 1, 'price': 233},
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            self.send_and_compare_request('juliana.order.save',
+                                          [self.data['event1'].id, self.data['user1'].id, purchases, rfid_data], True)
+
+        # The organizer is loaded together with the event
+        sql = [q['sql'] for q in queries]
+        event_query = next(i for i, q in enumerate(sql) if 'FROM "scheduling_event"' in q)
+        self.assertFalse([q for q in sql[event_query:] if 'FROM "organization_organization"' in q])
+        order = Order.objects.get(event=self.data['event1'])
+        self.assertEqual(order.amount, Decimal('3.33'))
+        self.assertEqual(order.authorization, self.data['authorization1'])
+        self.assertEqual(order.purchases.count(), 2)
+
+    def test_order_save_incorrect_price(self):
+        rfid_data = self._prepare_order()
+        purchases = [{'product': self.data['permantentproduct1'].id, 'amount': 2, 'price': 50}]
+
+        self.send_and_compare_request_error(
+            'juliana.order.save', [self.data['event1'].id, self.data['user1'].id, purchases, rfid_data],
+            error_code=-32602,
+            error_message='Price for product %s is incorrect' % self.data['permantentproduct1'].id,
+        )
+        self.assertFalse(Order.objects.exists())
+
+    def test_order_save_unavailable_product(self):
+        rfid_data = self._prepare_order()
+        self.data['sellingprice1'].delete()
+        purchases = [{'product': self.data['permantentproduct1'].id, 'amount': 1, 'price': 50}]
+
+        self.send_and_compare_request_error(
+            'juliana.order.save', [self.data['event1'].id, self.data['user1'].id, purchases, rfid_data],
+            error_code=-32602,
+            error_message='Product %s is not available for this event' % self.data['permantentproduct1'].id,
+        )
+
+    def test_order_save_price_changed(self):
+        rfid_data = self._prepare_order()
+        purchases = [{'product': self.data['permantentproduct1'].id, 'amount': 1, 'price': 50}]
+        self.send_and_compare_request('juliana.order.save',
+                                      [self.data['event1'].id, self.data['user1'].id, purchases, rfid_data], True)
+
+        # The cached catalog should be invalidated by the price change
+        self.data['sellingprice1'].price = Decimal('0.75')
+        self.data['sellingprice1'].save()
+
+        self.send_and_compare_request_error(
+            'juliana.order.save', [self.data['event1'].id, self.data['user1'].id, purchases, rfid_data],
+            error_code=-32602,
+            error_message='Price for product %s is incorrect' % self.data['permantentproduct1'].id,
+        )
+
+        purchases[0]['price'] = 75
+        self.send_and_compare_request('juliana.order.save',
+                                      [self.data['event1'].id, self.data['user1'].id, purchases, rfid_data], True)
+
+    def test_order_save_queries_independent_of_basket_size(self):
+        rfid_data = self._prepare_order()
+        params = [self.data['event1'].id, self.data['user1'].id, None, rfid_data]
+
+        params[2] = [{'product': self.data['permantentproduct1'].id, 'amount': 1, 'price': 50}]
+        # Warm up the catalog of the event
+        self.send_and_compare_request('juliana.order.save', params, True)
+        with CaptureQueriesContext(connection) as small:
+            self.send_and_compare_request('juliana.order.save', params, True)
+
+        params[2] = [
+            {'product': self.data['permantentproduct1'].id, 'amount': 1, 'price': 50},
+            {'product': self.data['permantentproduct1'].id, 'amount': 3, 'price': 150},
+            {'product': self.data['temporaryproduct1'].id, 'amount': 2, 'price': 466},
+        ]
+        with CaptureQueriesContext(connection) as large:
+            self.send_and_compare_request('juliana.order.save', params, True)
+
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(Order.objects.order_by('pk').last().amount, Decimal('6.66'))
+
+    def test_writeoff_save(self):
+        self._prepare_order()
+        category = WriteoffCategory.objects.create(name='Spilled', description='Spilled drinks',
+                                                   organization=self.data['organization1'], is_active=True)
+        purchases = [
+            {'product': self.data['permantentproduct1'].id, 'amount': 2, 'price': 100},
+            {'product': self.data['temporaryproduct1'].id, 'amount': 1, 'price': 233},
+        ]
+
+        self.send_and_compare_request('juliana.writeoff.save', [self.data['event1'].id, category.id, purchases], True)
+
+        order = WriteOffOrder.objects.get(event=self.data['event1'])
+        self.assertEqual(order.amount, Decimal('3.33'))
+        self.assertEqual(order.writeoff_purchases.count(), 2)
+
+    def test_order_save_batch(self):
+        rfid_data = self._prepare_order()
+        placed_at = self.data['event1'].starts_at.replace(microsecond=0) + datetime.timedelta(minutes=14)
+        orders = [
+            {
+                'key': 'order-1',
+                'rfid': rfid_data,
+                'purchases': [{'product': self.data['permantentproduct1'].id, 'amount': 2, 'price': 100}],
+                'placed_at': placed_at.isoformat(),
+            },
+            {
+                'key': 'order-2',
+                'rfid': rfid_data,
+                'purchases': [{'product': self.data['permantentproduct1'].id, 'amount': 2, 'price': 99}],
+            },
+        ]
+
+        response = self.send_request('juliana.order.save_batch', [self.data['event1'].id, orders])
+        results = json.loads(response.content.decode('utf-8'))['result']
+
+        order = Order.objects.get(event=self.data['event1'])
+        self.assertEqual(order.authorization, self.data['authorization1'])
+        self.assertEqual(order.placed_at, placed_at)
+        self.assertEqual(results, [
+            {'key': 'order-1', 'order_id': order.id, 'duplicate': False, 'error': None},
+            {'key': 'order-2', 'order_id': None, 'duplicate': False, 'error': {
+                'code': -32602,
+                'message': 'Price for product %s is incorrect' % self.data['permantentproduct1'].id,
+            }},
+        ])
+
+        # Sending the same order again does not save it twice
+        response = self.send_request('juliana.order.save_batch', [self.data['event1'].id, orders[:1] * 2])
+        results = json.loads(response.content.decode('utf-8'))['result']
+
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(results, [
+            {'key': 'order-1', 'order_id': order.id, 'duplicate': True, 'error': None},
+            {'key': 'order-1', 'order_id': order.id, 'duplicate': True, 'error': None},
+        ])
+
+    def test_order_save_batch_key_conflict(self):
+        rfid_data = self._prepare_order()
+        event2 = Event.objects.create(organizer=self.data['organization1'], name='Test event 2',
+                                      starts_at=self.data['datetime1'], ends_at=self.data['datetime3'], kegs=0)
+        IdempotencyKey.objects.create(key='other-event', event=event2)
+        IdempotencyKey.objects.create(key='writeoff', event=self.data['event1'])
+        purchases = [{'product': self.data['permantentproduct1'].id, 'amount': 1, 'price': 50}]
+        orders = [{'key': key, 'rfid': rfid_data, 'purchases': purchases} for key in ['other-event', 'writeoff']]
+
+        response = self.send_request('juliana.order.save_batch', [self.data['event1'].id, orders])
+        results = json.loads(response.content.decode('utf-8'))['result']
+
+        error = {'code': -32602, 'message': 'Key has already been used for another event or for a writeoff order'}
+        self.assertEqual(results, [
+            {'key': 'other-event', 'order_id': None, 'duplicate': False, 'error': error},
+            {'key': 'writeoff', 'order_id': None, 'duplicate': False, 'error': error},
+        ])
+        self.assertFalse(Order.objects.exists())
+
+    def test_order_save_batch_malformed(self):
+        rfid_data = self._prepare_order()
+        backdated = self.data['event1'].opens_at - datetime.timedelta(minutes=1)
+        orders = [
+            {'key': 'no-price', 'rfid': rfid_data, 'purchases': [{'product': self.data['permantentproduct1'].id,
+                                                                  'amount': 1}]},
+            {'key': 'backdated', 'rfid': rfid_data, 'placed_at': backdated.isoformat(),
+             'purchases': [{'product': self.data['permantentproduct1'].id, 'amount': 1, 'price': 50}]},
+            {'key': 'valid', 'rfid': rfid_data,
+             'purchases': [{'product': self.data['permantentproduct1'].id, 'amount': 1, 'price': 50}]},
+        ]
+
+        response = self.send_request('juliana.order.save_batch', [self.data['event1'].id, orders])
+        results = json.loads(response.content.decode('utf-8'))['result']
+
+        # Malformed orders are reported without blocking the orders queued after them
+        order = Order.objects.get(event=self.data['event1'])
+        self.assertEqual(results, [
+            {'key': 'no-price', 'order_id': None, 'duplicate': False,
+             'error': {'code': -32602, 'message': 'Invalid order'}},
+            {'key': 'backdated', 'order_id': None, 'duplicate': False,
+             'error': {'code': -32602, 'message': 'Order placed before the event opened'}},
+            {'key': 'valid', 'order_id': order.id, 'duplicate': False, 'error': None},
+        ])
+
+    def test_order_save_batch_no_key(self):
+        rfid_data = self._prepare_order()
+        orders = [{'rfid': rfid_data, 'purchases': []}]
+
+        self.send_and_compare_request_error(
+            'juliana.order.save_batch', [self.data['event1'].id, orders],
+            error_code=-32602,
+            error_message='Every order requires a key of at most 64 characters',
+        )
+
+    def test_order_save_key(self):
+        rfid_data = self._prepare_order()
+        purchases = [{'product': self.data['permantentproduct1'].id, 'amount': 1, 'price': 50}]
+        params = [self.data['event1'].id, self.data['user1'].id, purchases, rfid_data, 'retried-order']
+
+        self.send_and_compare_request('juliana.order.save', params, True)
+        # A retry returns the original result without saving the order again
+        self.send_and_compare_request('juliana.order.save', params, True)
+
+        order = Order.objects.get(event=self.data['event1'])
+        self.assertTrue(IdempotencyKey.objects.filter(key='retried-order', order=order).exists())
+
+    def test_order_save_key_prune(self):
+        IdempotencyKey.objects.create(key='old', event=self.data['event1'],
+                                      created_at=timezone.now() - datetime.timedelta(days=31))
+        IdempotencyKey.objects.create(key='recent', event=self.data['event1'])
+        call_command('prunechanges', stdout=StringIO())
+
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['recent'])
+
+    def test_order_save_key_other_event(self):
+        rfid_data = self._prepare_order()
+        purchases = [{'product': self.data['permantentproduct1'].id, 'amount': 1, 'price': 50}]
+        self.send_and_compare_request('juliana.order.save',
+                                      [self.data['event1'].id, self.data['user1'].id, purchases, rfid_data, 'key'],
+                                      True)
+
+        event2 = Event.objects.create(organizer=self.data['organization1'], name='Test event 2',
+                                      starts_at=self.data['event1'].starts_at, ends_at=self.data['event1'].ends_at,
+                                      kegs=0)
+        event2.bartender_availabilities.create(user=self.data['user2'], availability=self.data['availability1'])
+        self.send_and_compare_request_error(
+            'juliana.order.save', [event2.id, self.data['user1'].id, purchases, rfid_data, 'key'],
+            error_code=-32602,
+            error_message='Key has already been used for another event',
+        )
+
+    def test_order_save_key_no_tender(self):
+        rfid_data = self._prepare_order()
+        purchases = [{'product': self.data['permantentproduct1'].id, 'amount': 1, 'price': 50}]
+        params = [self.data['event1'].id, self.data['user1'].id, purchases, rfid_data, 'key']
+        self.send_and_compare_request('juliana.order.save', params, True)
+
+        # Known keys are only reported to tenders of the event
+        self.data['event1'].bartender_availabilities.all().delete()
+        self.send_and_compare_request_error(
+            'juliana.order.save', params,
+            error_code=ForbiddenError().code,
+            error_message='Forbidden - You are not a tender for this event',
+        )
+
+    def test_writeoff_save_order_key(self):
+        rfid_data = self._prepare_order()
+        category = WriteoffCategory.objects.create(name='Spilled', description='Spilled drinks',
+                                                   organization=self.data['organization1'], is_active=True)
+        purchases = [{'product': self.data['temporaryproduct1'].id, 'amount': 1, 'price': 233}]
+        self.send_and_compare_request('juliana.order.save',
+                                      [self.data['event1'].id, self.data['user1'].id, purchases, rfid_data, 'key'],
+                                      True)
+
+        self.send_and_compare_request_error(
+            'juliana.writeoff.save', [self.data['event1'].id, category.id, purchases, 'key'],
+            error_code=-32602,
+            error_message='Key has already been used for another type of order',
+        )
+        self.assertFalse(WriteOffOrder.objects.exists())
+
+    def test_writeoff_save_key(self):
+        self._prepare_order()
+        category = WriteoffCategory.objects.create(name='Spilled', description='Spilled drinks',
+                                                   organization=self.data['organization1'], is_active=True)
+        purchases = [{'product': self.data['temporaryproduct1'].id, 'amount': 1, 'price': 233}]
+        params = [self.data['event1'].id, category.id, purchases, 'retried-writeoff']
+
+        self.send_and_compare_request('juliana.writeoff.save', params, True)
+        self.send_and_compare_request('juliana.writeoff.save', params, True)
+
+        order = WriteOffOrder.objects.get(event=self.data['event1'])
+        self.assertTrue(IdempotencyKey.objects.filter(key='retried-writeoff', writeoff_order=order).exists())
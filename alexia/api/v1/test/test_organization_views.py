@@ -0,0 +1,36 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from alexia.apps.organization.models import Membership, Organization
+from alexia.test import APITestCase
+
+
+class OrganizationSwitcherTest(APITestCase):
+    def test_switcher(self):
+        membership = Membership.objects.create(user=self.data['user2'], organization=self.data['organization1'],
+                                               is_manager=True)
+        self.client.logout()
+        self.login(self.data['user2'].username, self.data['password2'], self.data['organization1'].slug)
+
+        self.client.get(reverse('event-list'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('event-list'))
+        self.assertContains(response, reverse('memberships'))
+        self.assertContains(response, reverse('change-current-organization', args=[self.data['organization2'].slug]))
+        # The organizations and roles of the user are not loaded again
+        self.assertFalse([q for q in queries if q['sql'].endswith('FROM "organization_organization"') or
+                          'FROM "organization_membership"' in q['sql']])
+
+        # Changes to memberships and organizations show up on the next page
+        membership.is_manager = False
+        membership.save()
+        Organization.objects.create(name='Organization 3')
+        response = self.client.get(reverse('event-list'))
+        self.assertNotContains(response, reverse('memberships'))
+        self.assertContains(response, reverse('change-current-organization', args=['organization-3']))
+
+        # The switcher posts the path of the current page, which is not part of the cached fragment
+        response = self.client.post(reverse('change-current-organization', args=[self.data['organization2'].slug]),
+                                    {'next': reverse('event-list')})
+        self.assertRedirects(response, reverse('event-list'), fetch_redirect_response=False)
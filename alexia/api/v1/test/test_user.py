@@ -0,0 +1,106 @@
+import json
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from alexia.apps.organization.models import AuthenticationData, Membership
+from alexia.auth.backends import OIDC_BACKEND_NAME
+from alexia.test import APITestCase
+
+from ..common import format_user
+
+
+class UserTest(APITestCase):
+    def setUp(self):
+        super(UserTest, self).setUp()
+        Membership.objects.create(user=self.data['user1'], organization=self.data['organization1'], is_manager=True)
+        Membership.objects.create(user=self.data['user2'], organization=self.data['organization1'], is_tender=True,
+                                  comments='Tender')
+
+    def get_users(self, *params):
+        return json.loads(self.send_request('user.list', list(params)).content.decode())['result']
+
+    def test_user_list(self):
+        user1, user2 = self.data['user1'], self.data['user2']
+
+        expected_result = [
+            dict(format_user(user1), membership={
+                'comments': '', 'is_tender': False, 'is_planner': False, 'is_manager': True, 'is_active': True,
+            }),
+            dict(format_user(user2), membership={
+                'comments': 'Tender', 'is_tender': True, 'is_planner': False, 'is_manager': False, 'is_active': True,
+            }),
+        ]
+        self.send_and_compare_request('user.list', [], expected_result)
+        self.send_and_compare_request('user.list', [None, 1], expected_result[:1])
+        self.send_and_compare_request('user.list', [user1.pk], expected_result[1:])
+
+        # Users without a membership of the current organization are left out
+        self.login(username=user1.username, password=self.data['password1'],
+                   organization_slug=self.data['organization2'].slug)
+        self.send_and_compare_request('user.list', [], [])
+
+    def test_user_list_queries(self):
+        # Load the current organization into its cache
+        self.send_request('organization.current.get', [])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(self.get_users()), 2)
+        count = len(queries)
+
+        for i in range(5):
+            user = User.objects.create(username='member%d' % i)
+            AuthenticationData.objects.create(user=user, backend=OIDC_BACKEND_NAME, username='member%d' % i)
+            Membership.objects.create(user=user, organization=self.data['organization1'])
+        with CaptureQueriesContext(connection) as queries:
+            users = self.get_users()
+        self.assertEqual(len(users), 7)
+        self.assertEqual(len(queries), count)
+        self.assertEqual(users[-1]['radius_username'], 'member4')
+
+    def test_user_list_invalid_limit(self):
+        self.send_and_compare_request_error('user.list', [None, 1001], error_code=-32602,
+                                            error_message='limit must be between 1 and 1000')
+
+
+class RolesTest(APITestCase):
+    def test_roles_single_query(self):
+        user2 = User.objects.get(pk=self.data['user2'].pk)
+        organization1, organization2 = self.data['organization1'], self.data['organization2']
+        Membership.objects.create(user=user2, organization=organization1, is_tender=True, is_planner=True)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(user2.profile.is_tender(organization1))
+            self.assertTrue(user2.profile.is_planner(organization1))
+            self.assertFalse(user2.profile.is_manager(organization1))
+            self.assertFalse(user2.profile.is_tender(organization2))
+            self.assertFalse(user2.profile.is_manager(None))
+        # One query for the profile, one for the memberships
+        self.assertEqual(len(queries), 2)
+
+    def test_roles_cached(self):
+        organization1, organization2 = self.data['organization1'], self.data['organization2']
+        Membership.objects.create(user=self.data['user2'], organization=organization1, is_tender=True,
+                                  is_planner=True)
+        self.assertTrue(User.objects.get(pk=self.data['user2'].pk).profile.is_tender(organization1))
+
+        user2 = User.objects.select_related('profile').get(pk=self.data['user2'].pk)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(user2.profile.is_tender(organization1))
+            self.assertTrue(user2.profile.is_planner(organization1))
+            self.assertFalse(user2.profile.is_manager(organization1))
+            self.assertFalse(user2.profile.is_tender(organization2))
+            self.assertFalse(user2.profile.is_manager(None))
+        # The roles of another request are served from the cache
+        self.assertEqual(len(queries), 0)
+
+    def test_roles_cleared_on_membership_change(self):
+        user2 = User.objects.get(pk=self.data['user2'].pk)
+        organization1 = self.data['organization1']
+        self.assertFalse(user2.profile.is_manager(organization1))
+
+        membership = user2.membership_set.create(organization=organization1, is_manager=True)
+        self.assertTrue(user2.profile.is_manager(organization1))
+
+        membership.delete()
+        self.assertFalse(user2.profile.is_manager(organization1))
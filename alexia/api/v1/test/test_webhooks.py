@@ -0,0 +1,134 @@
+import hmac
+import json
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import StringIO
+
+from django.core.management import call_command
+from django.utils import timezone
+
+from alexia.apps.billing.models import (
+    Order, WebhookDelivery, WriteoffCategory, WriteOffOrder,
+)
+from alexia.apps.billing.webhooks import WebhookWorker, sign
+from alexia.test import TestCase
+
+
+class WebhookStub(object):
+    """
+    Local HTTP server that receives webhook requests.
+    """
+
+    def __init__(self, status=200):
+        self.status = status
+        self.requests = []
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                stub.requests.append((dict(self.headers), body))
+                self.send_response(stub.status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%s/hook' % self.server.server_port
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class WebhookTest(TestCase):
+    def setUp(self):
+        super(WebhookTest, self).setUp()
+        self.load_organization_data()
+        self.load_billing_data()
+        self.load_scheduling_data()
+
+        self.stub = WebhookStub()
+        self.addCleanup(self.stub.close)
+
+        self.organization = self.data['organization1']
+        self.organization.webhook_url = self.stub.url
+        self.organization.webhook_secret = 's3cret'
+        self.organization.save()
+        self.data['authorization1'].organization = self.organization
+
+    def test_no_webhook(self):
+        self.organization.webhook_url = None
+        self.organization.save()
+        self.load_billing_order_data()
+
+        self.assertFalse(WebhookDelivery.objects.exists())
+
+    def test_deliver(self):
+        self.load_billing_order_data()
+        self.assertEqual(WebhookDelivery.objects.count(), 2)
+
+        self.assertEqual(WebhookWorker().run_once(), (2, 0))
+        self.assertEqual(WebhookWorker().run_once(), (0, 0))
+
+        self.assertEqual(len(self.stub.requests), 1)
+        headers, body = self.stub.requests[0]
+        signature = sign('s3cret', int(headers['X-Alexia-Timestamp']), body)
+        self.assertTrue(hmac.compare_digest(headers['X-Alexia-Signature'], signature))
+
+        events = json.loads(body.decode())['events']
+        self.assertEqual([e['type'] for e in events], ['order.created', 'order.created'])
+        self.assertEqual([e['data']['id'] for e in events], [self.data['order1'].pk, self.data['order2'].pk])
+        self.assertEqual(events[1]['data']['purchases'][1]['price'], '9.32')
+
+        self.assertEqual(Order.objects.filter(synchronized=True).count(), 2)
+        self.assertFalse(WebhookDelivery.objects.filter(delivered_at__isnull=True).exists())
+
+    def test_retry(self):
+        self.stub.status = 500
+        self.load_billing_order_data()
+
+        worker = WebhookWorker()
+        with self.assertLogs('alexia.apps.billing.webhooks', 'WARNING'):
+            self.assertEqual(worker.run_once(), (0, 2))
+        delivery = WebhookDelivery.objects.first()
+        self.assertEqual(delivery.attempts, 1)
+        self.assertEqual(delivery.last_error, 'HTTP status 500')
+        self.assertGreater(delivery.next_attempt_at, timezone.now() + timedelta(seconds=25))
+        self.assertFalse(Order.objects.filter(synchronized=True).exists())
+
+        # Not due yet
+        self.assertEqual(worker.run_once(), (0, 0))
+
+        WebhookDelivery.objects.update(next_attempt_at=timezone.now())
+        with self.assertLogs('alexia.apps.billing.webhooks', 'WARNING'):
+            self.assertEqual(worker.run_once(), (0, 2))
+        self.assertEqual(WebhookDelivery.objects.first().attempts, 2)
+        self.assertEqual(worker.get_retry_delay(2), 60)
+        self.assertEqual(worker.get_retry_delay(20), 3600)
+
+        self.stub.status = 204
+        WebhookDelivery.objects.update(next_attempt_at=timezone.now())
+        out = StringIO()
+        call_command('deliverwebhooks', '--once', stdout=out)
+        self.assertEqual(out.getvalue(), 'Delivered 2 events, 0 failed.\n')
+        self.assertEqual(Order.objects.filter(synchronized=True).count(), 2)
+
+    def test_writeoff(self):
+        category = WriteoffCategory.objects.create(name='Staff', description='Staff drinks',
+                                                   organization=self.organization)
+        order = WriteOffOrder.create_with_purchases([('Beer', 2, 100)], event=self.data['event1'],
+                                                    added_by=self.data['user1'], writeoff_category=category)
+
+        self.assertEqual(WebhookWorker().run_once(), (1, 0))
+        event = json.loads(self.stub.requests[0][1].decode())['events'][0]
+        self.assertEqual(event['type'], 'writeoff.created')
+        self.assertEqual(event['data']['id'], order.pk)
+        self.assertEqual(event['data']['category'], {'id': category.pk, 'name': 'Staff'})
+        self.assertEqual(Decimal(event['data']['amount']), Decimal('1.00'))
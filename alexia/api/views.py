@@ -1,5 +1,30 @@
-from django.views.generic.base import TemplateView
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+from django.views.generic.base import TemplateView, View
+
+from alexia.api import metrics
 
 
 class APIInfoView(TemplateView):
     template_name = 'api/info.html'
+
+
+class MetricsView(View):
+    """
+    Export the API metrics in the Prometheus text format.
+
+    Scrapers authenticate with the API_METRICS_TOKEN setting as bearer token, superusers can view the metrics as well.
+    """
+
+    def get(self, request):
+        if not metrics.enabled():
+            raise Http404('API metrics are disabled')
+
+        token = getattr(settings, 'API_METRICS_TOKEN', None)
+        authorization = request.headers.get('Authorization', '')
+        if not (request.user.is_superuser or
+                (token and constant_time_compare(authorization, 'Bearer %s' % token))):
+            return HttpResponse('Forbidden', status=403, content_type='text/plain')
+
+        return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,209 @@
+"""
+Compiled per-event price catalog for the Juliana point of sale.
+
+The catalog maps every product that can show up at an event to its leaf type, name, price (in cents) and whether it
+may be sold at that event. It is built in two queries and cached until one of the prices or products it was built
+from changes.
+
+The bootstrap data of the point of sale combines the catalog with the write-off categories and settings, under a
+content hash that clients can use to poll for changes.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from alexia.core import cache
+from alexia.core.cache import bump_version, versioned_key
+
+from alexia.apps.organization.models import Organization
+
+from .models import (
+    PermanentProduct, Product, SellingPrice, TemporaryProduct,
+    WriteoffCategory,
+)
+
+PERMANENT = 'permanent'
+TEMPORARY = 'temporary'
+
+
+def _pricegroup_namespace(pricegroup_id):
+    return 'billing:pricegroup:%s' % pricegroup_id
+
+
+def _organization_namespace(organization_id):
+    return 'billing:organization:%s' % organization_id
+
+
+def _event_namespace(event_id):
+    return 'billing:event:%s' % event_id
+
+
+def _writeoff_namespace(organization_id):
+    return 'billing:writeoffcategories:%s' % organization_id
+
+
+class EventCatalog(object):
+    """
+    Snapshot of the products and prices of a single event.
+    """
+
+    def __init__(self, event_id, products):
+        self.event_id = event_id
+        self.products = products
+        """ Dict product id -> product data """
+        self.version = hashlib.sha1(
+            json.dumps(sorted(products.items()), sort_keys=True).encode('utf-8')
+        ).hexdigest()
+        """ Content hash, changes whenever a product or price in the catalog changes. """
+
+    @classmethod
+    def build(cls, event):
+        prices = {}
+        if event.pricegroup_id:
+            prices = dict(
+                SellingPrice.objects.filter(pricegroup_id=event.pricegroup_id).values_list('productgroup_id', 'price')
+            )
+
+        rows = Product.objects.filter(
+            Q(permanentproduct__organization_id=event.organizer_id) | Q(temporaryproduct__event_id=event.pk)
+        ).values(
+            'id', 'name', 'shortcut', 'text_color', 'background_color',
+            'permanentproduct__productgroup_id', 'permanentproduct__position', 'temporaryproduct__price',
+        )
+
+        products = {}
+        for row in rows:
+            if row['temporaryproduct__price'] is not None:
+                leaf_type = TEMPORARY
+                price = row['temporaryproduct__price']
+                position = None
+            else:
+                leaf_type = PERMANENT
+                price = prices.get(row['permanentproduct__productgroup_id'])
+                position = row['permanentproduct__position']
+
+            products[row['id']] = {
+                'id': row['id'],
+                'type': leaf_type,
+                'name': row['name'],
+                'shortcut': row['shortcut'].upper(),
+                'text_color': row['text_color'],
+                'background_color': row['background_color'],
+                'position': position,
+                'price': int(price * 100) if price is not None else None,
+                'allowed': price is not None,
+            }
+
+        return cls(event.pk, products)
+
+    def get(self, product_id):
+        """
+        Return the product data for the given product id or None if the product is not part of this catalog.
+        """
+        try:
+            return self.products.get(int(product_id))
+        except (TypeError, ValueError):
+            return None
+
+    def product_list(self):
+        """
+        Return the products that may be sold, permanent products by position followed by temporary products.
+        """
+        allowed = [p for p in self.products.values() if p['allowed']]
+        permanent = sorted((p for p in allowed if p['type'] == PERMANENT), key=lambda p: (p['position'], p['id']))
+        temporary = sorted((p for p in allowed if p['type'] == TEMPORARY), key=lambda p: p['id'])
+        return permanent + temporary
+
+
+def _catalog_key(event):
+    return versioned_key(
+        'billing:catalog:%s:%s' % (event.pk, event.pricegroup_id),
+        _pricegroup_namespace(event.pricegroup_id),
+        _organization_namespace(event.organizer_id),
+        _event_namespace(event.pk),
+    )
+
+
+def get_event_catalog(event):
+    """
+    Return the (cached) catalog for the given event.
+
+    The cache key contains the price group of the event, so changing the price group of an event results in a
+    new catalog right away.
+    """
+    return cache.get_or_set(_catalog_key(event), lambda: EventCatalog.build(event))
+
+
+def _bootstrap_key(event):
+    return versioned_key(
+        'billing:bootstrap:%s:%s' % (event.pk, event.pricegroup_id),
+        _pricegroup_namespace(event.pricegroup_id),
+        _organization_namespace(event.organizer_id),
+        _event_namespace(event.pk),
+        _writeoff_namespace(event.organizer_id),
+    )
+
+
+def get_event_bootstrap(event):
+    """
+    Return the (cached) bootstrap data of the point of sale for the given event.
+
+    The data contains the products that may be sold, the active write-off categories and the countdown, together
+    with a version that changes whenever any of them changes.
+    """
+    key = _bootstrap_key(event)
+    bootstrap = cache.get(key)
+    if bootstrap is None:
+        writeoff = event.organizer.writeoff_enabled
+        bootstrap = {
+            'products': [
+                {
+                    'id': p['id'],
+                    'name': p['name'],
+                    'price': p['price'],
+                    'shortcut': p['shortcut'],
+                    'text_color': p['text_color'],
+                    'background_color': p['background_color'],
+                }
+                for p in get_event_catalog(event).product_list()
+            ],
+            'writeoff': writeoff,
+            'writeoff_categories': list(
+                WriteoffCategory.objects.filter(organization_id=event.organizer_id, is_active=True)
+                .order_by('pk').values('id', 'name', 'description', 'color')
+            ) if writeoff else [],
+            'countdown': getattr(settings, 'JULIANA_COUNTDOWN', 5),
+        }
+        bootstrap['version'] = hashlib.sha1(json.dumps(bootstrap, sort_keys=True).encode('utf-8')).hexdigest()
+        cache.set(key, bootstrap)
+    return bootstrap
+
+
+@receiver([post_save, post_delete], sender=SellingPrice, dispatch_uid='billing_catalog_sellingprice')
+def sellingprice_changed(sender, instance, **kwargs):
+    bump_version(_pricegroup_namespace(instance.pricegroup_id))
+
+
+@receiver([post_save, post_delete], sender=PermanentProduct, dispatch_uid='billing_catalog_permanentproduct')
+def permanentproduct_changed(sender, instance, **kwargs):
+    bump_version(_organization_namespace(instance.organization_id))
+
+
+@receiver([post_save, post_delete], sender=TemporaryProduct, dispatch_uid='billing_catalog_temporaryproduct')
+def temporaryproduct_changed(sender, instance, **kwargs):
+    if instance.event_id:
+        bump_version(_event_namespace(instance.event_id))
+
+
+@receiver([post_save, post_delete], sender=WriteoffCategory, dispatch_uid='billing_catalog_writeoffcategory')
+def writeoffcategory_changed(sender, instance, **kwargs):
+    bump_version(_writeoff_namespace(instance.organization_id))
+
+
+@receiver(post_save, sender=Organization, dispatch_uid='billing_catalog_organization')
+def organization_changed(sender, instance, **kwargs):
+    bump_version(_writeoff_namespace(instance.pk))
@@ -0,0 +1,50 @@
+"""
+Formatting of orders as plain dicts, shared by the API and the webhooks.
+"""
+from alexia.apps.billing.models import Purchase
+
+
+def format_order_values(orders):
+    """
+    Format orders like the format_order function of the API, with one query for the orders and one for all of their
+    purchases.
+
+    :param orders: Order queryset, sliced to the page that must be formatted.
+    :return: List of formatted orders, in the order of the queryset.
+    """
+    rows = list(orders.values(
+        'id', 'rfidcard__identifier', 'event_id', 'event__name', 'authorization_id', 'authorization__user_id',
+        'authorization__user__username', 'authorization__start_date', 'authorization__end_date', 'placed_at',
+        'synchronized',
+    ))
+
+    purchases = {}
+    for p in Purchase.objects.filter(order_id__in=[row['id'] for row in rows]).order_by('pk') \
+            .values('order_id', 'product', 'amount', 'price'):
+        purchases.setdefault(p['order_id'], []).append({
+            'product': {
+                'id': -1,
+                'name': p['product'],
+            },
+            'amount': p['amount'],
+            'price': p['price'],
+        })
+
+    return [{
+        'id': row['id'],
+        'rfid': row['rfidcard__identifier'],
+        'event': {
+            'id': row['event_id'],
+            'name': row['event__name'],
+        },
+        'authorization': {
+            'id': row['authorization_id'],
+            'user': row['authorization__user__username'],
+            'user_id': row['authorization__user_id'],
+            'start_date': row['authorization__start_date'].isoformat(),
+            'end_date': row['authorization__end_date'].isoformat() if row['authorization__end_date'] else None,
+        },
+        'placed_at': row['placed_at'].isoformat(),
+        'synchronized': row['synchronized'],
+        'purchases': purchases.get(row['id'], []),
+    } for row in rows]
@@ -31,7 +31,7 @@ class Command(BaseCommand):
             raise CommandError('Second argument is not an integer.')
 
         try:
-            event = Event.objects.get(pk=event_pk)
+            event = Event.objects.select_related('organizer').get(pk=event_pk)
         except Event.DoesNotExist:
             raise CommandError('Event not found.')
 
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from alexia.apps.billing.webhooks import WebhookWorker
+
+
+class Command(BaseCommand):
+    help = 'Send new orders and writeoff orders to the webhooks of their organizations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Send the due deliveries once and exit.')
+        parser.add_argument('--batch-size', type=int, default=None, help='Maximum number of events per batch.')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Seconds to wait when there are no due deliveries.')
+
+    def handle(self, *args, **options):
+        worker = WebhookWorker(batch_size=options['batch_size'])
+
+        while True:
+            delivered, failed = worker.run_once()
+            if delivered or failed:
+                self.stdout.write('Delivered %d events, %d failed.' % (delivered, failed))
+            if options['once'] and not delivered:
+                # Keep going while batches are full, so --once sends everything that is due
+                break
+            if not delivered and not failed:
+                time.sleep(options['interval'])
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from alexia.apps.billing.models import EventBillingSummary
+
+
+class Command(BaseCommand):
+    help = 'Rebuild and freeze the billing summaries of events that can no longer be opened'
+
+    def handle(self, *args, **options):
+        count = EventBillingSummary.freeze_closed()
+        self.stdout.write('Froze %d billing summaries.' % count)
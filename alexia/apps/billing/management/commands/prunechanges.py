@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from alexia.apps.billing.models import ChangeLogEntry, IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = 'Delete change log entries and idempotency keys older than the retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Retention period in days, defaults to the CHANGELOG_RETENTION_DAYS setting.')
+
+    def handle(self, *args, **options):
+        # Entries of a writer that stopped before it could assign their sequences
+        ChangeLogEntry.assign_sequences()
+        count = ChangeLogEntry.prune(options['days'])
+        self.stdout.write('Deleted %d change log entries.' % count)
+        count = IdempotencyKey.prune(options['days'])
+        self.stdout.write('Deleted %d idempotency keys.' % count)
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from alexia.apps.billing.models import EventUserSpend
+from alexia.apps.scheduling.models import Event
+
+
+class Command(BaseCommand):
+    help = 'Recalculate the spend of users at events from their orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('event_ids', nargs='*', type=int,
+                            help='Events to recalculate, all events with orders if omitted.')
+
+    def handle(self, *args, **options):
+        event_ids = options['event_ids']
+        if not event_ids:
+            event_ids = Event.objects.filter(orders__isnull=False).distinct().values_list('pk', flat=True)
+
+        count = 0
+        for event_id in event_ids:
+            count += EventUserSpend.rebuild_event(event_id)
+        self.stdout.write('Recalculated %d spend rows.' % count)
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:10
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def fill_event_user_spend(apps, schema_editor):
+    """
+    Calculate the spend of every user at every event from the existing orders.
+    """
+    Order = apps.get_model('billing', 'Order')
+    EventUserSpend = apps.get_model('billing', 'EventUserSpend')
+    totals = Order.objects.values('event_id', 'authorization__user_id').annotate(total=Sum('amount')).order_by()
+    EventUserSpend.objects.bulk_create([
+        EventUserSpend(event_id=row['event_id'], user_id=row['authorization__user_id'], amount=row['total'])
+        for row in totals
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0021_idempotencykey_writeoff_order'),
+        ('scheduling', '0022_auto_20241001_1357'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventUserSpend',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15, verbose_name='amount')),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='user_spends', to='scheduling.event', verbose_name='event')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='event_spends', to=settings.AUTH_USER_MODEL, verbose_name='user')),
+            ],
+            options={
+                'verbose_name': 'event spend',
+                'verbose_name_plural': 'event spends',
+                'unique_together': {('event', 'user')},
+            },
+        ),
+        migrations.RunPython(fill_event_user_spend, migrations.RunPython.noop),
+    ]
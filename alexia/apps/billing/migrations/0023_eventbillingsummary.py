@@ -0,0 +1,80 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:13
+
+import django.db.models.deletion
+from decimal import Decimal
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+
+def fill_event_billing_summary(apps, schema_editor):
+    """
+    Calculate the billing summary of every event from the existing orders. Summaries of events that closed are
+    frozen right away.
+    """
+    Event = apps.get_model('scheduling', 'Event')
+    Order = apps.get_model('billing', 'Order')
+    Purchase = apps.get_model('billing', 'Purchase')
+    WriteOffOrder = apps.get_model('billing', 'WriteOffOrder')
+    EventBillingSummary = apps.get_model('billing', 'EventBillingSummary')
+
+    summaries = {}
+    for row in Order.objects.values('event_id').annotate(
+        order_count=Count('pk'),
+        visitors=Count('authorization', distinct=True),
+        revenue=Sum('amount'),
+    ).order_by():
+        summaries[row['event_id']] = EventBillingSummary(
+            event_id=row['event_id'],
+            order_count=row['order_count'],
+            visitors=row['visitors'],
+            revenue=row['revenue'] or 0,
+        )
+
+    for row in WriteOffOrder.objects.values('event_id').annotate(count=Count('pk')).order_by():
+        summary = summaries.setdefault(row['event_id'], EventBillingSummary(event_id=row['event_id']))
+        summary.writeoff_order_count = row['count']
+
+    for row in Purchase.objects.values('order__event_id', 'product') \
+            .annotate(amount=Sum('amount'), price=Sum('price')).order_by():
+        summaries[row['order__event_id']].products[row['product']] = [row['amount'], int(row['price'] * 100)]
+
+    closed = set(Event.objects.filter(
+        pk__in=summaries.keys(),
+        ends_at__lt=timezone.now() - timedelta(hours=24),
+    ).values_list('pk', flat=True))
+    for summary in summaries.values():
+        summary.is_frozen = summary.event_id in closed
+
+    EventBillingSummary.objects.bulk_create(summaries.values(), batch_size=500)
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0022_eventuserspend'),
+        ('scheduling', '0022_auto_20241001_1357'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventBillingSummary',
+            fields=[
+                ('event', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='billing_summary', serialize=False, to='scheduling.event', verbose_name='event')),
+                ('order_count', models.PositiveIntegerField(default=0, verbose_name='order count')),
+                ('writeoff_order_count', models.PositiveIntegerField(default=0, verbose_name='writeoff order count')),
+                ('visitors', models.PositiveIntegerField(default=0, verbose_name='visitors')),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15, verbose_name='revenue')),
+                ('products', models.JSONField(default=dict, verbose_name='products')),
+                ('is_frozen', models.BooleanField(default=False, verbose_name='is frozen')),
+            ],
+            options={
+                'verbose_name': 'event billing summary',
+                'verbose_name_plural': 'event billing summaries',
+            },
+        ),
+        migrations.RunPython(fill_event_billing_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:00
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0023_eventbillingsummary'),
+        ('organization', '0027_organization_card_registration_url'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogEntry',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('model', models.CharField(choices=[('order', 'order'), ('authorization', 'authorization'), ('rfidcard', 'RFID card')], max_length=16, verbose_name='model')),
+                ('object_id', models.PositiveIntegerField(verbose_name='object id')),
+                ('action', models.CharField(choices=[('saved', 'saved'), ('deleted', 'deleted')], max_length=8, verbose_name='action')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='created at')),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='organization.organization', verbose_name='organization')),
+            ],
+            options={
+                'verbose_name': 'change log entry',
+                'verbose_name_plural': 'change log entries',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['organization', 'id'], name='billing_cha_organiz_f58e00_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:20
+
+from django.db import migrations
+
+
+def create_missing_summaries(apps, schema_editor):
+    """
+    Create an empty billing summary for every event without orders, new orders only add to an existing summary.
+    """
+    Event = apps.get_model('scheduling', 'Event')
+    EventBillingSummary = apps.get_model('billing', 'EventBillingSummary')
+
+    events = Event.objects.filter(billing_summary__isnull=True).values_list('pk', flat=True)
+    EventBillingSummary.objects.bulk_create([EventBillingSummary(event_id=pk) for pk in events], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0026_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_missing_summaries, migrations.RunPython.noop),
+    ]
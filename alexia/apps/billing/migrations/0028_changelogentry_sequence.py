@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:09
+
+from django.db import migrations, models
+from django.db.models import F, Max
+
+
+def assign_sequences(apps, schema_editor):
+    """
+    Use the ids of the existing entries as their sequence, so the cursors of consumers stay valid.
+    """
+    ChangeLogEntry = apps.get_model('billing', 'ChangeLogEntry')
+    Counter = apps.get_model('general', 'Counter')
+
+    ChangeLogEntry.objects.update(sequence=F('id'))
+    last = ChangeLogEntry.objects.aggregate(last=Max('id'))['last'] or 0
+    Counter.objects.update_or_create(name='billing:changelog', defaults={'value': last})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0027_create_missing_summaries'),
+        ('general', '0003_counter'),
+        ('organization', '0028_organization_webhook'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='changelogentry',
+            name='sequence',
+            field=models.BigIntegerField(blank=True, null=True, unique=True, verbose_name='sequence'),
+        ),
+        migrations.AddIndex(
+            model_name='changelogentry',
+            index=models.Index(fields=['organization', 'sequence'], name='billing_cha_organiz_c80040_idx'),
+        ),
+        migrations.RunPython(assign_sequences, migrations.RunPython.noop),
+    ]
@@ -1,17 +1,24 @@
 from __future__ import unicode_literals
 
 from collections import defaultdict
+from datetime import timedelta
 from decimal import Decimal
 
 from django.conf import settings
-from django.db import models, transaction
-from django.db.models import Q
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, Count, F, Max, OuterRef, Q, Subquery, Sum, When
+from django.db.models.functions import Coalesce
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete,
+)
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from alexia.apps.general.models import Counter
 from alexia.apps.organization.models import Organization
 from alexia.apps.scheduling.models import Event
+from alexia.core.routers import use_primary
 from alexia.core.validators import validate_color
 
 
@@ -67,6 +74,7 @@ class SellingPrice(models.Model):
     pricegroup = models.ForeignKey(PriceGroup, verbose_name=_('price group'), on_delete=models.CASCADE)
     productgroup = models.ForeignKey(ProductGroup, verbose_name=_('product group'), on_delete=models.CASCADE)
     price = models.DecimalField(_('price'), max_digits=15, decimal_places=2)
+    updated_at = models.DateTimeField(_('updated at'), auto_now=True)
 
     class Meta:
         unique_together = ('pricegroup', 'productgroup')
@@ -100,6 +108,7 @@ class Product(models.Model):
         max_length=6,
         validators=[validate_color],
     )
+    updated_at = models.DateTimeField(_('updated at'), auto_now=True)
 
     def __str__(self):
         return self.name
@@ -247,10 +256,7 @@ class Authorization(models.Model):
             start_date__lte=timezone.now(),
         )
 
-        if authorizations:
-            return authorizations[0]
-        else:
-            return None
+        return authorizations.first()
 
     def is_valid(self):
         if not self.end_date:
@@ -283,6 +289,7 @@ class Order(models.Model):
     )
     amount = models.DecimalField(_('amount'), max_digits=15, decimal_places=2)
     rfidcard = models.ForeignKey(RfidCard, models.SET_NULL, verbose_name=_('rfid card'), blank=True, null=True)
+    updated_at = models.DateTimeField(_('updated at'), auto_now=True)
 
     class Meta:
         ordering = ['-placed_at']
@@ -297,14 +304,39 @@ class Order(models.Model):
         )
 
     def save(self, *args, **kwargs):
-        with transaction.atomic():
-            # Set amount to 0, save the order, and then update the amount.
-            # This needs to be done in 2 steps because the get_price() method uses a
-            # relationship that can only be used after the model has been saved
-            self.amount = Decimal('0.0')
-            super(Order, self).save(*args, **kwargs)
-            self.amount = self.get_price()
+        # A new order has no purchases yet, so its amount is 0. The get_price() method
+        # uses a relationship that can only be used after the model has been saved.
+        adding = self._state.adding
+        self.amount = Decimal('0.0') if adding else self.get_price()
+        with transaction.atomic(savepoint=False):
             super(Order, self).save(*args, **kwargs)
+            if adding:
+                EventBillingSummary.add_order(self)
+            else:
+                # The purchases may have changed, which is only known from the database
+                EventUserSpend.rebuild(self.event_id, self.authorization.user_id)
+                EventBillingSummary.rebuild(self.event_id)
+
+    @classmethod
+    def create_with_purchases(cls, purchases, **kwargs):
+        """
+        Create an order and all of its purchases with one insert for the order and one for the purchases.
+
+        :param purchases: List of validated (product name, amount, price in cents) tuples.
+        :param kwargs: Field values for the order.
+        :return: The created order.
+        """
+        order = cls(amount=Decimal(sum(price for _, _, price in purchases)) / 100, **kwargs)
+        with transaction.atomic(savepoint=False):
+            # Skip save(), the amount is already known
+            super(Order, order).save(force_insert=True)
+            Purchase.objects.bulk_create([
+                Purchase(order=order, product=name, amount=amount, price=Decimal(price) / 100)
+                for name, amount, price in purchases
+            ])
+            EventUserSpend.add(order.event_id, order.authorization.user_id, order.amount)
+            EventBillingSummary.add_order(order)
+        return order
 
     def get_price(self):
         amount = Decimal('0.0')
@@ -376,14 +408,34 @@ class WriteOffOrder(models.Model):
         )
 
     def save(self, *args, **kwargs):
-        with transaction.atomic():
-            # Set amount to 0, save the order, and then update the amount.
-            # This needs to be done in 2 steps because the get_price() method uses a
-            # relationship that can only be used after the model has been saved
-            self.amount = Decimal('0.0')
-            super(WriteOffOrder, self).save(*args, **kwargs)
-            self.amount = self.get_price()
+        # A new order has no purchases yet, so its amount is 0. The get_price() method
+        # uses a relationship that can only be used after the model has been saved.
+        adding = self._state.adding
+        self.amount = Decimal('0.0') if adding else self.get_price()
+        with transaction.atomic(savepoint=False):
             super(WriteOffOrder, self).save(*args, **kwargs)
+            if adding:
+                EventBillingSummary.add_writeoff_order(self)
+
+    @classmethod
+    def create_with_purchases(cls, purchases, **kwargs):
+        """
+        Create a writeoff order and all of its purchases with one insert for the order and one for the purchases.
+
+        :param purchases: List of validated (product name, amount, price in cents) tuples.
+        :param kwargs: Field values for the writeoff order.
+        :return: The created writeoff order.
+        """
+        order = cls(amount=Decimal(sum(price for _, _, price in purchases)) / 100, **kwargs)
+        with transaction.atomic(savepoint=False):
+            # Skip save(), the amount is already known
+            super(WriteOffOrder, order).save(force_insert=True)
+            WriteOffPurchase.objects.bulk_create([
+                WriteOffPurchase(order=order, product=name, amount=amount, price=Decimal(price) / 100)
+                for name, amount, price in purchases
+            ])
+            EventBillingSummary.add_writeoff_order(order)
+        return order
 
     def get_price(self):
         amount = Decimal('0.0')
@@ -425,3 +477,501 @@ class WriteOffPurchase(models.Model):
 
         # Convert defaultdict to a regular dict for easier template use
         return dict(grouped_writeoff_products)
+
+
+class IdempotencyKey(models.Model):
+    key = models.CharField(_('key'), max_length=64, unique=True)
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='+', verbose_name=_('event'))
+    order = models.ForeignKey(
+        Order,
+        on_delete=models.CASCADE,
+        null=True,
+        related_name='+',
+        verbose_name=_('order'),
+    )
+    writeoff_order = models.ForeignKey(
+        WriteOffOrder,
+        on_delete=models.CASCADE,
+        null=True,
+        related_name='+',
+        verbose_name=_('writeoff order'),
+    )
+    created_at = models.DateTimeField(_('created at'), default=timezone.now)
+
+    class Meta:
+        verbose_name = _('idempotency key')
+        verbose_name_plural = _('idempotency keys')
+
+    def __str__(self):
+        return self.key
+
+    @classmethod
+    def prune(cls, days=None):
+        """
+        Delete the keys older than the retention period, after which a retry is saved as a new order.
+        :param days: Retention period in days, defaults to the CHANGELOG_RETENTION_DAYS setting.
+        :return: Number of deleted keys.
+        """
+        if days is None:
+            days = getattr(settings, 'CHANGELOG_RETENTION_DAYS', 30)
+        count, _deleted = cls.objects.filter(created_at__lt=timezone.now() - timedelta(days=days)).delete()
+        return count
+
+
+class EventUserSpend(models.Model):
+    """
+    Running total of the orders of a user at an event.
+
+    Kept up to date in the same transaction as the orders, so the spend of a user at an event is a single row read.
+    """
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='user_spends', verbose_name=_('event'))
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='event_spends',
+        verbose_name=_('user'),
+    )
+    amount = models.DecimalField(_('amount'), max_digits=15, decimal_places=2, default=Decimal('0.00'))
+
+    class Meta:
+        unique_together = ('event', 'user')
+        verbose_name = _('event spend')
+        verbose_name_plural = _('event spends')
+
+    def __str__(self):
+        return _('{user} at {event}').format(user=self.user.get_full_name(), event=self.event.name)
+
+    @classmethod
+    def add(cls, event_id, user_id, amount):
+        """
+        Atomically add the given amount to the spend of a user at an event.
+        """
+        if cls.objects.filter(event_id=event_id, user_id=user_id).update(amount=F('amount') + amount):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(event_id=event_id, user_id=user_id, amount=amount)
+        except IntegrityError:
+            # Created by a concurrent order
+            cls.objects.filter(event_id=event_id, user_id=user_id).update(amount=F('amount') + amount)
+
+    @classmethod
+    @use_primary()
+    def rebuild(cls, event_id, user_id):
+        """
+        Recalculate the spend of a user at an event from the orders.
+        """
+        amount = Order.objects.filter(event_id=event_id, authorization__user_id=user_id) \
+            .aggregate(total=Sum('amount'))['total']
+        if amount is None:
+            cls.objects.filter(event_id=event_id, user_id=user_id).delete()
+        else:
+            cls.objects.update_or_create(event_id=event_id, user_id=user_id, defaults={'amount': amount})
+
+    @classmethod
+    @use_primary()
+    def rebuild_event(cls, event_id):
+        """
+        Recalculate the spend of all users at an event from the orders.
+
+        :param event_id: Id of the event.
+        :return: Number of spend rows written.
+        """
+        totals = Order.objects.filter(event_id=event_id) \
+            .values('authorization__user_id') \
+            .annotate(total=Sum('amount')) \
+            .order_by()
+        with transaction.atomic():
+            cls.objects.filter(event_id=event_id).delete()
+            spends = cls.objects.bulk_create([
+                cls(event_id=event_id, user_id=row['authorization__user_id'], amount=row['total'])
+                for row in totals
+            ])
+        return len(spends)
+
+
+class EventBillingSummary(models.Model):
+    """
+    Materialized billing totals of an event.
+
+    New orders and write-off orders add to the counters with a single update once they are committed, so the row lock
+    of the update is not held for the rest of the order transaction. Changed and deleted orders rebuild the summary
+    from the orders. The number of visitors is counted from the orders when the summary is read, and only stored by a
+    rebuild. Once the event is closed, the freezesummaries command rebuilds the summary and stores the totals per
+    product. Later changes to the orders of the event rebuild the frozen summary.
+    """
+    event = models.OneToOneField(
+        Event,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='billing_summary',
+        verbose_name=_('event'),
+    )
+    order_count = models.PositiveIntegerField(_('order count'), default=0)
+    writeoff_order_count = models.PositiveIntegerField(_('writeoff order count'), default=0)
+    visitors = models.PositiveIntegerField(_('visitors'), default=0)
+    revenue = models.DecimalField(_('revenue'), max_digits=15, decimal_places=2, default=Decimal('0.00'))
+    products = models.JSONField(_('products'), default=dict)
+    """ Dict product name -> [amount, price in cents], only filled once the summary is frozen """
+    is_frozen = models.BooleanField(_('is frozen'), default=False)
+    updated_at = models.DateTimeField(_('updated at'), auto_now=True)
+
+    class Meta:
+        verbose_name = _('event billing summary')
+        verbose_name_plural = _('event billing summaries')
+
+    def __str__(self):
+        return str(self.event)
+
+    @classmethod
+    def _increment(cls, event_id, **increments):
+        """
+        Add the given values to the counters of the summary of an event.
+
+        A frozen summary, or a summary of an event that has not been migrated, is rebuilt from the orders instead.
+        """
+        values = {name: F(name) + value for name, value in increments.items()}
+        if not cls.objects.filter(event_id=event_id, is_frozen=False).update(updated_at=timezone.now(), **values):
+            cls.rebuild(event_id)
+
+    @classmethod
+    def add_order(cls, order):
+        """
+        Add a new order to the summary of its event, once the order is committed.
+        """
+        event_id, amount = order.event_id, order.amount
+        transaction.on_commit(lambda: cls._increment(event_id, order_count=1, revenue=amount))
+
+    @classmethod
+    def add_writeoff_order(cls, order):
+        """
+        Add a new write-off order to the summary of its event, once the order is committed.
+        """
+        event_id = order.event_id
+        transaction.on_commit(lambda: cls._increment(event_id, writeoff_order_count=1))
+
+    @staticmethod
+    def _get_totals(event_id):
+        """
+        Return the counters of the summary of an event, calculated from its orders.
+        """
+        totals = Order.objects.filter(event_id=event_id).aggregate(
+            order_count=Count('pk'),
+            visitors=Count('authorization', distinct=True),
+            revenue=Sum('amount'),
+        )
+        return {
+            'order_count': totals['order_count'],
+            'writeoff_order_count': WriteOffOrder.objects.filter(event_id=event_id).count(),
+            'visitors': totals['visitors'],
+            'revenue': totals['revenue'] or Decimal('0.00'),
+        }
+
+    @staticmethod
+    def visitors_expression():
+        """
+        Return an expression for the number of visitors of an event, for use in Event querysets.
+        """
+        visitors = Order.objects.filter(event=OuterRef('pk')).order_by().values('event') \
+            .annotate(visitors=Count('authorization', distinct=True)).values('visitors')
+        return Case(
+            When(billing_summary__is_frozen=True, then=F('billing_summary__visitors')),
+            default=Coalesce(Subquery(visitors), 0),
+        )
+
+    @classmethod
+    @use_primary()
+    def rebuild(cls, event_id, freeze=False):
+        """
+        Recalculate the summary of an event from its orders. A frozen summary stays frozen.
+
+        :param event_id: Id of the event.
+        :param freeze: Mark the summary as final and store the totals per product.
+        :return: The summary.
+        """
+        defaults = cls._get_totals(event_id)
+        if freeze or cls.objects.filter(event_id=event_id, is_frozen=True).exists():
+            defaults['products'] = {p['product']: [p['amount'], p['price']] for p in cls._get_product_totals(event_id)}
+            defaults['is_frozen'] = True
+        summary, created = cls.objects.update_or_create(event_id=event_id, defaults=defaults)
+        return summary
+
+    @classmethod
+    def freeze_closed(cls):
+        """
+        Rebuild and freeze the summaries of the events that can no longer be opened.
+
+        :return: Number of frozen summaries.
+        """
+        event_ids = Event.objects.filter(ends_at__lt=timezone.now() - timedelta(hours=24)) \
+            .exclude(billing_summary__is_frozen=True) \
+            .values_list('pk', flat=True)
+        count = 0
+        for event_id in event_ids:
+            cls.rebuild(event_id, freeze=True)
+            count += 1
+        return count
+
+    @staticmethod
+    def _get_product_totals(event_id):
+        """
+        Return the totals per product of the orders of an event, prices in cents.
+        """
+        products = Purchase.objects.filter(order__event_id=event_id) \
+            .values('product') \
+            .annotate(amount=Sum('amount'), price=Sum('price')) \
+            .order_by()
+        return [{'product': p['product'], 'amount': p['amount'], 'price': int(p['price'] * 100)} for p in products]
+
+    @classmethod
+    def get_for_event(cls, event):
+        """
+        Return the summary of the given event, without writing to the database.
+
+        The visitors of a summary that is not frozen are counted from the orders. An event that has not been
+        migrated gets an unsaved summary calculated from its orders.
+        """
+        try:
+            summary = event.billing_summary
+        except cls.DoesNotExist:
+            summary = cls(event=event, **cls._get_totals(event.pk))
+        else:
+            if not summary.is_frozen:
+                summary.visitors = Order.objects.filter(event_id=event.pk) \
+                    .aggregate(visitors=Count('authorization', distinct=True))['visitors']
+        return summary
+
+    def product_list(self):
+        """
+        Return the totals per product, ordered by product name.
+        """
+        if self.is_frozen:
+            totals = [(name, amount, price) for name, (amount, price) in self.products.items()]
+        else:
+            totals = [(p['product'], p['amount'], p['price']) for p in self._get_product_totals(self.event_id)]
+        return [
+            {'product': name, 'amount': amount, 'price': (Decimal(price) / 100).quantize(Decimal('0.01'))}
+            for name, amount, price in sorted(totals)
+        ]
+
+
+class ChangeLogEntry(models.Model):
+    """
+    Append-only log of changes to orders, authorizations and RFID cards, per organization.
+
+    The sequence of an entry is used as cursor by consumers of the change feed. Ids are assigned when an entry is
+    written, so a transaction that commits later than a concurrent one can add entries with lower ids. Sequences are
+    assigned by assign_sequences() once an entry is committed, so they only grow in the order entries become visible.
+    The writing transaction runs it on commit, and the prunechanges command assigns any entries that were left over.
+    """
+    SEQUENCE_COUNTER = 'billing:changelog'
+
+    ORDER = 'order'
+    AUTHORIZATION = 'authorization'
+    RFIDCARD = 'rfidcard'
+    MODEL_CHOICES = (
+        (ORDER, _('order')),
+        (AUTHORIZATION, _('authorization')),
+        (RFIDCARD, _('RFID card')),
+    )
+
+    SAVED = 'saved'
+    DELETED = 'deleted'
+    ACTION_CHOICES = (
+        (SAVED, _('saved')),
+        (DELETED, _('deleted')),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    organization = models.ForeignKey(
+        Organization,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name=_('organization'),
+    )
+    model = models.CharField(_('model'), max_length=16, choices=MODEL_CHOICES)
+    object_id = models.PositiveIntegerField(_('object id'))
+    action = models.CharField(_('action'), max_length=8, choices=ACTION_CHOICES)
+    created_at = models.DateTimeField(_('created at'), default=timezone.now, db_index=True)
+    sequence = models.BigIntegerField(_('sequence'), blank=True, null=True, unique=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [models.Index(fields=['organization', 'id']), models.Index(fields=['organization', 'sequence'])]
+        verbose_name = _('change log entry')
+        verbose_name_plural = _('change log entries')
+
+    def __str__(self):
+        return '%s %s %s' % (self.model, self.object_id, self.action)
+
+    @classmethod
+    def log(cls, model, action, object_ids, organization_ids):
+        """
+        Add entries for the given objects to the log of each of the given organizations.
+        """
+        cls.objects.bulk_create([
+            cls(organization_id=organization_id, model=model, object_id=object_id, action=action)
+            for organization_id in organization_ids
+            for object_id in object_ids
+        ])
+        transaction.on_commit(cls.assign_sequences)
+
+    @classmethod
+    def assign_sequences(cls):
+        """
+        Assign the next sequences to the committed entries that do not have one yet, in order of id.
+        """
+        if not cls.objects.filter(sequence__isnull=True).exists():
+            return
+
+        with transaction.atomic():
+            # Only one transaction at a time assigns sequences, and it sees everything committed before it got the lock
+            counter = Counter.objects.select_for_update().filter(name=cls.SEQUENCE_COUNTER).first()
+            if counter is None:
+                last = cls.objects.aggregate(last=Max('sequence'))['last'] or 0
+                Counter.objects.get_or_create(name=cls.SEQUENCE_COUNTER, defaults={'value': last})
+                counter = Counter.objects.select_for_update().get(name=cls.SEQUENCE_COUNTER)
+
+            entries = list(cls.objects.filter(sequence__isnull=True).order_by('pk').only('pk'))
+            for sequence, entry in enumerate(entries, counter.value + 1):
+                entry.sequence = sequence
+            cls.objects.bulk_update(entries, ['sequence'], batch_size=500)
+            Counter.objects.filter(name=cls.SEQUENCE_COUNTER).update(value=counter.value + len(entries))
+
+    @classmethod
+    def prune(cls, days=None):
+        """
+        Delete the entries older than the retention period.
+        :param days: Retention period in days, defaults to the CHANGELOG_RETENTION_DAYS setting.
+        :return: Number of deleted entries.
+        """
+        if days is None:
+            days = getattr(settings, 'CHANGELOG_RETENTION_DAYS', 30)
+        count, _deleted = cls.objects.filter(created_at__lt=timezone.now() - timedelta(days=days)).delete()
+        return count
+
+
+class WebhookDelivery(models.Model):
+    """
+    Outbox of events that still have to be sent to the webhook of an organization.
+
+    Deliveries are written in the transaction that creates the order, and sent by the deliverwebhooks command.
+    """
+    ORDER_CREATED = 'order.created'
+    WRITEOFF_CREATED = 'writeoff.created'
+    EVENT_TYPE_CHOICES = (
+        (ORDER_CREATED, _('order created')),
+        (WRITEOFF_CREATED, _('writeoff order created')),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    organization = models.ForeignKey(
+        Organization,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name=_('organization'),
+    )
+    event_type = models.CharField(_('event type'), max_length=32, choices=EVENT_TYPE_CHOICES)
+    object_id = models.PositiveIntegerField(_('object id'))
+    created_at = models.DateTimeField(_('created at'), default=timezone.now)
+    attempts = models.PositiveIntegerField(_('attempts'), default=0)
+    next_attempt_at = models.DateTimeField(_('next attempt at'), default=timezone.now)
+    delivered_at = models.DateTimeField(_('delivered at'), blank=True, null=True)
+    last_error = models.TextField(_('last error'), blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [models.Index(fields=['delivered_at', 'next_attempt_at'])]
+        verbose_name = _('webhook delivery')
+        verbose_name_plural = _('webhook deliveries')
+
+    def __str__(self):
+        return '%s %s' % (self.event_type, self.object_id)
+
+
+def order_saved(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    ChangeLogEntry.log(ChangeLogEntry.ORDER, ChangeLogEntry.SAVED, [instance.pk],
+                       [instance.authorization.organization_id])
+    # The points of sale load the organizer together with the event, so this does not query the organization
+    if created and instance.event.organizer.webhook_url:
+        WebhookDelivery.objects.create(organization=instance.event.organizer,
+                                       event_type=WebhookDelivery.ORDER_CREATED, object_id=instance.pk)
+
+
+def writeoff_order_saved(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw and instance.event.organizer.webhook_url:
+        WebhookDelivery.objects.create(organization=instance.event.organizer,
+                                       event_type=WebhookDelivery.WRITEOFF_CREATED, object_id=instance.pk)
+
+
+def order_deleted(sender, instance, **kwargs):
+    EventUserSpend.rebuild(instance.event_id, instance.authorization.user_id)
+    EventBillingSummary.rebuild(instance.event_id)
+    ChangeLogEntry.log(ChangeLogEntry.ORDER, ChangeLogEntry.DELETED, [instance.pk],
+                       [instance.authorization.organization_id])
+
+
+def authorization_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        ChangeLogEntry.log(ChangeLogEntry.AUTHORIZATION, ChangeLogEntry.SAVED, [instance.pk],
+                           [instance.organization_id])
+
+
+def authorization_deleted(sender, instance, **kwargs):
+    ChangeLogEntry.log(ChangeLogEntry.AUTHORIZATION, ChangeLogEntry.DELETED, [instance.pk],
+                       [instance.organization_id])
+
+
+def rfidcard_saved(sender, instance, raw=False, created=False, **kwargs):
+    # A new card is not managed by any organization yet, see rfidcard_managed_by_changed
+    if not raw and not created:
+        ChangeLogEntry.log(ChangeLogEntry.RFIDCARD, ChangeLogEntry.SAVED, [instance.pk],
+                           instance.managed_by.values_list('pk', flat=True))
+
+
+def rfidcard_deleted(sender, instance, **kwargs):
+    # Runs before the delete, while the organizations managing the card are still known
+    ChangeLogEntry.log(ChangeLogEntry.RFIDCARD, ChangeLogEntry.DELETED, [instance.pk],
+                       instance.managed_by.values_list('pk', flat=True))
+
+
+def rfidcard_managed_by_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        if reverse:
+            # The instance is an organization that no longer manages any card
+            ChangeLogEntry.log(ChangeLogEntry.RFIDCARD, ChangeLogEntry.DELETED,
+                               instance.rfidcard_set.values_list('pk', flat=True), [instance.pk])
+        else:
+            ChangeLogEntry.log(ChangeLogEntry.RFIDCARD, ChangeLogEntry.DELETED, [instance.pk],
+                               instance.managed_by.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove') and pk_set:
+        change = ChangeLogEntry.SAVED if action == 'post_add' else ChangeLogEntry.DELETED
+        if reverse:
+            # The instance is an organization, pk_set contains cards
+            ChangeLogEntry.log(ChangeLogEntry.RFIDCARD, change, sorted(pk_set), [instance.pk])
+        else:
+            ChangeLogEntry.log(ChangeLogEntry.RFIDCARD, change, [instance.pk], sorted(pk_set))
+
+
+def writeoff_order_deleted(sender, instance, **kwargs):
+    EventBillingSummary.rebuild(instance.event_id)
+
+
+def event_saved(sender, instance, created=False, raw=False, **kwargs):
+    # New orders only add to the summary of their event, so it must exist
+    if created and not raw:
+        EventBillingSummary.objects.create(event=instance)
+
+
+post_delete.connect(order_deleted, Order)
+post_delete.connect(writeoff_order_deleted, WriteOffOrder)
+post_save.connect(order_saved, Order)
+post_save.connect(writeoff_order_saved, WriteOffOrder)
+post_save.connect(event_saved, Event)
+post_save.connect(authorization_saved, Authorization)
+post_delete.connect(authorization_deleted, Authorization)
+post_save.connect(rfidcard_saved, RfidCard)
+pre_delete.connect(rfidcard_deleted, RfidCard)
+m2m_changed.connect(rfidcard_managed_by_changed, RfidCard.managed_by.through)
@@ -0,0 +1,157 @@
+"""
+Event scoped cache of RFID card -> user -> authorization lookups for the Juliana point of sale.
+
+When the first card is tapped at an event that can be opened, the active cards of the users that recently ordered
+at the organizer are loaded, at most JULIANA_RESOLVER_WARM_SIZE users. After that, resolving a card costs no queries
+until the entry expires or is invalidated.
+
+Entries are kept in every process, together with the versions of the cache namespaces they depend on (see
+alexia.core.cache). Changing a card bumps the version of all cards, changing an authorization or membership the
+version of the organization, which invalidates the entries in all processes.
+"""
+import datetime
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from alexia.apps.organization.models import Membership
+from alexia.core.cache import bump_version, get_versions
+
+from .models import Authorization, Order, RfidCard
+
+CARD_NAMESPACE = 'billing:cards'
+
+
+def _authorization_namespace(organization_id):
+    return 'billing:authorizations:%s' % organization_id
+
+
+def _get_versions(event):
+    return tuple(get_versions(CARD_NAMESPACE, _authorization_namespace(event.organizer_id)))
+
+
+class CardResolver(object):
+    """
+    Thread safe LRU cache with a time to live, keyed by (event id, card identifier).
+
+    Every entry holds the active card (with its user) and the authorization to use for payments at the event, which
+    is None if the user has no valid authorization. Entries are only used while the versions they were loaded with
+    are current.
+    """
+
+    def __init__(self, max_size=None, ttl=None, warm_size=None):
+        self.max_size = max_size or getattr(settings, 'JULIANA_RESOLVER_SIZE', 10000)
+        self.ttl = ttl or getattr(settings, 'JULIANA_RESOLVER_TTL', 300)
+        self.warm_size = warm_size or getattr(settings, 'JULIANA_RESOLVER_WARM_SIZE', 500)
+        self._entries = OrderedDict()
+        self._warmed = {}
+        """ Dict event id -> (time the warm up expires, versions) """
+        self._lock = threading.Lock()
+
+    def resolve(self, event, identifier):
+        """
+        Resolve the active card with the given identifier for the given event.
+        :param event: Event.
+        :param identifier: Card identifier.
+        :return: (card, authorization) tuple, card is None if no active card exists.
+        """
+        versions = _get_versions(event)
+        self.warm(event, versions)
+
+        key = (event.pk, identifier)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, entry_versions, card, authorization = entry
+                if expires_at > now and entry_versions == versions and \
+                        (authorization is None or authorization.is_valid()):
+                    self._entries.move_to_end(key)
+                    return card, authorization
+                del self._entries[key]
+
+        try:
+            card = RfidCard.objects.select_related('user').get(identifier=identifier, is_active=True)
+        except RfidCard.DoesNotExist:
+            # Unknown cards are not cached, so a newly registered card can be used right away
+            return None, None
+
+        authorization = Authorization.get_for_user_event(card.user, event)
+        self._store(versions, [(key, card, authorization)])
+        return card, authorization
+
+    def warm(self, event, versions=None):
+        """
+        Load the active cards of the users that ordered at the organizer of the event in the last
+        JULIANA_RESOLVER_WARM_DAYS days and have a valid authorization, if the event can be opened and has not been
+        loaded recently with the current versions.
+        """
+        versions = versions or _get_versions(event)
+        now = time.monotonic()
+        with self._lock:
+            expires_at, warmed_versions = self._warmed.get(event.pk, (0, None))
+            if (expires_at > now and warmed_versions == versions) or not event.can_be_opened():
+                return
+            # Mark as warmed before loading, so concurrent requests do not load the same data
+            self._warmed[event.pk] = (now + self.ttl, versions)
+
+        since = timezone.now() - datetime.timedelta(days=getattr(settings, 'JULIANA_RESOLVER_WARM_DAYS', 60))
+        user_ids = list(Order.objects.filter(event__organizer=event.organizer_id, placed_at__gte=since)
+                        .values_list('authorization__user_id', flat=True).order_by().distinct()[:self.warm_size])
+
+        # The first authorization of every user, like Authorization.get_for_user_event()
+        authorizations = {}
+        for authorization in Authorization.objects.filter(
+            Q(end_date__isnull=True) | Q(end_date__gte=timezone.now()),
+            user__in=user_ids,
+            organization=event.organizer_id,
+            start_date__lte=timezone.now(),
+        ).order_by('pk'):
+            authorizations.setdefault(authorization.user_id, authorization)
+
+        cards = RfidCard.objects.filter(user__in=authorizations.keys(), is_active=True).select_related('user')
+
+        entries = []
+        for card in cards:
+            authorization = authorizations[card.user_id]
+            authorization.user = card.user
+            entries.append(((event.pk, card.identifier), card, authorization))
+        self._store(versions, entries)
+
+    def _store(self, versions, entries):
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for key, card, authorization in entries:
+                self._entries[key] = (expires_at, versions, card, authorization)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._warmed.clear()
+
+
+card_resolver = CardResolver()
+
+
+@receiver([post_save, post_delete], sender=RfidCard, dispatch_uid='billing_resolver_rfidcard')
+def rfidcard_changed(sender, instance, **kwargs):
+    bump_version(CARD_NAMESPACE)
+
+
+@receiver([post_save, post_delete], sender=Authorization, dispatch_uid='billing_resolver_authorization')
+def authorization_changed(sender, instance, **kwargs):
+    bump_version(_authorization_namespace(instance.organization_id))
+
+
+@receiver([post_save, post_delete], sender=Membership, dispatch_uid='billing_resolver_membership')
+def membership_changed(sender, instance, **kwargs):
+    bump_version(_authorization_namespace(instance.organization_id))
@@ -2,11 +2,12 @@ from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.exceptions import PermissionDenied
 from django.core import serializers
-from django.db.models import Count, Sum, Q
+from django.db.models import F, Sum, Q
 from django.db.models.functions import ExtractYear, TruncMonth
 from django.http import Http404, JsonResponse, HttpResponseRedirect
 from django.shortcuts import get_object_or_404, render
 from django.urls import reverse, reverse_lazy
+from django.utils import timezone
 from django.utils.dates import MONTHS
 from django.utils.translation import gettext as _
 from django.views import View
@@ -21,21 +22,24 @@ from alexia.apps.billing.forms import (
     DeletePriceGroupForm, FilterEventForm, PermanentProductForm,
     SellingPriceForm,
 )
+from alexia.apps.billing.catalog import get_event_bootstrap, get_event_catalog
 from alexia.apps.billing.models import (
     PermanentProduct, PriceGroup, Product, ProductGroup, SellingPrice,
     TemporaryProduct,
 )
 from alexia.apps.scheduling.models import Event
+from alexia.auth.grants import is_tender_for_request
 from alexia.auth.mixins import (
     DenyWrongOrganizationMixin, ManagerRequiredMixin, TenderRequiredMixin,
 )
 from alexia.forms import CrispyFormMixin
 from alexia.views import (
-    CreateViewForOrganization, EventOrganizerFilterMixin, FixedValueCreateView,
-    OrganizationFilterMixin, OrganizationFormMixin,
+    ConditionalGetMixin, CreateViewForOrganization, EventOrganizerFilterMixin,
+    FixedValueCreateView, OrganizationFilterMixin, OrganizationFormMixin,
+    ReplicaMixin,
 )
 
-from .models import Order, Purchase, WriteOffOrder, WriteOffPurchase, WriteoffCategory
+from .models import EventBillingSummary, Order, WriteOffOrder, WriteOffPurchase, WriteoffCategory
 
 class JulianaView(TenderRequiredMixin, DetailView):
     template_name = 'billing/juliana.html'
@@ -44,7 +48,7 @@ class JulianaView(TenderRequiredMixin, DetailView):
     def get(self, request, *args, **kwargs):
         self.object = self.get_object()
 
-        if not self.object.is_tender(request.user):
+        if not is_tender_for_request(request, self.object):
             raise PermissionDenied(_('You are not a tender for this event'))
         if not self.object.can_be_opened(request.user):
             raise PermissionDenied(_('This event is not open'))
@@ -56,6 +60,8 @@ class JulianaView(TenderRequiredMixin, DetailView):
         context = super(JulianaView, self).get_context_data(**kwargs)
         context.update({
             'products': self.get_product_list(),
+            'catalog_version': get_event_bootstrap(self.object)['version'],
+            'catalog_poll_interval': getattr(settings, 'JULIANA_CATALOG_POLL_INTERVAL', 10),
             'countdown': settings.JULIANA_COUNTDOWN if hasattr(settings, 'JULIANA_COUNTDOWN') else 5,
             'androidapp': self.request.META.get('HTTP_X_REQUESTED_WITH') == 'net.inter_actief.juliananfc',
             'writeoff': self.object.organizer.writeoff_enabled,
@@ -64,49 +70,28 @@ class JulianaView(TenderRequiredMixin, DetailView):
         return context
 
     def get_product_list(self):
-        products = []
-
-        for sellingprice in self.object.pricegroup.sellingprice_set.all():
-            for product in sellingprice.productgroup.permanentproduct_set.all():
-                products.append({
-                    'id': product.pk,
-                    'name': product.name,
-                    'shortcut': product.shortcut.upper(),
-                    'text_color': product.text_color,
-                    'background_color': product.background_color,
-                    'price': int(sellingprice.price * 100),
-                    'position': product.position,
-                })
-
-        products.sort(key=lambda x: x['position'])
-
-        for product in self.object.temporaryproducts.all():
-            products.append({
-                'id': product.pk,
-                'name': product.name,
-                'shortcut': product.shortcut.upper(),
-                'text_color': product.text_color,
-                'background_color': product.background_color,
-                'price': int(product.price * 100),
-            })
-
-        return products
-
-
-class OrderListView(ManagerRequiredMixin, ListView):
+        return get_event_catalog(self.object).product_list()
+
+
+class OrderListView(ManagerRequiredMixin, ReplicaMixin, ConditionalGetMixin, ListView):
     template_name = 'billing/order_list.html'
     paginate_by = 20
+    stamp_relations = ('billing_summary',)
+
+    def get_stamp_queryset(self):
+        # The statistics cover all events of the organization, not only the listed ones
+        return Event.objects.filter(organizer=self.request.organization)
 
     def get_queryset(self):
         return Event.objects.filter(organizer=self.request.organization) \
+            .filter(Q(billing_summary__order_count__gt=0) | Q(billing_summary__writeoff_order_count__gt=0)) \
             .annotate(
-                order_count=Count('orders', distinct=True),
-                writeoff_order_count=Count('writeoff_orders', distinct=True),
-                visitors=Count('orders__authorization', distinct=True),
+                order_count=F('billing_summary__order_count'),
+                writeoff_order_count=F('billing_summary__writeoff_order_count'),
+                visitors=EventBillingSummary.visitors_expression(),
             ) \
-            .filter(Q(order_count__gt=0) | Q(writeoff_order_count__gt=0)) \
             .order_by('-starts_at') \
-            .select_related('pricegroup')
+            .select_related('pricegroup', 'billing_summary')
 
     def get_context_data(self, **kwargs):
         context = super(OrderListView, self).get_context_data(**kwargs)
@@ -115,21 +100,19 @@ class OrderListView(ManagerRequiredMixin, ListView):
             .annotate(year=ExtractYear('starts_at')) \
             .values('year') \
             .order_by('-year') \
-            .annotate(revenue=Sum('orders__amount'))[:3]
+            .annotate(revenue=Sum('billing_summary__revenue'))[:3]
         return context
 
 
-class OrderDetailView(ManagerRequiredMixin, DenyWrongOrganizationMixin, DetailView):
+class OrderDetailView(ManagerRequiredMixin, DenyWrongOrganizationMixin, ReplicaMixin, DetailView):
     model = Event
     template_name = 'billing/order_detail.html'
     organization_field = 'organizer'
 
     def get_context_data(self, **kwargs):
-        products = Purchase.objects.filter(order__event=self.object) \
-            .values('product') \
-            .annotate(amount=Sum('amount'), price=Sum('price'))
+        summary = EventBillingSummary.get_for_event(self.object)
 
-        writeoff_exists = self.object.writeoff_orders.exists
+        writeoff_exists = summary.writeoff_order_count > 0
 
         grouped_writeoff_products = None
         writeoff_orders = None
@@ -141,8 +124,8 @@ class OrderDetailView(ManagerRequiredMixin, DenyWrongOrganizationMixin, DetailVi
         context.update({
             'orders': self.object.orders.select_related('authorization__user').order_by('-placed_at'),
             'writeoff_orders': writeoff_orders,
-            'products': products,
-            'revenue': products.aggregate(Sum('price'))['price__sum'],
+            'products': summary.product_list(),
+            'revenue': summary.revenue,
             'writeoff_exists': writeoff_exists,
             'grouped_writeoff_data': grouped_writeoff_products
         })
@@ -183,7 +166,7 @@ class WriteOffExportView(ManagerRequiredMixin, DenyWrongOrganizationMixin, View)
         return JsonResponse(grouped_writeoff_products)
 
 
-class OrderExportView(ManagerRequiredMixin, FormView):
+class OrderExportView(ManagerRequiredMixin, ReplicaMixin, FormView):
     template_name = 'billing/order_export_form.html'
     form_class = FilterEventForm
 
@@ -194,13 +177,13 @@ class OrderExportView(ManagerRequiredMixin, FormView):
             starts_at__lte=form.cleaned_data['till_time'],
         )
         events = event_list \
-            .annotate(order_count=Count('orders'), revenue=Sum('orders__amount')) \
-            .filter(order_count__gt=0) \
+            .filter(billing_summary__order_count__gt=0) \
+            .annotate(order_count=F('billing_summary__order_count'), revenue=F('billing_summary__revenue')) \
             .order_by('starts_at')
         summary = event_list \
             .annotate(month=TruncMonth('starts_at')) \
             .values('month') \
-            .annotate(revenue=Sum('orders__amount')) \
+            .annotate(revenue=Sum('billing_summary__revenue')) \
             .order_by('month')
         return render(self.request, 'billing/order_export_result.html', locals())
 
@@ -220,8 +203,12 @@ class PaymentDetailView(LoginRequiredMixin, DetailView):
         return obj
 
 
-class OrderYearView(ManagerRequiredMixin, TemplateView):
+class OrderYearView(ManagerRequiredMixin, ReplicaMixin, ConditionalGetMixin, TemplateView):
     template_name = 'billing/order_year.html'
+    stamp_relations = ('billing_summary',)
+
+    def get_stamp_queryset(self):
+        return Event.objects.filter(organizer=self.request.organization, starts_at__year=self.kwargs['year'])
 
     def get_context_data(self, **kwargs):
         context = super(OrderYearView, self).get_context_data(**kwargs)
@@ -231,13 +218,21 @@ class OrderYearView(ManagerRequiredMixin, TemplateView):
         ).annotate(
             date=TruncMonth('starts_at'),
         ).values('date').annotate(
-            revenue=Sum('orders__amount'),
+            revenue=Sum('billing_summary__revenue'),
         ).order_by('date')
         return context
 
 
-class OrderMonthView(ManagerRequiredMixin, TemplateView):
+class OrderMonthView(ManagerRequiredMixin, ReplicaMixin, ConditionalGetMixin, TemplateView):
     template_name = 'billing/order_month.html'
+    stamp_relations = ('billing_summary',)
+
+    def get_stamp_queryset(self):
+        return Event.objects.filter(
+            organizer=self.request.organization,
+            starts_at__year=self.kwargs['year'],
+            starts_at__month=self.kwargs['month'],
+        )
 
     def get_context_data(self, **kwargs):
         if int(kwargs['month']) not in range(1, 13):
@@ -248,7 +243,7 @@ class OrderMonthView(ManagerRequiredMixin, TemplateView):
             organizer=self.request.organization,
             starts_at__year=kwargs['year'],
             starts_at__month=kwargs['month'],
-        ).annotate(revenue=Sum('orders__amount')).order_by('starts_at')
+        ).annotate(revenue=F('billing_summary__revenue')).order_by('starts_at')
         context['month_name'] = MONTHS[int(kwargs['month'])]
         return context
 
@@ -280,7 +275,10 @@ class PriceGroupDeleteView(ManagerRequiredMixin, OrganizationFilterMixin, Delete
         self.object = self.get_object()
         form = self.get_form()
         if form.is_valid():
-            Event.objects.filter(pricegroup=self.object).update(pricegroup=form.cleaned_data['new_pricegroup'])
+            Event.objects.filter(pricegroup=self.object).update(
+                pricegroup=form.cleaned_data['new_pricegroup'],
+                updated_at=timezone.now(),
+            )
             success_url = self.get_success_url()
             self.object.delete()
             return HttpResponseRedirect(success_url)
@@ -0,0 +1,198 @@
+"""
+Push delivery of new orders and writeoff orders to the webhook of their organization.
+
+Events are taken from the WebhookDelivery outbox and sent in batches per organization as a JSON POST request:
+
+    {"events": [{"id": 12, "type": "order.created", "created_at": "...", "data": {...}}, ...]}
+
+Requests are signed with the secret of the organization. The X-Alexia-Signature header contains the hex HMAC-SHA256
+of the X-Alexia-Timestamp header value, a dot and the request body. A 2xx response acknowledges all events of the
+request; orders in acknowledged events are marked as synchronized. Failed events are retried with exponential
+backoff.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import time
+from datetime import timedelta
+from itertools import groupby
+
+import requests
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from alexia.apps.billing.formats import format_order_values
+from alexia.apps.billing.models import (
+    ChangeLogEntry, Order, WebhookDelivery, WriteOffOrder, WriteOffPurchase,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def sign(secret, timestamp, body):
+    """
+    Return the signature of a webhook request.
+    :param secret: Webhook secret of the organization.
+    :param timestamp: Unix timestamp sent in the X-Alexia-Timestamp header.
+    :param body: Request body as bytes.
+    """
+    return hmac.new(secret.encode('utf-8'), b'%d.' % timestamp + body, hashlib.sha256).hexdigest()
+
+
+def format_writeoff_orders(orders):
+    """
+    Format writeoff orders, with one query for the orders and one for all of their purchases.
+    """
+    rows = list(orders.values('id', 'event_id', 'event__name', 'writeoff_category_id', 'writeoff_category__name',
+                              'placed_at', 'amount'))
+
+    purchases = {}
+    for p in WriteOffPurchase.objects.filter(order_id__in=[row['id'] for row in rows]).order_by('pk') \
+            .values('order_id', 'product', 'amount', 'price'):
+        purchases.setdefault(p['order_id'], []).append({
+            'product': {
+                'id': -1,
+                'name': p['product'],
+            },
+            'amount': p['amount'],
+            'price': p['price'],
+        })
+
+    return [{
+        'id': row['id'],
+        'event': {
+            'id': row['event_id'],
+            'name': row['event__name'],
+        },
+        'category': {
+            'id': row['writeoff_category_id'],
+            'name': row['writeoff_category__name'],
+        },
+        'placed_at': row['placed_at'].isoformat(),
+        'amount': row['amount'],
+        'purchases': purchases.get(row['id'], []),
+    } for row in rows]
+
+
+class WebhookWorker(object):
+    def __init__(self, batch_size=None, timeout=None, session=None):
+        self.batch_size = batch_size or getattr(settings, 'WEBHOOK_BATCH_SIZE', 100)
+        self.timeout = timeout or getattr(settings, 'WEBHOOK_TIMEOUT', 10)
+        self.retry_delay = getattr(settings, 'WEBHOOK_RETRY_DELAY', 30)
+        self.max_retry_delay = getattr(settings, 'WEBHOOK_MAX_RETRY_DELAY', 3600)
+        self.session = session or requests.Session()
+
+    def get_retry_delay(self, attempts):
+        """
+        Return the number of seconds to wait before the next attempt, doubling with every failed attempt.
+        """
+        return min(self.retry_delay * 2 ** (attempts - 1), self.max_retry_delay)
+
+    def claim(self):
+        """
+        Claim due deliveries, so concurrent workers do not send them as well.
+
+        Claimed deliveries are not due again until the request timeout has passed twice.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            deliveries = list(WebhookDelivery.objects.select_for_update(skip_locked=True)
+                              .filter(delivered_at__isnull=True, next_attempt_at__lte=now)
+                              .select_related('organization')
+                              .order_by('organization_id', 'pk')[:self.batch_size])
+            WebhookDelivery.objects.filter(pk__in=[d.pk for d in deliveries]) \
+                .update(next_attempt_at=now + timedelta(seconds=2 * self.timeout))
+        return deliveries
+
+    def run_once(self):
+        """
+        Send one batch of due deliveries.
+        :return: (delivered, failed) tuple with the number of delivered and failed events.
+        """
+        delivered = failed = 0
+        for organization_id, deliveries in groupby(self.claim(), key=lambda d: d.organization_id):
+            deliveries = list(deliveries)
+            if self.deliver(deliveries[0].organization, deliveries):
+                delivered += len(deliveries)
+            else:
+                failed += len(deliveries)
+        return delivered, failed
+
+    def get_payloads(self, deliveries):
+        """
+        Return the data of the objects of the given deliveries, as dict delivery id -> data.
+
+        Objects that no longer exist are left out.
+        """
+        ids = {event_type: [d.object_id for d in deliveries if d.event_type == event_type]
+               for event_type, _name in WebhookDelivery.EVENT_TYPE_CHOICES}
+        orders = Order.objects.filter(pk__in=ids[WebhookDelivery.ORDER_CREATED])
+        writeoff_orders = WriteOffOrder.objects.filter(pk__in=ids[WebhookDelivery.WRITEOFF_CREATED])
+        data = {
+            WebhookDelivery.ORDER_CREATED: {o['id']: o for o in format_order_values(orders)},
+            WebhookDelivery.WRITEOFF_CREATED: {o['id']: o for o in format_writeoff_orders(writeoff_orders)},
+        }
+        return {d.pk: data[d.event_type][d.object_id] for d in deliveries if d.object_id in data[d.event_type]}
+
+    def deliver(self, organization, deliveries):
+        """
+        Send the given deliveries of an organization in one request.
+        :return: Whether the receiver acknowledged the deliveries.
+        """
+        payloads = self.get_payloads(deliveries)
+        events = [{
+            'id': d.pk,
+            'type': d.event_type,
+            'created_at': d.created_at.isoformat(),
+            'data': payloads[d.pk],
+        } for d in deliveries if d.pk in payloads]
+
+        error = None
+        if not organization.webhook_url:
+            error = 'No webhook URL configured'
+        elif events:
+            body = json.dumps({'events': events}, cls=DjangoJSONEncoder).encode('utf-8')
+            timestamp = int(time.time())
+            headers = {
+                'Content-Type': 'application/json',
+                'X-Alexia-Timestamp': str(timestamp),
+                'X-Alexia-Signature': sign(organization.webhook_secret or '', timestamp, body),
+            }
+            try:
+                response = self.session.post(organization.webhook_url, data=body, headers=headers,
+                                             timeout=self.timeout)
+                if not 200 <= response.status_code < 300:
+                    error = 'HTTP status %d' % response.status_code
+            except requests.RequestException as e:
+                error = str(e)
+
+        if error is None:
+            self.acknowledge(organization, deliveries)
+            return True
+        else:
+            logger.warning('Webhook delivery to %s failed: %s', organization, error)
+            self.retry(deliveries, error)
+            return False
+
+    def acknowledge(self, organization, deliveries):
+        now = timezone.now()
+        order_ids = [d.object_id for d in deliveries if d.event_type == WebhookDelivery.ORDER_CREATED]
+        with transaction.atomic():
+            WebhookDelivery.objects.filter(pk__in=[d.pk for d in deliveries]) \
+                .update(delivered_at=now, last_error='')
+            ids = list(Order.objects.select_for_update()
+                       .filter(pk__in=order_ids, synchronized=False)
+                       .values_list('pk', flat=True))
+            Order.objects.filter(pk__in=ids).update(synchronized=True, updated_at=now)
+            ChangeLogEntry.log(ChangeLogEntry.ORDER, ChangeLogEntry.SAVED, ids, [organization.pk])
+
+    def retry(self, deliveries, error):
+        now = timezone.now()
+        for delivery in deliveries:
+            delivery.attempts += 1
+            delivery.next_attempt_at = now + timedelta(seconds=self.get_retry_delay(delivery.attempts))
+            delivery.last_error = error
+        WebhookDelivery.objects.bulk_update(deliveries, ['attempts', 'next_attempt_at', 'last_error'])
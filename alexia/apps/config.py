@@ -6,6 +6,9 @@ class BillingConfig(AppConfig):
     name = 'alexia.apps.billing'
     verbose_name = _('Billing')
 
+    def ready(self):
+        from alexia.apps.billing import catalog, resolver  # NOQA
+
 
 class ConsumptionConfig(AppConfig):
     name = 'alexia.apps.consumption'
@@ -21,6 +24,9 @@ class OrganizationConfig(AppConfig):
     name = 'alexia.apps.organization'
     verbose_name = _('Organization')
 
+    def ready(self):
+        from alexia.apps.organization import cache  # NOQA
+
 
 class ProfileConfig(AppConfig):
     name = 'alexia.apps.profile'
@@ -30,3 +36,6 @@ class ProfileConfig(AppConfig):
 class SchedulingConfig(AppConfig):
     name = 'alexia.apps.scheduling'
     verbose_name = _('Scheduling')
+
+    def ready(self):
+        from alexia.apps.scheduling import cache  # NOQA
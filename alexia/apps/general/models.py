@@ -23,6 +23,29 @@ class Auditlog(models.Model):
         ordering = ["-timestamp"]
 
 
+class CacheVersion(models.Model):
+    """
+    Current version of a cache namespace, shared by all workers. See alexia.core.cache.
+    """
+    namespace = models.CharField(max_length=191, primary_key=True)
+    version = models.BigIntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return "%s: %s" % (self.namespace, self.version)
+
+
+class Counter(models.Model):
+    """
+    Counter shared by all workers, like the API metrics. See alexia.core.counters.
+    """
+    name = models.CharField(max_length=191, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return "%s: %s" % (self.name, self.value)
+
+
 def log(user, action, extra=None, obj=None, date_of=None):
     if user is not None and not user.is_authenticated:
         user = None
@@ -123,7 +123,7 @@ class ChangeCurrentOrganizationView(LoginRequiredMixin, RedirectView):
         if organization.is_active or self.request.user.profile.is_foundation_manager or self.request.user.is_superuser:
             self.request.session['organization_pk'] = organization.pk
             self.request.user.profile.current_organization = organization
-            self.request.user.profile.save()
+            self.request.user.profile.save(update_fields=['current_organization'])
             return self.request.POST.get(REDIRECT_FIELD_NAME, self.request.GET.get(REDIRECT_FIELD_NAME, ''))
         else:
             raise PermissionDenied(_("This organization is inactive."))
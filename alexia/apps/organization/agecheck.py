@@ -0,0 +1,193 @@
+"""
+Client for the age check APIs of organizations.
+
+Checks are sent over a pooled HTTP session with strict timeouts. Results are cached per RFID identifier for a short
+time and a per-organization circuit breaker stops calling an endpoint that keeps failing, so a slow or broken age
+check API cannot stall the point of sale.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+
+class CircuitBreaker(object):
+    """
+    Circuit breaker for a single endpoint.
+
+    After `threshold` consecutive failures the circuit opens and all calls are refused for `reset_timeout` seconds.
+    After that a single trial call is let through; the circuit closes again when that call succeeds.
+    """
+
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if not self._trial and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._trial = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+                self._trial = False
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+
+class AgeCheckClient(object):
+    def __init__(self, connect_timeout=None, read_timeout=None, failure_threshold=None, reset_timeout=None,
+                 cache_ttl=None, cache_size=None, max_workers=None):
+        self.timeout = (
+            connect_timeout or getattr(settings, 'AGE_CHECK_CONNECT_TIMEOUT', 0.5),
+            read_timeout or getattr(settings, 'AGE_CHECK_READ_TIMEOUT', 1.5),
+        )
+        self.failure_threshold = failure_threshold or getattr(settings, 'AGE_CHECK_FAILURE_THRESHOLD', 3)
+        self.reset_timeout = reset_timeout or getattr(settings, 'AGE_CHECK_RESET_TIMEOUT', 30)
+        self.cache_ttl = cache_ttl or getattr(settings, 'AGE_CHECK_CACHE_TTL', 60)
+        self.cache_size = cache_size or getattr(settings, 'AGE_CHECK_CACHE_SIZE', 1000)
+        self.max_workers = max_workers or getattr(settings, 'AGE_CHECK_MAX_WORKERS', 4)
+
+        self._session = None
+        self._executor = None
+        self._breakers = {}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        with self._lock:
+            if self._session is None:
+                self._session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=8, pool_maxsize=self.max_workers * 4)
+                self._session.mount('http://', adapter)
+                self._session.mount('https://', adapter)
+            return self._session
+
+    def _breaker(self, organization):
+        with self._lock:
+            breaker = self._breakers.get(organization.pk)
+            if breaker is None:
+                breaker = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+                self._breakers[organization.pk] = breaker
+            return breaker
+
+    def _cache_key(self, organization, rfid_code):
+        # The endpoint is part of the key, so changing it invalidates earlier results.
+        return organization.pk, organization.age_check_api_endpoint, rfid_code
+
+    def _get_cached(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            expires_at, result = entry
+            if expires_at <= time.monotonic():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return result
+
+    def _set_cached(self, key, result):
+        with self._lock:
+            self._cache[key] = (time.monotonic() + self.cache_ttl, result)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def check(self, organization, rfid_code: str) -> Optional[bool]:
+        """
+        Send an age check request for the given RFID code to the API endpoint of the organization.
+
+        :param organization: Organization with age checking enabled.
+        :param rfid_code: The RFID code to check.
+        :return: The age check result or None if the endpoint did not return a valid result in time.
+        """
+        key = self._cache_key(organization, rfid_code)
+        result = self._get_cached(key)
+        if result is not None:
+            return result
+
+        breaker = self._breaker(organization)
+        if not breaker.allow():
+            return None
+
+        try:
+            res = self.session.post(
+                organization.age_check_api_endpoint,
+                json={'apiKey': organization.age_check_api_key, 'rfid': rfid_code},
+                timeout=self.timeout,
+            )
+            if res.status_code == 200:
+                result = res.json()
+                if 'check_ok' in result and isinstance(result['check_ok'], bool):
+                    breaker.success()
+                    self._set_cached(key, result['check_ok'])
+                    return result['check_ok']
+        except (requests.exceptions.RequestException, ValueError):
+            pass
+
+        breaker.failure()
+        return None
+
+    def prefetch(self, organization, rfid_code: str) -> Future:
+        """
+        Start an age check in the background, so it can overlap with other work of the request.
+
+        :param organization: Organization with age checking enabled.
+        :param rfid_code: The RFID code to check.
+        :return: Future with the result of check().
+        """
+        key = self._cache_key(organization, rfid_code)
+        result = self._get_cached(key)
+        if result is not None:
+            future = Future()
+            future.set_result(result)
+            return future
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='agecheck')
+            executor = self._executor
+        return executor.submit(self.check, organization, rfid_code)
+
+    def wait(self, future: Future) -> Optional[bool]:
+        """
+        Return the result of a prefetched age check, or None if it does not complete in time.
+        """
+        try:
+            return future.result(timeout=sum(self.timeout))
+        except Exception:
+            return None
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._breakers.clear()
+
+
+age_check_client = AgeCheckClient()
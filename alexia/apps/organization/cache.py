@@ -0,0 +1,75 @@
+"""
+Cached organizations and memberships, used to resolve the current organization, render the organization switcher and
+check the roles of users on every request.
+
+Saving or deleting an organization bumps the organization version, saving or deleting a membership the membership
+version, which invalidates the cached data of all processes. The time to live bounds the staleness of changes that
+bypass the model signals, like QuerySet.update().
+"""
+import copy
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from alexia.core import cache
+from alexia.core.cache import bump_version, get_versions, versioned_key
+
+from .models import Membership, Organization
+
+NAMESPACE = 'organization'
+MEMBERSHIP_NAMESPACE = 'membership'
+
+
+def _get_ttl():
+    return getattr(settings, 'ORGANIZATION_CACHE_TTL', 300)
+
+
+def get_version():
+    """
+    Return the current version of the organizations, to vary template fragments on.
+    """
+    return get_versions(NAMESPACE)[0]
+
+
+def get_organization(pk):
+    """
+    Return the organization with the given primary key.
+
+    Every call returns a copy, so changes to it do not leak into other requests.
+    :raises Organization.DoesNotExist: If the organization does not exist.
+    """
+    key = versioned_key('organization:%d' % pk, NAMESPACE)
+    return copy.copy(cache.get_or_set(key, lambda: Organization.objects.get(pk=pk), _get_ttl()))
+
+
+def get_organizations():
+    """
+    Return all organizations, including inactive ones.
+    """
+    key = versioned_key('organization:list', NAMESPACE)
+    return cache.get_or_set(key, lambda: list(Organization.objects.all()), _get_ttl())
+
+
+def get_roles(user_id):
+    """
+    Return the memberships of a user, as dict organization pk -> dict with the membership flags.
+    """
+    def load():
+        return {
+            m['organization_id']: m for m in Membership.objects.filter(user=user_id).values(
+                'organization_id', 'is_tender', 'is_planner', 'is_manager', 'is_active')
+        }
+
+    key = versioned_key('organization:roles:%d' % user_id, NAMESPACE, MEMBERSHIP_NAMESPACE)
+    return cache.get_or_set(key, load, _get_ttl())
+
+
+@receiver([post_save, post_delete], sender=Organization, dispatch_uid='organization_cache_organization')
+def organization_changed(sender, instance, **kwargs):
+    bump_version(NAMESPACE)
+
+
+@receiver([post_save, post_delete], sender=Membership, dispatch_uid='organization_cache_membership')
+def membership_changed(sender, instance, **kwargs):
+    bump_version(MEMBERSHIP_NAMESPACE)
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organization', '0027_organization_card_registration_url'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='organization',
+            name='webhook_secret',
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name='webhook secret'),
+        ),
+        migrations.AddField(
+            model_name='organization',
+            name='webhook_url',
+            field=models.URLField(blank=True, help_text='New orders and writeoff orders are sent to this URL.', null=True, verbose_name='webhook URL'),
+        ),
+    ]
@@ -1,7 +1,6 @@
 import os
 from typing import Optional
 
-import requests
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import models
@@ -12,6 +11,7 @@ from django.utils.text import slugify
 from django.utils.translation import gettext_lazy as _
 
 from alexia.apps.organization import managers
+from alexia.apps.organization.agecheck import age_check_client
 from alexia.apps.scheduling.models import Availability, BartenderAvailability
 from alexia.core.validators import validate_color
 
@@ -88,20 +88,39 @@ class Profile(models.Model):
     def __str__(self):
         return str(self.user)
 
-    def is_manager(self, organization):
+    def get_roles(self):
+        """
+        Returns the memberships of the user, as dict organization pk -> dict with the membership flags.
+
+        The memberships are served from the shared cache and memoized on the user object, which lives as long as the
+        request.
+        """
+        from alexia.apps.organization.cache import get_roles
+        if '_roles' not in self.user.__dict__:
+            self.user.__dict__['_roles'] = get_roles(self.user.pk)
+        return self.user.__dict__['_roles']
+
+    def has_role(self, organization, role):
+        """
+        Returns if the user has the given role in the organization.
+        :param organization: Organization or organization pk.
+        :param role: One of 'is_tender', 'is_planner' and 'is_manager'.
+        """
         if self.user.is_superuser:
             return True
-        return self.user.membership_set.filter(organization=organization, is_manager=True).exists()
+        if organization is None:
+            return False
+        membership = self.get_roles().get(getattr(organization, 'pk', organization))
+        return bool(membership and membership[role])
+
+    def is_manager(self, organization):
+        return self.has_role(organization, 'is_manager')
 
     def is_planner(self, organization):
-        if self.user.is_superuser:
-            return True
-        return self.user.membership_set.filter(organization=organization, is_planner=True).exists()
+        return self.has_role(organization, 'is_planner')
 
     def is_tender(self, organization):
-        if self.user.is_superuser:
-            return True
-        return self.user.membership_set.filter(organization=organization, is_tender=True).exists()
+        return self.has_role(organization, 'is_tender')
 
     def has_iva(self):
         try:
@@ -135,6 +154,13 @@ class Organization(models.Model):
     age_check_api_endpoint = models.URLField(_('age check API endpoint'), blank=True, null=True)
     age_check_api_key = models.CharField(_('age check API key'), max_length=64, blank=True, null=True)
     card_registration_url = models.URLField(_('card registration URL'), blank=True, null=True)
+    webhook_url = models.URLField(
+        _('webhook URL'),
+        blank=True,
+        null=True,
+        help_text=_('New orders and writeoff orders are sent to this URL.'),
+    )
+    webhook_secret = models.CharField(_('webhook secret'), max_length=64, blank=True, null=True)
 
     members = models.ManyToManyField(
         settings.AUTH_USER_MODEL,
@@ -156,6 +182,8 @@ class Organization(models.Model):
             raise ValidationError(
                 _('You must specify an API endpoint and an API key if you enable the age check functionality.')
             )
+        if self.webhook_url and not self.webhook_secret:
+            raise ValidationError(_('You must specify a secret to sign the webhook requests with.'))
 
     def save(self, *args, **kwargs):
         self.slug = slugify(self.__str__())
@@ -172,18 +200,7 @@ class Organization(models.Model):
         :return: The age check result.
         """
         if self.age_check_enabled:
-            try:
-                res = requests.post(
-                    self.age_check_api_endpoint,
-                    json={'apiKey': self.age_check_api_key, 'rfid': rfid_code}
-                )
-                if res.status_code == 200:
-                    result = res.json()
-                    if 'check_ok' in result and isinstance(result['check_ok'], bool):
-                        return result['check_ok']
-            except requests.exceptions.RequestException:
-                pass
-            return None
+            return age_check_client.check(self, rfid_code)
         else:
             # If age checking is not enabled, always returns True as if the check was successful.
             return True
@@ -217,6 +234,20 @@ class Membership(models.Model):
             'organization': self.organization,
         }
 
+    def save(self, *args, **kwargs):
+        super(Membership, self).save(*args, **kwargs)
+        self._clear_roles()
+
+    def delete(self, *args, **kwargs):
+        result = super(Membership, self).delete(*args, **kwargs)
+        self._clear_roles()
+        return result
+
+    def _clear_roles(self):
+        # Forget the memoized roles of the user, if the user object was loaded through this membership
+        if Membership.user.is_cached(self):
+            self.user.__dict__.pop('_roles', None)
+
     def get_absolute_url(self):
         return reverse('membership', args=[self.pk])
 
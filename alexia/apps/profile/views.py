@@ -26,8 +26,8 @@ class ProfileView(LoginRequiredMixin, TemplateView):
     def get_context_data(self, **kwargs):
         context = super(ProfileView, self).get_context_data(**kwargs)
         context.update({
-            'events': Event.objects.filter(orders__authorization__in=self.request.user.authorizations.all())
-                                   .annotate(spent=Sum('orders__amount'))
+            'events': Event.objects.filter(user_spends__user=self.request.user)
+                                   .annotate(spent=Sum('user_spends__amount'))
                                    .order_by('-ends_at'),
             'order_count': Order.objects.select_related('event')
                                         .filter(authorization__in=self.request.user.authorizations.all())
@@ -110,8 +110,8 @@ class ExpenditureListView(LoginRequiredMixin, ListView):
     paginate_by = 25
 
     def get_queryset(self):
-        return Event.objects.filter(orders__authorization__in=self.request.user.authorizations.all()) \
-                            .annotate(spent=Sum('orders__amount')) \
+        return Event.objects.filter(user_spends__user=self.request.user) \
+                            .annotate(spent=Sum('user_spends__amount')) \
                             .order_by('-ends_at')
 
 
@@ -0,0 +1,24 @@
+"""
+Versions of the data that the event list shows with its events.
+
+The modification stamps of the events and their bartender availabilities do not cover the locations and participants
+of the events, or the names, organizations and IVA status of their bartenders. Changes to those models bump a
+namespace version, and the versions are part of the ETag of the event list.
+"""
+from django.contrib.auth.models import User
+
+from alexia.apps.organization.models import Certificate, Location, Membership, Profile
+from alexia.apps.scheduling.models import Availability, Event
+from alexia.core.cache import get_versions, model_namespace, watch_model
+
+EVENT_LIST_MODELS = (Event, Location, Availability, User, Profile, Membership, Certificate)
+
+for model in EVENT_LIST_MODELS:
+    watch_model(model)
+
+
+def get_event_list_versions():
+    """
+    Return the versions of the models shown with the events in the event list.
+    """
+    return get_versions(*[model_namespace(model) for model in EVENT_LIST_MODELS])
@@ -2,7 +2,7 @@ from datetime import timedelta
 
 from django.conf import settings
 from django.db import models
-from django.db.models import Q, Sum
+from django.db.models import Q
 from django.db.models.signals import pre_save
 from django.urls import reverse
 from django.utils import timezone
@@ -96,6 +96,7 @@ class Event(models.Model):
             'Designates that this event should be marked as risky.'
         ),
     )
+    updated_at = models.DateTimeField(_('updated at'), auto_now=True)
 
     class Meta:
         ordering = ['-starts_at']
@@ -136,21 +137,32 @@ class Event(models.Model):
                 availability__nature=Availability.ASSIGNED)
         return [x.user for x in self.bartender_availabilities_assigned]
 
+    @property
+    def opens_at(self):
+        """ First moment the event can be opened in the point of sale. """
+        return self.starts_at - timedelta(hours=5)
+
     def can_be_opened(self, user=None):
         if user and user.is_superuser:
             return True
 
-        return (self.starts_at - timedelta(hours=5)) <= timezone.now() <= \
+        return self.opens_at <= timezone.now() <= \
                (self.ends_at + timedelta(hours=24))
 
     def is_tender(self, user):
         """
         Returns if the given person is a tender for this event.
         """
-        if user.is_superuser or user.profile.is_foundation_manager:
+        if user.is_superuser:
             return True
 
-        return user in self.get_assigned_bartenders()
+        if hasattr(self, 'bartender_availabilities_assigned'):
+            # Result cached by earlier call or prefetch
+            is_assigned = user in self.get_assigned_bartenders()
+        else:
+            is_assigned = self.bartender_availabilities.filter(
+                user=user, availability__nature=Availability.ASSIGNED).exists()
+        return is_assigned or user.profile.is_foundation_manager
 
     def meets_iva_requirement(self):
         yes = 0
@@ -175,10 +187,12 @@ class Event(models.Model):
         return self.kegs > 0
 
     def visitors(self):
-        return self.orders.values('authorization').distinct().count()
+        from alexia.apps.billing.models import EventBillingSummary
+        return EventBillingSummary.get_for_event(self).visitors
 
     def revenue(self):
-        return self.orders.values('amount').aggregate(Sum('amount'))['amount__sum'] or 0
+        from alexia.apps.billing.models import EventBillingSummary
+        return EventBillingSummary.get_for_event(self).revenue
 
 
 pre_save.connect(notify_tenders, Event)
@@ -244,6 +258,7 @@ class BartenderAvailability(models.Model):
         on_delete=models.CASCADE,
     )
     comment = models.TextField(_('comment'), blank=True, default='', max_length=100)
+    updated_at = models.DateTimeField(_('updated at'), auto_now=True)
 
     class Meta:
         verbose_name = _('bartender availability')
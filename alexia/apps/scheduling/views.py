@@ -22,39 +22,25 @@ from alexia.auth.mixins import (
     TenderRequiredMixin, TenderOrManagerRequiredMixin,
 )
 from alexia.forms import CrispyFormMixin
-from alexia.http import IcalResponse
+from alexia.http import IcalResponse, conditional_page, get_scope_stamps
 from alexia.utils import log
 from alexia.utils.calendar import generate_ical
 from alexia.views import (
-    CreateViewForEvent, CreateViewForOrganization, OrganizationFilterMixin,
-    OrganizationFormMixin,
+    ConditionalGetMixin, CreateViewForEvent, CreateViewForOrganization,
+    OrganizationFilterMixin, OrganizationFormMixin,
 )
 
+from .cache import get_event_list_versions
 from .forms import EventForm, FilterEventForm
 from .models import Availability, BartenderAvailability, Event, MailTemplate
 from ...utils.request import is_ajax
 
 
-def event_list_view(request):
-    # De lijst waarop we nog gaan filteren
-    events = Event.objects.select_related().prefetch_related('participants', 'location').order_by('starts_at')
-    events = events.prefetch_related(
-        Prefetch(
-            'bartender_availabilities',
-            queryset=BartenderAvailability.objects.filter(availability__nature=Availability.ASSIGNED),
-            to_attr='bartender_availabilities_assigned',
-        ),
-        'bartender_availabilities_assigned__user',
-        Prefetch(
-            'bartender_availabilities',
-            queryset=BartenderAvailability.objects.filter(
-                Q(availability__nature=Availability.ASSIGNED),
-                Q(user__profile__is_iva=True) | Q(user__certificate__approved_at__isnull=False),
-            ),
-            to_attr='bartender_availabilities_iva',
-        ),
-    )
-
+def _filter_event_list(request, events):
+    """
+    Filter the events of the event list with the filter form in the request.
+    :return: Tuple (filtered events, filter form).
+    """
     # Default from_time is now.
     from_time = django_timezone.now()
     end_time = None
@@ -91,7 +77,35 @@ def event_list_view(request):
         events = events.filter(starts_at__lte=end_time)
 
     # Dubbele resultaten weghalen
-    events = events.distinct()
+    return events.distinct(), filter_form
+
+
+def _event_list_stamps(request):
+    events, filter_form = _filter_event_list(request, Event.objects.all())
+    return get_scope_stamps(events, relations=('bartender_availabilities',)) + [get_event_list_versions()]
+
+
+@conditional_page(_event_list_stamps)
+def event_list_view(request):
+    # De lijst waarop we nog gaan filteren
+    events = Event.objects.select_related().prefetch_related('participants', 'location').order_by('starts_at')
+    events = events.prefetch_related(
+        Prefetch(
+            'bartender_availabilities',
+            queryset=BartenderAvailability.objects.filter(availability__nature=Availability.ASSIGNED),
+            to_attr='bartender_availabilities_assigned',
+        ),
+        'bartender_availabilities_assigned__user',
+        Prefetch(
+            'bartender_availabilities',
+            queryset=BartenderAvailability.objects.filter(
+                Q(availability__nature=Availability.ASSIGNED),
+                Q(user__profile__is_iva=True) | Q(user__certificate__approved_at__isnull=False),
+            ),
+            to_attr='bartender_availabilities_iva',
+        ),
+    )
+    events, filter_form = _filter_event_list(request, events)
 
     if request.user.is_authenticated:
         events_tending = events.filter(
@@ -132,20 +146,29 @@ class EventCalendarView(TemplateView):
     template_name = 'scheduling/event_calendar.html'
 
 
-class EventCalendarFetch(View):
-    def get(self, request, *args, **kwargs):
-        start = request.GET.get('start', None)
-        end = request.GET.get('end', None)
+class EventCalendarFetch(ConditionalGetMixin, View):
+    def get_events(self):
+        start = self.request.GET.get('start', None)
+        end = self.request.GET.get('end', None)
 
-        if not (start and end) or not is_ajax(request):
+        if not (start and end) or not is_ajax(self.request):
             raise SuspiciousOperation('Bad calendar fetch request')
 
         from_time = datetime.fromtimestamp(float(start), tz=timezone.utc)
         till_time = datetime.fromtimestamp(float(end), tz=timezone.utc)
+        return Event.objects.filter(ends_at__gte=from_time, starts_at__lte=till_time)
+
+    stamp_relations = ('bartender_availabilities',)
 
+    def get_stamp_queryset(self):
+        return self.get_events()
+
+    def get_stamps(self):
+        return super(EventCalendarFetch, self).get_stamps() + [get_event_list_versions()]
+
+    def get(self, request, *args, **kwargs):
         data = []
-        for event in Event.objects.filter(ends_at__gte=from_time,
-                                          starts_at__lte=till_time).prefetch_related('location'):
+        for event in self.get_events().prefetch_related('location'):
             color = '#888888'
             try:
                 location = event.location.get()
@@ -402,17 +425,39 @@ def set_bartender_availability(request):
         return HttpResponse("NOTOK")
 
 
+def _ical_events():
+    return Event.objects.filter(starts_at__gte=django_timezone.now() - timedelta(100))
+
+
+def _personal_ical_availabilities(ical_id):
+    return BartenderAvailability.objects.filter(
+        user__profile__ical_id=ical_id,
+        availability__nature=Availability.ASSIGNED,
+        event__starts_at__gte=django_timezone.now() - timedelta(100)
+    )
+
+
+def _ical_stamps(request):
+    return get_scope_stamps(_ical_events(), relations=('bartender_availabilities',)) + [get_event_list_versions()]
+
+
+def _personal_ical_stamps(request, ical_id):
+    # Unknown calendars are not found, rather than answered with an ETag
+    get_object_or_404(Profile, ical_id=ical_id)
+    return get_scope_stamps(_personal_ical_availabilities(ical_id),
+                            relations=('event', 'event__bartender_availabilities')) + [get_event_list_versions()]
+
+
+@conditional_page(_ical_stamps)
 def ical(request):
-    events = Event.objects.filter(starts_at__gte=django_timezone.now() - timedelta(100)).order_by('starts_at')
+    events = _ical_events().order_by('starts_at')
     return IcalResponse(generate_ical(events))
 
 
+@conditional_page(_personal_ical_stamps)
 def personal_ical(request, ical_id):
     profile = get_object_or_404(Profile, ical_id=ical_id)
-    bas = profile.user.bartender_availability_set.filter(
-        availability__nature=Availability.ASSIGNED,
-        event__starts_at__gte=django_timezone.now() - timedelta(100)
-    ). order_by('event__starts_at')
+    bas = _personal_ical_availabilities(ical_id).select_related('event').order_by('event__starts_at')
     events = []
     for ba in bas:
         events.append(ba.event)
@@ -2,6 +2,7 @@ import logging
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend as DjangoModelBackend
 from django.urls import reverse
 from django.utils.http import urlencode
 
@@ -37,6 +38,16 @@ def get_or_create_user(backend, username):
         return user, True
 
 
+class ModelBackend(DjangoModelBackend):
+    def get_user(self, user_id):
+        # Load the profile together with the user, as every request needs it
+        try:
+            user = User._default_manager.select_related('profile').get(pk=user_id)
+        except User.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
+
+
 class IAOIDCAuthenticationBackend(OIDCAuthenticationBackend):
     def __init__(self, *args, **kwargs):
         self.log = logging.getLogger(self.__class__.__name__)
@@ -100,6 +111,13 @@ class IAOIDCAuthenticationBackend(OIDCAuthenticationBackend):
         self.log.info(f"User login failed, no username found to match against.")
         return self.UserModel.objects.none()
 
+    def get_user(self, user_id):
+        # Load the profile together with the user, as every request needs it
+        try:
+            return self.UserModel.objects.select_related('profile').get(pk=user_id)
+        except self.UserModel.DoesNotExist:
+            return None
+
 
 def get_oidc_logout_url(request):
     # After logout, we need to redirect to the OIDC Single Sign Out
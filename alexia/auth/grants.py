@@ -0,0 +1,60 @@
+"""
+This module contains the opt-in per-session tender grants for the point of sale.
+
+When JULIANA_SESSION_GRANTS is enabled, a session that passed the tender check for an event keeps access to that
+event until its opening window ends, so repeated point of sale calls from the same kiosk skip the check.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+SESSION_KEY = 'tender_grants'
+REQUEST_MEMO = '_tender_events'
+
+
+def _grants_enabled():
+    return getattr(settings, 'JULIANA_SESSION_GRANTS', False)
+
+
+def has_tender_grant(request, event):
+    """
+    Returns if the session of the request holds a valid tender grant for the given event.
+    """
+    if not _grants_enabled() or not hasattr(request, 'session'):
+        return False
+
+    grant = request.session.get(SESSION_KEY, {}).get(str(event.pk))
+    return grant is not None and grant[0] == request.user.pk and grant[1] > timezone.now().timestamp()
+
+
+def add_tender_grant(request, event):
+    """
+    Grant the session of the request tender access to the given event until its opening window ends.
+    """
+    if not _grants_enabled() or not hasattr(request, 'session'):
+        return
+
+    now = timezone.now().timestamp()
+    grants = {k: v for k, v in request.session.get(SESSION_KEY, {}).items() if v[1] > now}
+    grants[str(event.pk)] = [request.user.pk, (event.ends_at + timedelta(hours=24)).timestamp()]
+    request.session[SESSION_KEY] = grants
+
+
+def is_tender_for_request(request, event):
+    """
+    Returns if the user of the request is a tender for the given event, using and adding session grants if enabled.
+
+    The result is memoized on the request, so the check does not outlive the request.
+    """
+    memo = request.__dict__.setdefault(REQUEST_MEMO, {})
+    if event.pk not in memo:
+        if has_tender_grant(request, event):
+            memo[event.pk] = True
+        elif event.is_tender(request.user):
+            add_tender_grant(request, event)
+            memo[event.pk] = True
+        else:
+            memo[event.pk] = False
+    return memo[event.pk]
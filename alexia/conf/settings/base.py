@@ -6,14 +6,24 @@ BASE_DIR = os.path.normpath(os.path.join(os.path.abspath(__file__), '..', '..',
 
 # Auth
 AUTHENTICATION_BACKENDS = [
-    'django.contrib.auth.backends.ModelBackend',
+    'alexia.auth.backends.ModelBackend',
     'alexia.auth.backends.IAOIDCAuthenticationBackend',  # Logins via OIDC / auth.ia
+    'django.contrib.auth.backends.ModelBackend',  # Keeps sessions that were created before our ModelBackend
 ]
 AUTH_USER_MODEL = 'auth.User'
 LOGIN_REDIRECT_URL = '/login_complete/'
 LOGIN_URL = '/oidc/authenticate/'
 LOGOUT_REDIRECT_URL = '/'
 
+# Caching
+# The shared tier of alexia.core.cache. The versions in the CacheVersion table keep the workers consistent with a cache
+# per process as well; configure Redis or Memcached to share cached values between workers.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
 # Crispy forms
 CRISPY_TEMPLATE_PACK = 'bootstrap3'
 
@@ -49,6 +59,7 @@ MIDDLEWARE = [
     'debug_toolbar.middleware.DebugToolbarMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'alexia.middleware.replica.ReplicaPinMiddleware',
     'django.middleware.locale.LocaleMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -150,6 +161,10 @@ COMPRESS_CSS_FILTERS = [
 # See https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
 
+# Reports can read from a replica of the database, configured as DATABASES[DATABASE_REPLICA_ALIAS]
+DATABASE_ROUTERS = ['alexia.core.routers.ReplicaRouter']
+DATABASE_REPLICA_ALIAS = None
+
 # ModernRPC API
 MODERNRPC_METHODS_MODULES = [
     'alexia.api.v1.methods'
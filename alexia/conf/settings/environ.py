@@ -35,6 +35,18 @@ DATABASE_OPTIONS = env.json('DATABASE_OPTIONS', default={})
 if DATABASE_OPTIONS:
     DATABASES['default']['OPTIONS'] = DATABASE_OPTIONS
 
+# Optional read replica, used for reports
+if env('DATABASE_REPLICA_URL', default=None):
+    DATABASES['replica'] = env.db_url('DATABASE_REPLICA_URL')
+    if DATABASE_OPTIONS:
+        DATABASES['replica']['OPTIONS'] = DATABASE_OPTIONS
+    DATABASE_REPLICA_ALIAS = 'replica'
+
+# Shared cache of all workers, like redis://host:6379/0 or a Memcached URL. Defaults to a cache per process.
+CACHES = {
+    'default': env.cache_url('DJANGO_CACHE_URL', default='locmemcache://'),
+}
+
 # Make sure these are set correctly in production
 ENV                   = env('DJANGO_ENVIRONMENT', default='PRODUCTION')
 DEBUG                 = env.bool('DJANGO_DEBUG', default=False)
@@ -188,7 +200,9 @@ if DJANGO_SENTRY_DSN:
 # Django authentication backends
 # Login settings -- only allow login using specified backends
 AUTHENTICATION_BACKENDS = env.list("DJANGO_AUTHENTICATION_BACKENDS", default=[
-    "django.contrib.auth.backends.ModelBackend", "alexia.auth.backends.IAOIDCAuthenticationBackend"
+    "alexia.auth.backends.ModelBackend", "alexia.auth.backends.IAOIDCAuthenticationBackend",
+    # Keeps sessions that were created before our ModelBackend
+    "django.contrib.auth.backends.ModelBackend",
 ])
 
 # OIDC Single sign-on configuration
@@ -19,3 +19,6 @@ SECRET_KEY = env('DJANGO_SECRET_KEY', default='zBCMvM1BwLtlkoXf1mbgCo3W60j2UgIPh
 
 # Disable secure redirects to allow testing without SSL
 SECURE_SSL_REDIRECT = False
+
+# Tests read the counter totals directly, which also writes the pending counts
+COUNTER_FLUSH_IN_BACKGROUND = False
@@ -19,6 +19,8 @@ urlpatterns = [
     path('dcf/<int:pk>/', dcf, name='dcf'),
     path('dcf/<int:pk>/check/', complete_dcf, name='dcf-complete'),
     path('juliana/<int:pk>/', JulianaView.as_view(), name='juliana'),
+    path('juliana/sw.js', TemplateView.as_view(template_name='billing/juliana-sw.js',
+                                               content_type='application/javascript'), name='juliana-sw'),
 
     # Apps
     path('billing/', include('alexia.apps.billing.urls')),
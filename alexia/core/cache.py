@@ -0,0 +1,260 @@
+"""
+Two tier cache with versioned invalidation across workers.
+
+Values are kept in a thread safe LRU cache in every process (the local tier), backed by the Django cache
+CACHE_SHARED_ALIAS that all workers use (the shared tier). Lookups try the local tier first, then the shared tier.
+
+Keys are built with versioned_key() from the versions of the namespaces a value depends on, so bumping a namespace,
+usually from a model signal like those of watch_model(), invalidates every value that depends on it. Versions are
+stored in the CacheVersion table and changed in the same transaction as the change that invalidates them, so other
+workers only build new keys once that change is committed. Within the process, a version bumped in a transaction is
+only used by the thread of that transaction until it commits. Every process keeps the versions it read for
+CACHE_VERSION_TTL seconds, which bounds how long other workers keep serving their local copies after a change.
+
+Values returned from the cache are shared between the threads of a process and must not be modified.
+
+Hit and miss counts are kept per key prefix, the part of the key before the first colon. When CACHE_STATS_ENABLED is
+set, they are added to the shared counters of alexia.core.counters and exported together with the API metrics.
+"""
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from alexia.apps.general.models import CacheVersion
+from alexia.core.counters import CounterGroup
+from alexia.core.routers import use_primary
+
+_MISSING = object()
+
+STATS_FIELDS = ('local_hits', 'shared_hits', 'misses', 'bumps')
+
+IGNORED_UPDATE_FIELDS = frozenset(['last_login', 'current_organization'])
+""" Fields that are not part of any cached value, like the login time that is saved on every login. """
+
+_local = threading.local()
+
+
+def _shared():
+    return caches[getattr(settings, 'CACHE_SHARED_ALIAS', 'default')]
+
+
+class LocalCache(object):
+    """
+    Thread safe LRU cache with a time to live per entry.
+    """
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size or getattr(settings, 'CACHE_LOCAL_SIZE', 1000)
+        self._entries = OrderedDict()
+        """ Dict key -> (expires_at, value) """
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if entry[0] <= now:
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class CacheStats(object):
+    def __init__(self, prefix='cache:'):
+        self.counters = CounterGroup(prefix)
+
+    def record(self, key, field):
+        if not getattr(settings, 'CACHE_STATS_ENABLED', False):
+            return
+        prefix = key.split(':', 1)[0]
+        self.counters.add({'%s:%s' % (prefix, field): 1})
+
+    def totals(self):
+        """
+        Return the counts of all processes, as dict prefix -> dict field -> count.
+        """
+        totals = {}
+        for name, count in self.counters.totals().items():
+            prefix, field = name.rsplit(':', 1)
+            if field in STATS_FIELDS:
+                totals.setdefault(prefix, dict.fromkeys(STATS_FIELDS, 0))[field] = count
+        return dict(sorted(totals.items()))
+
+    def reset(self):
+        self.counters.reset()
+
+
+_values = LocalCache()
+_versions = LocalCache()
+stats = CacheStats()
+
+
+def get(key, default=None):
+    """
+    Return the value cached under the given key, or default if there is none.
+    """
+    value = _values.get(key, _MISSING)
+    if value is not _MISSING:
+        stats.record(key, 'local_hits')
+        return value
+
+    value = _shared().get(key, _MISSING)
+    if value is not _MISSING:
+        stats.record(key, 'shared_hits')
+        _values.set(key, value, getattr(settings, 'CACHE_LOCAL_TTL', 60))
+        return value
+
+    stats.record(key, 'misses')
+    return default
+
+
+def set(key, value, timeout=300):
+    """
+    Cache a value in both tiers.
+    :param timeout: Number of seconds the value is cached, the local tier keeps it at most CACHE_LOCAL_TTL seconds.
+    """
+    _shared().set(key, value, timeout)
+    _values.set(key, value, min(timeout, getattr(settings, 'CACHE_LOCAL_TTL', 60)))
+
+
+def get_or_set(key, default, timeout=300):
+    """
+    Return the value cached under the given key, calling default to build and cache it if there is none.
+    """
+    value = get(key, _MISSING)
+    if value is _MISSING:
+        value = default()
+        set(key, value, timeout)
+    return value
+
+
+def _get_bumped():
+    """
+    Return the versions bumped in the open transaction of this thread, as dict namespace -> version.
+
+    A bumped version is published to the other threads by a commit hook. It stays in use in this thread for as long
+    as the connection still has that hook, so versions of a rolled back transaction or savepoint are dropped.
+    """
+    bumped = getattr(_local, 'bumped', None)
+    if not bumped:
+        return {}
+    hooks = {id(func) for sids, func, robust in transaction.get_connection().run_on_commit}
+    _local.bumped = {namespace: entry for namespace, entry in bumped.items() if id(entry[1]) in hooks}
+    return {namespace: version for namespace, (version, hook) in _local.bumped.items()}
+
+
+def get_versions(*namespaces):
+    """
+    Return the current version number of each given namespace, in order.
+
+    Namespaces that were never bumped have version 0. All versions that are not known in this process are read in
+    one query.
+    """
+    bumped = _get_bumped()
+    versions = {namespace: bumped.get(namespace, _versions.get(namespace)) for namespace in namespaces}
+    unknown = [namespace for namespace, version in versions.items() if version is None]
+    if unknown:
+        # Versions are read from the primary database, a replica may lag behind
+        with use_primary():
+            versions.update(CacheVersion.objects.filter(namespace__in=unknown).values_list('namespace', 'version'))
+        for namespace in unknown:
+            versions[namespace] = versions[namespace] or 0
+            _versions.set(namespace, versions[namespace], getattr(settings, 'CACHE_VERSION_TTL', 1))
+    return [versions[namespace] for namespace in namespaces]
+
+
+def bump_version(namespace):
+    """
+    Invalidate everything cached under the given namespace by changing its version number.
+
+    The new version is random, so a version of a rolled back transaction is never used again. Other threads only
+    use the new version once the current transaction commits, so they cannot cache values that are about to change
+    under it.
+    """
+    version = random.getrandbits(62)
+    if not CacheVersion.objects.filter(namespace=namespace).update(version=version):
+        try:
+            with transaction.atomic():
+                CacheVersion.objects.create(namespace=namespace, version=version)
+        except IntegrityError:
+            # Created by a concurrent bump
+            CacheVersion.objects.filter(namespace=namespace).update(version=version)
+    stats.record(namespace, 'bumps')
+
+    if not transaction.get_connection().in_atomic_block:
+        _versions.set(namespace, version, getattr(settings, 'CACHE_VERSION_TTL', 1))
+        return
+
+    def publish():
+        _versions.set(namespace, version, getattr(settings, 'CACHE_VERSION_TTL', 1))
+        bumped = getattr(_local, 'bumped', {})
+        if namespace in bumped and bumped[namespace][1] is publish:
+            del bumped[namespace]
+
+    _local.__dict__.setdefault('bumped', {})[namespace] = (version, publish)
+    transaction.on_commit(publish)
+
+
+def versioned_key(prefix, *namespaces):
+    """
+    Build a cache key that changes whenever one of the given namespaces is bumped.
+    """
+    versions = get_versions(*namespaces)
+    return '%s:%s' % (prefix, ':'.join(str(v) for v in versions))
+
+
+def clear():
+    """
+    Remove all values from both tiers and forget the versions known in this process.
+    """
+    _values.clear()
+    _versions.clear()
+    _local.bumped = {}
+    _shared().clear()
+
+
+def model_namespace(model):
+    return 'model:%s' % model._meta.label_lower
+
+
+def _model_changed(sender, update_fields=None, **kwargs):
+    if update_fields and update_fields <= IGNORED_UPDATE_FIELDS:
+        return
+    bump_version(model_namespace(sender))
+
+
+def _m2m_changed(sender, instance, action, model, **kwargs):
+    if action.startswith('post_'):
+        bump_version(model_namespace(type(instance)))
+        bump_version(model_namespace(model))
+
+
+def watch_model(model):
+    """
+    Bump the namespace of the given model whenever an instance or one of its many-to-many relations changes.
+    """
+    post_save.connect(_model_changed, model, dispatch_uid='cache-model-save-%s' % model._meta.label_lower)
+    post_delete.connect(_model_changed, model, dispatch_uid='cache-model-delete-%s' % model._meta.label_lower)
+    for field in model._meta.many_to_many:
+        through = field.remote_field.through
+        m2m_changed.connect(_m2m_changed, through, dispatch_uid='cache-model-m2m-%s' % through._meta.label_lower)
@@ -0,0 +1,126 @@
+"""
+Counters shared by all workers, like the API metrics.
+
+Counts are added in memory. A background thread of every process adds them to the Counter table every
+COUNTER_FLUSH_INTERVAL seconds, with an atomic update per counter, so counting never waits for the database and the
+counts of concurrent workers are never lost. Set COUNTER_FLUSH_IN_BACKGROUND to False to only write the counts when
+the totals are read, like the tests do.
+"""
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F
+
+from alexia.apps.general.models import Counter
+from alexia.core.routers import use_primary
+
+logger = logging.getLogger(__name__)
+
+_groups = []
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+
+
+class CounterGroup(object):
+    """
+    Counters of which the names start with the same prefix.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._pending = {}
+        """ Dict name -> value not yet added to the table """
+        self._lock = threading.Lock()
+        _groups.append(self)
+
+    def add(self, values):
+        """
+        Add the given values to the counters.
+        :param values: Dict counter name -> value.
+        """
+        with self._lock:
+            for name, value in values.items():
+                if value:
+                    self._pending[name] = self._pending.get(name, 0) + value
+        _start_flusher()
+
+    def flush(self):
+        """
+        Add the pending values of this process to the table.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        try:
+            _write({self.prefix + name: value for name, value in pending.items()})
+        except Exception:
+            # Keep the values for the next flush
+            with self._lock:
+                for name, value in pending.items():
+                    self._pending[name] = self._pending.get(name, 0) + value
+            raise
+
+    def totals(self):
+        """
+        Return the values of all processes, as dict counter name -> value.
+        """
+        self.flush()
+        with use_primary():
+            counters = Counter.objects.filter(name__startswith=self.prefix).values_list('name', 'value')
+            return {name[len(self.prefix):]: value for name, value in counters}
+
+    def reset(self):
+        with self._lock:
+            self._pending = {}
+        Counter.objects.filter(name__startswith=self.prefix).delete()
+
+
+def _write(values):
+    # Counters are updated in the same order by every worker, so concurrent flushes cannot deadlock
+    with transaction.atomic():
+        for name, value in sorted(values.items()):
+            if Counter.objects.filter(name=name).update(value=F('value') + value):
+                continue
+            try:
+                with transaction.atomic():
+                    Counter.objects.create(name=name, value=value)
+            except IntegrityError:
+                # Created by a concurrent flush
+                Counter.objects.filter(name=name).update(value=F('value') + value)
+
+
+def flush():
+    """
+    Add the pending values of all counters of this process to the table.
+    """
+    for group in _groups:
+        group.flush()
+
+
+def _run():
+    while True:
+        time.sleep(getattr(settings, 'COUNTER_FLUSH_INTERVAL', 5))
+        try:
+            flush()
+        except Exception:
+            logger.exception('Could not write the counters')
+        finally:
+            # The connections of this thread are not closed by the request handling
+            connections.close_all()
+
+
+def _start_flusher():
+    global _flusher_pid
+    if _flusher_pid == os.getpid() or not getattr(settings, 'COUNTER_FLUSH_IN_BACKGROUND', True):
+        return
+    with _flusher_lock:
+        # Threads do not survive a fork, so every worker process starts its own
+        if _flusher_pid != os.getpid():
+            _flusher_pid = os.getpid()
+            threading.Thread(target=_run, name='alexia-counters', daemon=True).start()
@@ -0,0 +1,82 @@
+"""
+Routing of reads to an optional read replica of the database.
+
+Set DATABASE_REPLICA_ALIAS to a database alias in DATABASES to enable the replica. Code that only reads, like reports,
+opts in with use_replica(); everything else keeps using the primary database. Writes always go to the primary.
+
+To let users read their own writes, the ReplicaPinMiddleware pins a session to the primary database for
+DATABASE_REPLICA_PIN_SECONDS after a request of that session wrote to the database.
+"""
+import threading
+from contextlib import ContextDecorator
+
+from django.conf import settings
+from django.db import connections
+
+_state = threading.local()
+
+
+def get_replica_alias():
+    """
+    Return the alias of the replica database, or None if no replica is configured.
+    """
+    alias = getattr(settings, 'DATABASE_REPLICA_ALIAS', None)
+    return alias if alias and alias in connections else None
+
+
+class _DatabaseChoice(ContextDecorator):
+    def __init__(self, replica):
+        self.replica = replica
+
+    def __enter__(self):
+        _state.__dict__.setdefault('stack', []).append(self.replica)
+        return self
+
+    def __exit__(self, *exc):
+        _state.stack.pop()
+        return False
+
+
+def use_replica():
+    """
+    Context manager and decorator to read from the replica database, if one is configured.
+    """
+    return _DatabaseChoice(True)
+
+
+def use_primary():
+    """
+    Context manager and decorator to read from the primary database, also within use_replica().
+    """
+    return _DatabaseChoice(False)
+
+
+def pin_to_primary(pinned=True):
+    """
+    Read from the primary database in the current thread, even within use_replica().
+    """
+    _state.pinned = pinned
+
+
+def is_pinned():
+    return getattr(_state, 'pinned', False)
+
+
+class ReplicaRouter(object):
+    def db_for_read(self, model, **hints):
+        stack = getattr(_state, 'stack', None)
+        if not stack or not stack[-1] or is_pinned():
+            return None
+        return get_replica_alias()
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica contains the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == get_replica_alias():
+            return False
+        return None
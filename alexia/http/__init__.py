@@ -1,3 +1,4 @@
+from .conditional import conditional_page, get_scope_stamps
 from .response import IcalResponse
 
-__all__ = ['IcalResponse']
+__all__ = ['IcalResponse', 'conditional_page', 'get_scope_stamps']
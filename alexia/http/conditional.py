@@ -0,0 +1,108 @@
+"""
+Conditional GET for read heavy pages and feeds.
+
+Views compute an ETag from the modification stamps of their query scope, without rendering: the number of rows and
+their latest updated_at value, for the scope and the related rows shown with it, read in one aggregate query. Deleted
+rows change the number of rows, changed rows the latest stamp. The ETag also covers the parts of a page that depend on
+the request, like the user, the current organization and the language. A client that already has the page with the
+same ETag gets a 304 Not Modified response.
+
+Changes that bypass Model.save(), like QuerySet.update(), must set updated_at themselves.
+"""
+import hashlib
+import os
+from functools import lru_cache, wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.db.models import Count, Max
+from django.utils.cache import patch_cache_control
+from django.utils.translation import get_language
+from django.views.decorators.http import condition
+
+from alexia.apps.organization.cache import get_version as get_organizations_version
+
+
+def get_scope_stamps(queryset, relations=()):
+    """
+    Return the number of rows and the latest modification stamp of a queryset and its related rows, in one query.
+    :param queryset: Queryset of a model with an updated_at field.
+    :param relations: Lookup paths of related models with an updated_at field, that are shown with the rows.
+    """
+    aggregates = {'count': Count('pk', distinct=True), 'updated_at': Max('updated_at')}
+    for relation in relations:
+        aggregates['%s_count' % relation] = Count(relation, distinct=True)
+        aggregates['%s_updated_at' % relation] = Max('%s__updated_at' % relation)
+    return sorted(queryset.order_by().aggregate(**aggregates).items())
+
+
+@lru_cache(maxsize=None)
+def get_release_stamp():
+    """
+    Return the latest modification time of the code and templates, so a deployment changes all ETags.
+    """
+    directories = [os.path.dirname(os.path.dirname(os.path.abspath(__file__)))]
+    for template_settings in settings.TEMPLATES:
+        directories.extend(str(directory) for directory in template_settings.get('DIRS', []))
+
+    stamp = 0
+    for directory in directories:
+        for root, _dirs, files in os.walk(directory):
+            for name in files:
+                if name.endswith(('.py', '.html', '.txt', '.ics', '.json')):
+                    stamp = max(stamp, os.path.getmtime(os.path.join(root, name)))
+    return stamp
+
+
+def get_request_stamps(request):
+    """
+    Return the parts of a page that depend on the request rather than on the data of the page.
+    """
+    stamps = [
+        get_release_stamp(),
+        request.get_full_path(),
+        get_language(),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME),
+        get_organizations_version(),
+    ]
+    user = request.user
+    if user.is_authenticated:
+        organization = request.organization
+        stamps += [
+            user.pk,
+            user.is_superuser,
+            user.profile.is_foundation_manager,
+            organization.pk if organization else None,
+            sorted(user.profile.get_roles().get(organization.pk, {}).items()) if organization else None,
+        ]
+    return stamps
+
+
+def conditional_page(stamps_func):
+    """
+    Decorator for views to answer GET requests with 304 Not Modified if the page did not change.
+
+    :param stamps_func: Function called with the arguments of the view, returning the stamps of the data of the page,
+                        usually from get_scope_stamps(). May return None to skip the check.
+    """
+    def get_etag(request, *args, **kwargs):
+        # Pending messages are shown once, so the page must be rendered
+        if request.method not in ('GET', 'HEAD') or len(get_messages(request)):
+            return None
+        stamps = stamps_func(request, *args, **kwargs)
+        if stamps is None:
+            return None
+        return hashlib.sha1(repr([get_request_stamps(request), stamps]).encode('utf-8')).hexdigest()
+
+    def decorator(view):
+        conditional_view = condition(etag_func=get_etag)(view)
+
+        @wraps(view)
+        def wrap(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if response.has_header('ETag'):
+                # Pages differ per user, and browsers should check whether they changed on every visit
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrap
+    return decorator
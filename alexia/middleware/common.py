@@ -1,4 +1,5 @@
-from alexia.apps.organization.models import Organization, Profile
+from alexia.apps.organization.cache import get_organization
+from alexia.apps.organization.models import Profile
 
 
 class CommonMiddleware(object):
@@ -17,4 +18,4 @@ class CommonMiddleware(object):
     def get_current_organization(self, request):
         request.organization = None
         if 'organization_pk' in request.session:
-            request.organization = Organization.objects.get(pk=request.session['organization_pk'])
+            request.organization = get_organization(request.session['organization_pk'])
@@ -0,0 +1,50 @@
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from alexia.core.routers import get_replica_alias, pin_to_primary
+
+SESSION_KEY = 'replica_pinned_until'
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+class ReplicaPinMiddleware(object):
+    """
+    Read from the primary database for a while after a session wrote to it, so users always see their own changes.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Writes to sessions and database caches are not reads a user expects to see
+        self.ignored_tables = ['django_session'] + [
+            config['LOCATION'] for config in settings.CACHES.values()
+            if config['BACKEND'] == 'django.core.cache.backends.db.DatabaseCache'
+        ]
+
+    def __call__(self, request):
+        if get_replica_alias() is None:
+            return self.get_response(request)
+
+        pin_to_primary(request.session.get(SESSION_KEY, 0) > time.time())
+        wrote = False
+
+        def detect_writes(execute, sql, params, many, context):
+            nonlocal wrote
+            if sql.lstrip()[:7].upper().startswith(WRITE_STATEMENTS) and \
+                    not any(table in sql for table in self.ignored_tables):
+                wrote = True
+                # Later reads of this request must see the write as well
+                pin_to_primary()
+            return execute(sql, params, many, context)
+
+        try:
+            with connections[DEFAULT_DB_ALIAS].execute_wrapper(detect_writes):
+                response = self.get_response(request)
+        finally:
+            pin_to_primary(False)
+
+        if wrote:
+            request.session[SESSION_KEY] = time.time() + getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 10)
+        return response
@@ -1,9 +1,12 @@
-from alexia.apps.organization.models import Membership, Organization
+from django.utils.functional import SimpleLazyObject
+
+from alexia.apps.organization.cache import get_organizations, get_version
 
 
 def organization(request):
     return {
-        'organizations': Organization.objects.all(),
+        'organizations': SimpleLazyObject(get_organizations),
+        'organizations_version': SimpleLazyObject(get_version),
         'current_organization': request.organization,
     }
 
@@ -12,26 +15,20 @@ def permissions(request):
     if request.user.is_superuser:
         return {'is_tender': True, 'is_planner': True, 'is_manager': True, 'is_foundation_manager': True}
 
-    try:
-        if hasattr(request.user, "membership_set"):
-            membership = request.user.membership_set.get(organization=request.organization)
-            return {
-                'is_tender': membership.is_tender,
-                'is_planner': membership.is_planner,
-                'is_manager': membership.is_manager,
-                'is_foundation_manager': request.user.profile.is_foundation_manager,
-            }
-        else:
+    if request.user.is_authenticated and request.organization:
+        profile = request.user.profile
+        membership = profile.get_roles().get(request.organization.pk)
+        if membership:
             return {
-                'is_tender': False,
-                'is_planner': False,
-                'is_manager': False,
-                'is_foundation_manager': False,
+                'is_tender': membership['is_tender'],
+                'is_planner': membership['is_planner'],
+                'is_manager': membership['is_manager'],
+                'is_foundation_manager': profile.is_foundation_manager,
             }
-    except Membership.DoesNotExist:
-        return {
-            'is_tender': False,
-            'is_planner': False,
-            'is_manager': False,
-            'is_foundation_manager': False,
-        }
+
+    return {
+        'is_tender': False,
+        'is_planner': False,
+        'is_manager': False,
+        'is_foundation_manager': False,
+    }
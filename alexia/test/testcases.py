@@ -11,11 +11,14 @@ from alexia.apps.billing.models import (
     Authorization, Order, PermanentProduct, PriceGroup, ProductGroup, Purchase,
     TemporaryProduct,
 )
+from alexia.apps.billing.resolver import card_resolver
+from alexia.apps.organization.agecheck import age_check_client
 from alexia.apps.organization.models import (
     AuthenticationData, Location, Organization, Profile,
 )
 from alexia.apps.scheduling.models import Availability, Event
 from alexia.auth.backends import OIDC_BACKEND_NAME
+from alexia.core import cache
 
 
 class SimpleTestCase(testcases.SimpleTestCase):
@@ -48,6 +51,10 @@ class TransactionTestCase(SimpleTestCase, testcases.TransactionTestCase):
 class TestCase(TransactionTestCase, testcases.TestCase):
     def setUp(self):
         super(TestCase, self).setUp()
+        # Cached data is keyed by primary keys, which may be reused between tests.
+        cache.clear()
+        card_resolver.clear()
+        age_check_client.clear()
         self.data = dict()
 
         self.data['datetime1'] = timezone.make_aware(datetime.datetime(2014, 9, 21, 14, 16, 6), datetime.timezone.utc)
@@ -215,6 +222,25 @@ class APITestCase(TestCase):
         req_json = json.dumps(req)
         return self.client.post(path, req_json, content_type='text/plain; charset=UTF-8')
 
+    def send_batch_request(self, calls, atomic=False):
+        """
+        Send JSON RPC batch request.
+        :param calls: List of (method, params) tuples.
+        :param atomic: Run the whole batch in one transaction.
+        :return: Decoded responses.
+        """
+        path = reverse('jsonrpc_mountpoint')
+
+        req = [
+            {'jsonrpc': '2.0', 'id': i, 'method': method, 'params': params}
+            for i, (method, params) in enumerate(calls)
+        ]
+
+        headers = {'HTTP_X_ATOMIC_BATCH': '1'} if atomic else {}
+        response = self.client.post(path, json.dumps(req), content_type='application/json', **headers)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content.decode())
+
     def send_and_compare_request(self, method, params, expected_result):
         """
         Send JSON RPC method call and compare actual result with expected result.
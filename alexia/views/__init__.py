@@ -1,9 +1,10 @@
 from .mixins import (
-    CreateViewForEvent, CreateViewForOrganization, EventOrganizerFilterMixin,
-    FixedValueCreateView, OrganizationFilterMixin, OrganizationFormMixin,
+    ConditionalGetMixin, CreateViewForEvent, CreateViewForOrganization,
+    EventOrganizerFilterMixin, FixedValueCreateView, OrganizationFilterMixin,
+    OrganizationFormMixin, ReplicaMixin,
 )
 
 __all__ = [
-    'CreateViewForEvent', 'CreateViewForOrganization', 'EventOrganizerFilterMixin',
-    'FixedValueCreateView', 'OrganizationFilterMixin', 'OrganizationFormMixin',
+    'ConditionalGetMixin', 'CreateViewForEvent', 'CreateViewForOrganization', 'EventOrganizerFilterMixin',
+    'FixedValueCreateView', 'OrganizationFilterMixin', 'OrganizationFormMixin', 'ReplicaMixin',
 ]
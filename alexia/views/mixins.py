@@ -1,6 +1,9 @@
 from django.views.generic.detail import SingleObjectTemplateResponseMixin
 from django.views.generic.edit import ModelFormMixin, ProcessFormView
 
+from alexia.core.routers import use_replica
+from alexia.http import conditional_page, get_scope_stamps
+
 
 class OrganizationFilterMixin(object):
     """
@@ -22,6 +25,45 @@ class EventOrganizerFilterMixin(object):
         return super(EventOrganizerFilterMixin, self).get_queryset().filter(event__organizer=self.request.organization)
 
 
+class ReplicaMixin(object):
+    """
+    Mixin for views that only read data, to run their queries on the read replica if one is configured.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        with use_replica():
+            response = super(ReplicaMixin, self).dispatch(request, *args, **kwargs)
+            # Template responses evaluate their querysets while rendering
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+        return response
+
+
+class ConditionalGetMixin(object):
+    """
+    Mixin for views that only read data, to answer with 304 Not Modified if the page did not change.
+
+    Override get_stamp_queryset to return the rows shown on the page and set stamp_relations to the related rows shown
+    with them, see alexia.http.conditional. Without a queryset every request renders the page.
+    """
+    stamp_relations = ()
+
+    def get_stamp_queryset(self):
+        return None
+
+    def get_stamps(self):
+        queryset = self.get_stamp_queryset()
+        if queryset is None:
+            return None
+        return get_scope_stamps(queryset, relations=self.stamp_relations)
+
+    def dispatch(self, request, *args, **kwargs):
+        view = conditional_page(lambda request, *args, **kwargs: self.get_stamps())(
+            super(ConditionalGetMixin, self).dispatch
+        )
+        return view(request, *args, **kwargs)
+
+
 class BaseFixedValueCreateView(ModelFormMixin, ProcessFormView):
     """
     Base view for creating an new object instance with some default values.
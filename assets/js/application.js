@@ -108,6 +108,11 @@ $(function () {
         $('form#set-lang-' + code).submit();
     });
 
+    $('[data-change-organization]').click(function(event) {
+        event.preventDefault();
+        $('form#change-organization').attr('action', $(this).attr('href')).submit();
+    });
+
     $('[data-print]').click(function(event) {
         event.preventDefault();
         var id = $(this).data('print').substr(1);
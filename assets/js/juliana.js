@@ -284,12 +284,33 @@ Receipt = {
     pay: function (rfid) {
         State.toggleTo(State.PAYING);
 
+        if (!navigator.onLine) {
+            Receipt.queueOffline(rfid);
+            return;
+        }
+
         console.log('Card scanned. Retrieving userData for: ' + rfid);
         User.retrieveData(rfid, function (result) {
             Receipt.continuePay(result, rfid);
+        }, function () {
+            Receipt.queueOffline(rfid);
         });
 
     },
+    queueOffline: function (rfid) {
+        if (!OfflineQueue.db) {
+            State.toggleTo(State.ERROR, 'Geen verbinding met Alexia');
+            return;
+        }
+
+        OfflineQueue.add({
+            key: OfflineQueue.newKey(),
+            rfid: rfid,
+            purchases: JSON.parse(JSON.stringify(Receipt.receipt)),
+            placed_at: new Date().toISOString()
+        });
+        State.toggleTo(State.MESSAGE, 'Geen verbinding met Alexia. De bestelling is bewaard en wordt verstuurd zodra de verbinding hersteld is.');
+    },
     continuePay: function (userData, rfid) {
         console.log('continuePay was called: ');
 
@@ -325,7 +346,8 @@ Receipt = {
             event_id: Settings.event_id,
             user_id: userData.result.user.id,
             purchases: Receipt.receipt,
-            rfid_data: rfid
+            rfid_data: rfid,
+            key: OfflineQueue.newKey()
         };
 
         var countdown = Settings.countdown - 1;
@@ -351,6 +373,7 @@ Receipt = {
         Receipt.confirmPay(rpcRequest);
     },
     confirmPay: function (rpcRequest) {
+        var placedAt = new Date().toISOString();
         IAjax.request(rpcRequest, function (result) {
             if (result.error) {
                 var errorMsg = result.error;
@@ -367,6 +390,20 @@ Receipt = {
             } else {
                 State.toggleTo(State.SALES);
             }
+        }, function () {
+            // The order may have reached Alexia, the key makes sure it is not saved twice
+            if (!OfflineQueue.db) {
+                State.toggleTo(State.ERROR, 'Geen verbinding met Alexia');
+                return;
+            }
+            OfflineQueue.add({
+                key: rpcRequest.params.key,
+                user_id: rpcRequest.params.user_id,
+                rfid: rpcRequest.params.rfid_data,
+                purchases: JSON.parse(JSON.stringify(rpcRequest.params.purchases)),
+                placed_at: placedAt
+            });
+            State.toggleTo(State.MESSAGE, 'Geen verbinding met Alexia. De bestelling is bewaard en wordt verstuurd zodra de verbinding hersteld is.');
         });
     },
     cash: function () {
@@ -383,7 +420,8 @@ Receipt = {
             Receipt.payData = {
                 event_id: Settings.event_id,
                 writeoff_id: categoryId,
-                purchases: Receipt.receipt
+                purchases: Receipt.receipt,
+                key: OfflineQueue.newKey()
             };
 
             var countdown = Settings.countdown - 1;
@@ -478,7 +516,7 @@ Sales = {
 };
 
 User = {
-    retrieveData: function (rfid, callback) {
+    retrieveData: function (rfid, callback, failure) {
         console.log('RetrieveData called!');
         var data = {
             event_id: Settings.event_id,
@@ -508,7 +546,7 @@ User = {
 
                 callback(userData);
             }
-        });
+        }, failure);
     },
     check: function (rfid) {
         console.log('Card scanned. Retrieving userData for: ' + rfid);
@@ -531,8 +569,174 @@ User = {
     }
 };
 
+/*
+ * OFFLINE QUEUE - orders that could not be sent to Alexia, kept in IndexedDB until they can be sent
+ */
+OfflineQueue = {
+    db: null,
+    flushing: false,
+    batchSize: 50,
+    init: function () {
+        if (!window.indexedDB) {
+            console.log('IndexedDB is not supported, orders can not be queued while offline.');
+            return;
+        }
+
+        var request = indexedDB.open('juliana', 1);
+        request.onupgradeneeded = function (event) {
+            event.target.result.createObjectStore('orders', {keyPath: 'key'});
+        };
+        request.onsuccess = function (event) {
+            OfflineQueue.db = event.target.result;
+            OfflineQueue.flush();
+        };
+
+        window.addEventListener('online', function () {
+            OfflineQueue.flush();
+        });
+        setInterval(function () {
+            OfflineQueue.flush();
+        }, 30000);
+    },
+    newKey: function () {
+        if (window.crypto && crypto.randomUUID) {
+            return crypto.randomUUID();
+        }
+        return Date.now().toString(36) + '-' + Math.random().toString(36).substr(2, 16);
+    },
+    add: function (order) {
+        order.event_id = Settings.event_id;
+        this.db.transaction('orders', 'readwrite').objectStore('orders').put(order);
+        Log.log('Bestelling offline bewaard');
+    },
+    flush: function () {
+        if (!this.db || this.flushing || !navigator.onLine) return;
+
+        var request = this.db.transaction('orders').objectStore('orders').getAll();
+        request.onsuccess = function () {
+            // Orders of other events are sent when the page of that event is opened
+            var orders = request.result.filter(function (order) {
+                return order.event_id === Settings.event_id;
+            }).slice(0, OfflineQueue.batchSize);
+            if (!orders.length) return;
+
+            OfflineQueue.flushing = true;
+            console.log('Sending ' + orders.length + ' queued orders.');
+            jQuery.ajax({
+                data: JSON.stringify({
+                    jsonrpc: '2.0',
+                    method: 'juliana.order.save_batch',
+                    params: {event_id: Settings.event_id, orders: orders},
+                    id: 'batch'
+                }),
+                url: Settings.api_url,
+                dataType: 'json',
+                type: 'POST',
+                success: function (response) {
+                    OfflineQueue.flushing = false;
+                    if (response.error) {
+                        console.log('Sending queued orders failed: ' + response.error.message);
+                        return;
+                    }
+
+                    // Saved, duplicate and rejected orders are all done; a rejected order would be rejected again
+                    var store = OfflineQueue.db.transaction('orders', 'readwrite').objectStore('orders');
+                    response.result.forEach(function (result) {
+                        if (result.error) {
+                            Log.log('Offline bestelling geweigerd: ' + result.error.message);
+                        }
+                        store.delete(result.key);
+                    });
+                    if (orders.length === OfflineQueue.batchSize) {
+                        OfflineQueue.flush();
+                    }
+                },
+                error: function () {
+                    OfflineQueue.flushing = false;
+                    console.log('Sending queued orders failed, retrying later.');
+                }
+            });
+        };
+    }
+};
+
+/*
+ * Catalog - polls for changed products and prices
+ */
+Catalog = {
+    version: null,
+    reloadPending: false,
+
+    init: function () {
+        this.version = Settings.catalog_version;
+        setInterval(function () {
+            Catalog.poll();
+        }, Settings.catalog_poll_interval * 1000);
+    },
+    poll: function () {
+        if (this.reloadPending) {
+            this.reloadIfIdle();
+            return;
+        }
+        if (!navigator.onLine) return;
+
+        jQuery.ajax({
+            data: JSON.stringify({
+                jsonrpc: '2.0',
+                method: 'juliana.bootstrap',
+                params: {event_id: Settings.event_id, known_version: Catalog.version},
+                id: 'bootstrap'
+            }),
+            url: Settings.api_url,
+            dataType: 'json',
+            type: 'POST',
+            success: function (response) {
+                if (!response.error && !response.result.unchanged) {
+                    Catalog.update(response.result);
+                }
+            }
+        });
+    },
+    update: function (bootstrap) {
+        var products = {};
+        var shortcuts = {};
+        bootstrap.products.forEach(function (product) {
+            products[product.id] = {name: product.name, price: product.price};
+            if (product.shortcut) {
+                products[product.id].shortcut = product.shortcut;
+                shortcuts[product.shortcut] = product.id;
+            }
+        });
+
+        // Only prices can be updated in place, other changes need the page to be rendered again
+        var layout = function (products) {
+            return JSON.stringify(Object.keys(products).map(function (id) {
+                return [id, products[id].name, products[id].shortcut];
+            }));
+        };
+        if (layout(products) !== layout(Settings.products)
+                || bootstrap.writeoff !== Settings.writeoff
+                || bootstrap.writeoff_categories.length !== Object.keys(Settings.writeoffCategories).length) {
+            this.reloadPending = true;
+            this.reloadIfIdle();
+            return;
+        }
+
+        Settings.products = products;
+        Settings.shortcuts = shortcuts;
+        Settings.countdown = bootstrap.countdown;
+        this.version = bootstrap.version;
+        Log.log('Prijzen bijgewerkt');
+    },
+    reloadIfIdle: function () {
+        if (State.current === State.SALES && !Receipt.receipt.length) {
+            window.location.reload();
+        }
+    }
+};
+
 IAjax = {
-    request: function (data, callback) {
+    request: function (data, callback, failure) {
         console.log('IAjax sent: ' + JSON.stringify(data));
         var settings = {
             data: JSON.stringify(data),
@@ -547,6 +751,11 @@ IAjax = {
                 }
             },
             error: function (error) {
+                if (failure && error.status === 0) {
+                    console.log('IAjax request failed: no connection');
+                    failure(error);
+                    return;
+                }
                 var result = JSON.parse(error.responseText);
                 console.log('IAjax request failed');
                 State.toggleTo(State.ERROR, result.error.message);
@@ -558,6 +767,14 @@ IAjax = {
 
 $(function () {
     Scanner.init();
+    OfflineQueue.init();
+    Catalog.init();
+
+    if ('serviceWorker' in navigator) {
+        navigator.serviceWorker.register(Settings.service_worker_url).catch(function (error) {
+            console.log('Registering service worker failed: ' + error);
+        });
+    }
 
     State.toggleTo(State.SALES);
 
@@ -0,0 +1,34 @@
+/*
+ * Service worker for Juliana
+ * Keeps the point of sale page, which contains the product catalog, and its static files
+ * available while the connection with Alexia is lost.
+ */
+var CACHE_NAME = 'juliana-v1';
+
+self.addEventListener('install', function (event) {
+    self.skipWaiting();
+});
+
+self.addEventListener('activate', function (event) {
+    event.waitUntil(self.clients.claim());
+});
+
+self.addEventListener('fetch', function (event) {
+    var request = event.request;
+    if (request.method !== 'GET') return;
+
+    // Network first, so the catalog is always up to date while online
+    event.respondWith(
+        fetch(request).then(function (response) {
+            if (response.ok) {
+                var copy = response.clone();
+                caches.open(CACHE_NAME).then(function (cache) {
+                    cache.put(request, copy);
+                });
+            }
+            return response;
+        }).catch(function () {
+            return caches.match(request);
+        })
+    );
+});